@@ -1,13 +1,49 @@
-from django.contrib import admin
-from .models import Wallet, Transaction
+from django.contrib import admin, messages
+from .models import Wallet, Transaction, WalletReconciliation
+from .reconciliation import reconcile
 
 @admin.register(Wallet)
 class WalletAdmin(admin.ModelAdmin):
-    list_display = ('user', 'balance', 'updated_at')
+    list_display = ('user', 'balance', 'updated_at', 'needs_reconciliation')
     search_fields = ('user__username', 'user__email')
+    actions = ['reconcile_wallets']
+
+    @admin.action(description='Check selected wallets against their ledger')
+    def reconcile_wallets(self, request, queryset):
+        ids = list(queryset.values_list('id', flat=True))
+        Wallet.objects.filter(id__in=ids).update(needs_reconciliation=True)
+        checked, drifted = reconcile(wallet_ids=ids)
+        level = messages.WARNING if drifted else messages.SUCCESS
+        self.message_user(request, f'Checked {checked} wallets, {len(drifted)} drifting.', level)
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ('user', 'amount', 'transaction_type', 'created_at')
     list_filter = ('transaction_type', 'created_at')
     search_fields = ('user__username', 'description')
+
+class DriftFilter(admin.SimpleListFilter):
+    title = 'drift'
+    parameter_name = 'drift'
+
+    def lookups(self, request, model_admin):
+        return [('yes', 'Drifting'), ('no', 'Consistent')]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.exclude(drift=0)
+        if self.value() == 'no':
+            return queryset.filter(drift=0)
+        return queryset
+
+@admin.register(WalletReconciliation)
+class WalletReconciliationAdmin(admin.ModelAdmin):
+    list_display = ('wallet', 'drift', 'ledger_total', 'last_transaction_id', 'verified_at')
+    list_filter = (DriftFilter,)
+    list_select_related = ('wallet__user',)
+    search_fields = ('wallet__user__username',)
+    ordering = ('-verified_at',)
+    readonly_fields = ('wallet', 'drift', 'ledger_total', 'last_transaction_id', 'verified_at')
+
+    def has_add_permission(self, request):
+        return False
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 class BankConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bank'
+
+    def ready(self):
+        import bank.signals
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from bank.models import WalletReconciliation
+from bank.reconciliation import reconcile, reset, DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Checks wallets changed since their last check against their ledger entries and reports drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Wallets read per query.')
+        parser.add_argument('--full', action='store_true', help='Recheck every ledger from the beginning.')
+
+    def handle(self, *args, **options):
+        if options['full']:
+            reset()
+
+        checked, drifted = reconcile(chunk_size=options['chunk_size'])
+        for state in drifted:
+            self.stdout.write(self.style.WARNING(
+                f'Wallet {state.wallet_id}: balance is off by {state.drift} '
+                f'(ledger total {state.ledger_total} up to entry #{state.last_transaction_id})'
+            ))
+
+        total = WalletReconciliation.objects.exclude(drift=0).count()
+        style = self.style.WARNING if total else self.style.SUCCESS
+        self.stdout.write(style(f'Checked {checked} wallets, {len(drifted)} drifting now, {total} drifting in total.'))
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+CHECKPOINT_INTERVAL = 100
+
+
+def backfill_checkpoints(apps, schema_editor):
+    # Walk each ledger back from the current wallet balance, which is the
+    # balance right after the newest entry
+    Wallet = apps.get_model('bank', 'Wallet')
+    Transaction = apps.get_model('bank', 'Transaction')
+    BalanceCheckpoint = apps.get_model('bank', 'BalanceCheckpoint')
+    for wallet in Wallet.objects.iterator():
+        entries = list(Transaction.objects.filter(user_id=wallet.user_id).order_by('id').values_list('id', 'amount'))
+        balance = wallet.balance
+        after = {}
+        for transaction_id, amount in reversed(entries):
+            after[transaction_id] = balance
+            balance -= amount
+        checkpoints = [
+            BalanceCheckpoint(user_id=wallet.user_id, transaction_id=transaction_id, balance=after[transaction_id])
+            for position, (transaction_id, _) in enumerate(entries, start=1)
+            if position % CHECKPOINT_INTERVAL == 0
+        ]
+        BalanceCheckpoint.objects.bulk_create(checkpoints, batch_size=500)
+        Wallet.objects.filter(pk=wallet.pk).update(entries_since_checkpoint=len(entries) % CHECKPOINT_INTERVAL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='wallet',
+            name='entries_since_checkpoint',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='transaction_history_idx'),
+        ),
+        migrations.AddField(
+            model_name='balancecheckpoint',
+            name='transaction',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoint', to='bank.transaction'),
+        ),
+        migrations.AddField(
+            model_name='balancecheckpoint',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='balancecheckpoint',
+            index=models.Index(fields=['user', 'transaction'], name='checkpoint_user_idx'),
+        ),
+        migrations.RunPython(backfill_checkpoints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0002_balance_checkpoints'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletReconciliation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_transaction_id', models.PositiveBigIntegerField(default=0)),
+                ('ledger_total', models.BigIntegerField(default=0)),
+                ('drift', models.BigIntegerField(default=0)),
+                ('verified_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='wallet',
+            name='needs_reconciliation',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='wallet',
+            index=models.Index(condition=models.Q(('needs_reconciliation', True)), fields=['id'], name='wallet_unreconciled_idx'),
+        ),
+        migrations.AddField(
+            model_name='walletreconciliation',
+            name='wallet',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reconciliation', to='bank.wallet'),
+        ),
+    ]
@@ -8,10 +8,26 @@ class Wallet(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='wallet')
     balance = models.IntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
+    # Ledger entries written since the last BalanceCheckpoint
+    entries_since_checkpoint = models.PositiveIntegerField(default=0)
+    # Set by every balance change, cleared by bank.reconciliation
+    needs_reconciliation = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(needs_reconciliation=True), name='wallet_unreconciled_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s Wallet ({self.balance})"
 
+    def save(self, *args, **kwargs):
+        self.needs_reconciliation = True
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'needs_reconciliation'}
+        super().save(*args, **kwargs)
+
 class Transaction(models.Model):
     class TransactionType(models.TextChoices):
         DEPOSIT = 'DEPOSIT', _('Deposit')
@@ -24,5 +40,46 @@ class Transaction(models.Model):
     description = models.TextField(blank=True, null=True) # JSON or text
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # History pages: one user's entries, newest first
+            models.Index(fields=['user', 'created_at', 'id'], name='transaction_history_idx'),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type} - {self.amount} - {self.user.username}"
+
+class BalanceCheckpoint(models.Model):
+    """
+    Wallet balance right after one of the user's ledger entries. Written about
+    every BANK_CHECKPOINT_INTERVAL entries, so a running balance never needs
+    more than that many entries summed; see bank.services.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='balance_checkpoints')
+    transaction = models.OneToOneField(Transaction, on_delete=models.CASCADE, related_name='checkpoint')
+    balance = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'transaction'], name='checkpoint_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.balance} after #{self.transaction_id}"
+
+class WalletReconciliation(models.Model):
+    """
+    How far a wallet's ledger has been checked against its balance; see
+    bank.reconciliation. Only wallets updated after verified_at need another look.
+    """
+    wallet = models.OneToOneField(Wallet, on_delete=models.CASCADE, related_name='reconciliation')
+    # Newest ledger entry included in ledger_total
+    last_transaction_id = models.PositiveBigIntegerField(default=0)
+    ledger_total = models.BigIntegerField(default=0)
+    # Wallet balance minus ledger total at the last check; 0 means consistent
+    drift = models.BigIntegerField(default=0)
+    verified_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.wallet.user.username}: drift {self.drift}"
@@ -0,0 +1,55 @@
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class TransactionCursorPagination(BasePagination):
+    """
+    Keyset pagination for a user's ledger, newest first, on (created_at, id).
+
+    ?limit=N             -> newest N entries
+    ?before_id=X&limit=N -> N entries right before X (older)
+
+    Served by the (user, created_at, id) index, so a page costs the same
+    however long the history is.
+    """
+    default_limit = 50
+    max_limit = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        self.limit = self.get_limit(request)
+        before_id = self.get_int(params, 'before_id')
+
+        if before_id is not None:
+            created_at = queryset.filter(id=before_id).values_list('created_at', flat=True).first()
+            if created_at is None:
+                raise NotFound("Transaction not found")
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=before_id)
+            )
+        page = list(queryset.order_by('-created_at', '-id')[:self.limit + 1])
+        self.has_more = len(page) > self.limit
+        return page[:self.limit]
+
+    def get_paginated_response(self, data):
+        return Response({
+            "results": data,
+            "has_more": self.has_more,
+        })
+
+    def get_limit(self, request):
+        limit = self.get_int(request.query_params, 'limit')
+        if limit is None or limit < 1:
+            return self.default_limit
+        return min(limit, self.max_limit)
+
+    def get_int(self, params, name):
+        value = params.get(name)
+        if value is None or value == '':
+            return None
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValidationError({"error": f"{name} must be an integer"})
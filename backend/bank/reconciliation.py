@@ -0,0 +1,83 @@
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Wallet, Transaction, WalletReconciliation
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def reconcile(chunk_size=DEFAULT_CHUNK_SIZE, wallet_ids=None):
+    """
+    Checks that each wallet's balance equals the sum of its ledger entries,
+    looking only at wallets changed since their last check.
+
+    Wallets are read in chunks. Each check only sums the entries written
+    after the last verified one, on top of the stored running total, so a
+    run costs what changed rather than the whole ledger.
+
+    Returns (wallets checked, WalletReconciliation rows found drifting).
+    """
+    checked = 0
+    drifted = []
+    after_id = 0
+    while True:
+        rows = _snapshot(after_id, chunk_size, wallet_ids)
+        if not rows:
+            break
+        drifted.extend(_record(rows))
+        checked += len(rows)
+        after_id = rows[-1]['id']
+    return checked, drifted
+
+
+def _snapshot(after_id, chunk_size, wallet_ids):
+    # One statement per chunk, so balances and ledger sums agree with each other
+    new_entries = Transaction.objects.filter(
+        user_id=OuterRef('user_id'),
+        id__gt=Coalesce(OuterRef('reconciliation__last_transaction_id'), Value(0)),
+    ).order_by().values('user_id')
+    wallets = Wallet.objects.filter(needs_reconciliation=True, id__gt=after_id)
+    if wallet_ids is not None:
+        wallets = wallets.filter(id__in=wallet_ids)
+    return list(
+        wallets.annotate(
+            new_total=Coalesce(Subquery(new_entries.annotate(total=Sum('amount')).values('total')), Value(0)),
+            new_last_id=Subquery(new_entries.annotate(last=Max('id')).values('last')),
+        ).order_by('id').values(
+            'id', 'balance', 'updated_at', 'new_total', 'new_last_id',
+            last_transaction_id=F('reconciliation__last_transaction_id'),
+            ledger_total=F('reconciliation__ledger_total'),
+        )[:chunk_size]
+    )
+
+
+def _record(rows):
+    existing = WalletReconciliation.objects.in_bulk([row['id'] for row in rows], field_name='wallet_id')
+    created, updated, drifted = [], [], []
+    for row in rows:
+        state = existing.get(row['id']) or WalletReconciliation(wallet_id=row['id'])
+        state.ledger_total = (row['ledger_total'] or 0) + row['new_total']
+        state.last_transaction_id = row['new_last_id'] or row['last_transaction_id'] or 0
+        state.drift = row['balance'] - state.ledger_total
+        state.verified_at = row['updated_at']
+        (updated if state.pk else created).append(state)
+        if state.drift:
+            drifted.append(state)
+
+    with transaction.atomic():
+        WalletReconciliation.objects.bulk_create(created, batch_size=500)
+        WalletReconciliation.objects.bulk_update(
+            updated, ['ledger_total', 'last_transaction_id', 'drift', 'verified_at'], batch_size=500
+        )
+        for row in rows:
+            # A wallet changed since the snapshot keeps its flag for the next run
+            Wallet.objects.filter(id=row['id'], updated_at=row['updated_at']).update(needs_reconciliation=False)
+    return drifted
+
+
+def reset():
+    """Forgets all verified positions so the next run rechecks every ledger in full."""
+    with transaction.atomic():
+        WalletReconciliation.objects.all().delete()
+        Wallet.objects.update(needs_reconciliation=True)
@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from allauth.socialaccount.models import SocialAccount
+
+from .services import ensure_wallet
+
+
+class DiscordWalletCache:
+    """
+    Bounded LRU cache with TTL from Discord UID to (user_id, wallet_id).
+
+    Lets the MC API skip the SocialAccount lookup and wallet get_or_create on
+    hot paths. Entries are dropped by signals when the SocialAccount, user or
+    wallet changes; the TTL bounds staleness across worker processes.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._by_user = {}
+
+    def get(self, discord_id):
+        with self._lock:
+            entry = self._entries.get(discord_id)
+            if entry is None:
+                return None
+            user_id, wallet_id, expires = entry
+            if expires < time.monotonic():
+                self._drop(discord_id)
+                return None
+            self._entries.move_to_end(discord_id)
+            return user_id, wallet_id
+
+    def set(self, discord_id, user_id, wallet_id):
+        with self._lock:
+            self._drop(discord_id)
+            self._entries[discord_id] = (user_id, wallet_id, time.monotonic() + self.ttl)
+            self._by_user.setdefault(user_id, set()).add(discord_id)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def resolve(self, discord_id):
+        """Returns (user_id, wallet_id) for a linked Discord account, or None."""
+        discord_id = str(discord_id)
+        cached = self.get(discord_id)
+        if cached is not None:
+            return cached
+        user_id = SocialAccount.objects.filter(provider='discord', uid=discord_id).values_list('user_id', flat=True).first()
+        if user_id is None:
+            return None
+        wallet = ensure_wallet(user_id)
+        self.set(discord_id, user_id, wallet.id)
+        return user_id, wallet.id
+
+    def is_linked(self, discord_id):
+        """Whether a Discord account is linked, without creating its wallet."""
+        discord_id = str(discord_id)
+        if self.get(discord_id) is not None:
+            return True
+        return SocialAccount.objects.filter(provider='discord', uid=discord_id).exists()
+
+    def invalidate(self, discord_id):
+        with self._lock:
+            self._drop(str(discord_id))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for discord_id in list(self._by_user.get(user_id, ())):
+                self._drop(discord_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def _drop(self, discord_id):
+        entry = self._entries.pop(discord_id, None)
+        if entry is not None:
+            discord_ids = self._by_user.get(entry[0])
+            if discord_ids is not None:
+                discord_ids.discard(discord_id)
+                if not discord_ids:
+                    del self._by_user[entry[0]]
+
+
+discord_wallets = DiscordWalletCache(
+    maxsize=getattr(settings, 'MC_RESOLVER_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'MC_RESOLVER_CACHE_TTL', 300),
+)
@@ -7,9 +7,12 @@ class WalletSerializer(serializers.ModelSerializer):
         fields = ['balance', 'updated_at']
 
 class TransactionSerializer(serializers.ModelSerializer):
+    # Wallet balance right after this entry, set by the history view
+    balance_after = serializers.IntegerField(read_only=True)
+
     class Meta:
         model = Transaction
-        fields = ['id', 'amount', 'transaction_type', 'description', 'created_at']
+        fields = ['id', 'amount', 'transaction_type', 'description', 'created_at', 'balance_after']
 
 class TransferSerializer(serializers.Serializer):
     to_discord_id = serializers.CharField(max_length=100, required=False)
@@ -0,0 +1,243 @@
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import F, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Wallet, Transaction, BalanceCheckpoint
+
+
+class WalletError(Exception):
+    pass
+
+
+class InvalidAmount(WalletError):
+    def __init__(self):
+        super().__init__("Amount must be a positive integer")
+
+
+class InsufficientFunds(WalletError):
+    def __init__(self):
+        super().__init__("Insufficient funds")
+
+
+def clean_amount(amount):
+    try:
+        amount = int(amount)
+    except (TypeError, ValueError):
+        raise InvalidAmount()
+    if amount <= 0:
+        raise InvalidAmount()
+    return amount
+
+
+def ensure_wallet(user_id):
+    wallet = Wallet.objects.filter(user_id=user_id).first()
+    if wallet is not None:
+        return wallet
+    try:
+        with transaction.atomic():
+            return Wallet.objects.create(user_id=user_id)
+    except IntegrityError:
+        # Created concurrently
+        return Wallet.objects.get(user_id=user_id)
+
+
+def _lock(user_ids):
+    # Always lock in user_id order so concurrent transfers A->B and B->A
+    # cannot deadlock (no-op on SQLite, which locks the whole database)
+    return list(Wallet.objects.select_for_update().filter(user_id__in=sorted(user_ids)).order_by('user_id'))
+
+
+def checkpoint_interval():
+    return getattr(settings, 'BANK_CHECKPOINT_INTERVAL', 100)
+
+
+def _credit(user_id, amount):
+    Wallet.objects.filter(user_id=user_id).update(
+        balance=F('balance') + amount, updated_at=timezone.now(),
+        entries_since_checkpoint=F('entries_since_checkpoint') + 1, needs_reconciliation=True,
+    )
+
+
+def _debit(user_id, amount):
+    # Conditional UPDATE: the balance check and the write are one statement
+    updated = Wallet.objects.filter(user_id=user_id, balance__gte=amount).update(
+        balance=F('balance') - amount, updated_at=timezone.now(),
+        entries_since_checkpoint=F('entries_since_checkpoint') + 1, needs_reconciliation=True,
+    )
+    if not updated:
+        raise InsufficientFunds()
+
+
+def _settle(user_id):
+    """
+    Returns the locked wallet's balance after its new ledger entries, and
+    writes a balance checkpoint when enough entries have piled up.
+    """
+    balance, pending = Wallet.objects.filter(user_id=user_id).values_list(
+        'balance', 'entries_since_checkpoint'
+    ).get()
+    if pending >= checkpoint_interval():
+        latest = Transaction.objects.filter(user_id=user_id).order_by('-id').values_list('id', flat=True).first()
+        BalanceCheckpoint.objects.create(user_id=user_id, transaction_id=latest, balance=balance)
+        Wallet.objects.filter(user_id=user_id).update(entries_since_checkpoint=0)
+    return balance
+
+
+def deposit(user, amount, description, transaction_type=Transaction.TransactionType.DEPOSIT):
+    """Credits user's wallet and records the ledger entry. Returns the new balance."""
+    amount = clean_amount(amount)
+    ensure_wallet(user.id)
+    with transaction.atomic():
+        _lock([user.id])
+        _credit(user.id, amount)
+        Transaction.objects.create(user=user, amount=amount, transaction_type=transaction_type, description=description)
+        return _settle(user.id)
+
+
+def withdraw(user, amount, description, transaction_type=Transaction.TransactionType.WITHDRAW):
+    """Debits user's wallet if it holds enough. Returns the new balance."""
+    amount = clean_amount(amount)
+    ensure_wallet(user.id)
+    with transaction.atomic():
+        _lock([user.id])
+        _debit(user.id, amount)
+        Transaction.objects.create(user=user, amount=-amount, transaction_type=transaction_type, description=description)
+        return _settle(user.id)
+
+
+def transfer(sender, receiver, amount, sender_description, receiver_description):
+    """Moves amount between two wallets atomically. Returns the sender's new balance."""
+    amount = clean_amount(amount)
+    ensure_wallet(sender.id)
+    ensure_wallet(receiver.id)
+    with transaction.atomic():
+        _lock([sender.id, receiver.id])
+        _debit(sender.id, amount)
+        _credit(receiver.id, amount)
+        Transaction.objects.bulk_create([
+            Transaction(user=sender, amount=-amount, transaction_type=Transaction.TransactionType.TRANSFER,
+                        description=sender_description),
+            Transaction(user=receiver, amount=amount, transaction_type=Transaction.TransactionType.TRANSFER,
+                        description=receiver_description),
+        ])
+        _settle(receiver.id)
+        return _settle(sender.id)
+
+
+def ensure_wallets(user_ids):
+    existing = set(Wallet.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+    Wallet.objects.bulk_create(
+        [Wallet(user_id=user_id) for user_id in user_ids if user_id not in existing],
+        ignore_conflicts=True,
+    )
+
+
+def apply_batch(operations):
+    """
+    Applies many operations in one database transaction.
+
+    Each operation is a dict with 'type' ('deposit', 'withdraw' or 'transfer'),
+    'user', 'amount' (already cleaned) and 'description'; transfers also carry
+    'to_user' and 'to_description'. Operations run in order against the locked
+    wallets, and balances and ledger entries are written back in bulk.
+
+    Returns one result per operation: the user's new balance, or the
+    WalletError that made it fail. A failed operation does not affect the others.
+    """
+    user_ids = set()
+    for op in operations:
+        user_ids.add(op['user'].id)
+        if op['type'] == 'transfer':
+            user_ids.add(op['to_user'].id)
+    if not user_ids:
+        return []
+    ensure_wallets(user_ids)
+
+    results = []
+    entries = []
+    touched = {}
+    with transaction.atomic():
+        wallets = {wallet.user_id: wallet for wallet in _lock(user_ids)}
+        for op in operations:
+            wallet = wallets[op['user'].id]
+            amount = op['amount']
+            if op['type'] == 'deposit':
+                wallet.balance += amount
+                entries.append(Transaction(user=op['user'], amount=amount, description=op['description'],
+                                           transaction_type=Transaction.TransactionType.DEPOSIT))
+            elif wallet.balance < amount:
+                results.append(InsufficientFunds())
+                continue
+            elif op['type'] == 'withdraw':
+                wallet.balance -= amount
+                entries.append(Transaction(user=op['user'], amount=-amount, description=op['description'],
+                                           transaction_type=Transaction.TransactionType.WITHDRAW))
+            else:
+                target = wallets[op['to_user'].id]
+                wallet.balance -= amount
+                target.balance += amount
+                target.entries_since_checkpoint += 1
+                touched[target.user_id] = target
+                entries.append(Transaction(user=op['user'], amount=-amount, description=op['description'],
+                                           transaction_type=Transaction.TransactionType.TRANSFER))
+                entries.append(Transaction(user=op['to_user'], amount=amount, description=op['to_description'],
+                                           transaction_type=Transaction.TransactionType.TRANSFER))
+            wallet.entries_since_checkpoint += 1
+            touched[wallet.user_id] = wallet
+            results.append(wallet.balance)
+
+        Transaction.objects.bulk_create(entries, batch_size=500)
+
+        # Entries were appended in order, so each user's last one is their newest
+        latest = {entry.user_id: entry.pk for entry in entries}
+        checkpoints = []
+        now = timezone.now()
+        for wallet in touched.values():
+            wallet.updated_at = now
+            wallet.needs_reconciliation = True
+            if wallet.entries_since_checkpoint >= checkpoint_interval():
+                checkpoints.append(BalanceCheckpoint(
+                    user_id=wallet.user_id, transaction_id=latest[wallet.user_id], balance=wallet.balance
+                ))
+                wallet.entries_since_checkpoint = 0
+        BalanceCheckpoint.objects.bulk_create(checkpoints, batch_size=500)
+        Wallet.objects.bulk_update(
+            list(touched.values()), ['balance', 'updated_at', 'entries_since_checkpoint', 'needs_reconciliation'],
+            batch_size=500,
+        )
+    return results
+
+
+def with_running_balance(user_id, entries):
+    """
+    Sets balance_after on each of a page of one user's ledger entries (newest
+    first). The balance is anchored on the nearest checkpoint at or after the
+    page, or on the live wallet, so at most about one checkpoint interval of
+    entries gets summed however deep the page is.
+    """
+    if not entries:
+        return entries
+    newest = entries[0].id
+    later = Transaction.objects.filter(user_id=user_id, id__gt=newest)
+
+    anchor = BalanceCheckpoint.objects.filter(user_id=user_id, transaction_id__gte=newest).order_by(
+        'transaction_id'
+    ).values_list('transaction_id', 'balance').first()
+    if anchor is not None:
+        transaction_id, balance = anchor
+        balance -= later.filter(id__lte=transaction_id).aggregate(total=Sum('amount'))['total'] or 0
+    else:
+        # Wallet and ledger read in one statement, so they agree with each other
+        later_total = later.values('user_id').annotate(
+            total=Sum('amount')
+        ).values('total')
+        balance = Wallet.objects.filter(user_id=user_id).annotate(
+            later=Coalesce(Subquery(later_total), Value(0))
+        ).values_list(F('balance') - F('later'), flat=True).first() or 0
+
+    for entry in entries:
+        entry.balance_after = balance
+        balance -= entry.amount
+    return entries
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+from allauth.socialaccount.models import SocialAccount
+from .models import Wallet
+from .resolver import discord_wallets
+
+User = get_user_model()
+
+@receiver(post_save, sender=SocialAccount)
+@receiver(post_delete, sender=SocialAccount)
+def invalidate_social_account(sender, instance, **kwargs):
+    # The uid or owner may have changed, so drop both sides
+    discord_wallets.invalidate(instance.uid)
+    discord_wallets.invalidate_user(instance.user_id)
+
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    discord_wallets.invalidate_user(instance.id)
+
+@receiver(post_delete, sender=Wallet)
+def invalidate_wallet(sender, instance, **kwargs):
+    discord_wallets.invalidate_user(instance.user_id)
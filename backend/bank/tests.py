@@ -0,0 +1,269 @@
+import io
+import threading
+
+from django.test import TestCase, TransactionTestCase
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from rest_framework.test import APIClient
+from rest_framework import status
+from allauth.socialaccount.models import SocialAccount
+from .models import Wallet, Transaction, BalanceCheckpoint, WalletReconciliation
+from .reconciliation import reconcile
+from . import services
+from .resolver import DiscordWalletCache, discord_wallets
+
+User = get_user_model()
+
+class WalletServiceTests(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.user2 = User.objects.create_user(username='user2', password='password123', email='user2@example.com')
+
+    def test_withdraw_refuses_overdraft(self):
+        services.deposit(self.user1, 10, "test")
+        with self.assertRaises(services.InsufficientFunds):
+            services.withdraw(self.user1, 11, "test")
+        self.assertEqual(Wallet.objects.get(user=self.user1).balance, 10)
+        self.assertEqual(Transaction.objects.filter(user=self.user1).count(), 1)
+
+    def test_transfer_moves_balance(self):
+        services.deposit(self.user1, 10, "test")
+        self.assertEqual(services.transfer(self.user1, self.user2, 4, "out", "in"), 6)
+        self.assertEqual(Wallet.objects.get(user=self.user2).balance, 4)
+
+    def test_rejects_non_positive_amounts(self):
+        for amount in (0, -5, 'abc'):
+            with self.assertRaises(services.InvalidAmount):
+                services.deposit(self.user1, amount, "test")
+
+class MCWithdrawViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer test-key')
+        self.user = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        SocialAccount.objects.create(user=self.user, provider='discord', uid='42')
+
+    def test_insufficient_funds(self):
+        with self.settings(MC_API_KEY='test-key'):
+            response = self.client.post('/api/bank/mc/withdraw/', {'discord_id': '42', 'amount': 5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'Insufficient funds')
+
+class WalletConcurrencyTests(TransactionTestCase):
+    """Many parallel deposits and transfers must neither lose updates nor overdraw."""
+    workers = 8
+    operations = 25
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'player{i}', password='password123', email=f'player{i}@example.com')
+            for i in range(4)
+        ]
+        for user in self.users:
+            services.deposit(user, 100, "seed")
+
+    def run_workers(self, work):
+        errors = []
+
+        def target(worker):
+            try:
+                for i in range(self.operations):
+                    work(worker, i)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=target, args=(w,)) for w in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_parallel_deposits_and_transfers_stay_consistent(self):
+        def work(worker, i):
+            sender = self.users[(worker + i) % len(self.users)]
+            receiver = self.users[(worker + i + 1) % len(self.users)]
+            if i % 2:
+                services.deposit(sender, 1, "stress")
+            else:
+                try:
+                    services.transfer(sender, receiver, 7, "stress out", "stress in")
+                except services.InsufficientFunds:
+                    pass
+
+        self.run_workers(work)
+
+        deposits = self.workers * (self.operations // 2)
+        balances = Wallet.objects.aggregate(total=Sum('balance'))['total']
+        self.assertEqual(balances, 100 * len(self.users) + deposits)
+        self.assertFalse(Wallet.objects.filter(balance__lt=0).exists())
+        for wallet in Wallet.objects.all():
+            ledger = Transaction.objects.filter(user_id=wallet.user_id).aggregate(total=Sum('amount'))['total']
+            self.assertEqual(wallet.balance, ledger)
+
+class MCBatchViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer test-key')
+        self.users = []
+        for i in range(3):
+            user = User.objects.create_user(username=f'player{i}', password='password123', email=f'player{i}@example.com')
+            SocialAccount.objects.create(user=user, provider='discord', uid=str(i))
+            self.users.append(user)
+
+    def post(self, operations):
+        with self.settings(MC_API_KEY='test-key'):
+            return self.client.post('/api/bank/mc/batch/', {'operations': operations}, format='json')
+
+    def test_batch_applies_operations_in_order(self):
+        response = self.post([
+            {'type': 'deposit', 'discord_id': '0', 'amount': 50},
+            {'type': 'transfer', 'from_discord_id': '0', 'to_discord_id': '1', 'amount': 20},
+            {'type': 'withdraw', 'discord_id': '1', 'amount': 25},
+            {'type': 'withdraw', 'discord_id': '1', 'amount': 5},
+            {'type': 'deposit', 'discord_id': 'missing', 'amount': 5},
+            {'type': 'deposit', 'discord_id': '2', 'amount': -1},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], ['ok', 'ok', 'error', 'ok', 'error', 'error'])
+        self.assertEqual(results[1]['new_balance'], 30)
+        self.assertEqual(results[2]['error'], 'Insufficient funds')
+        self.assertEqual(Wallet.objects.get(user=self.users[0]).balance, 30)
+        self.assertEqual(Wallet.objects.get(user=self.users[1]).balance, 15)
+        self.assertEqual(Transaction.objects.count(), 4)
+
+    def test_payout_to_many_players_is_one_request(self):
+        response = self.post([{'type': 'deposit', 'discord_id': str(i % 3), 'amount': 1} for i in range(300)])
+        self.assertTrue(all(r['status'] == 'ok' for r in response.data['results']))
+        self.assertEqual(Wallet.objects.aggregate(total=Sum('balance'))['total'], 300)
+
+class TransactionHistoryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.other = User.objects.create_user(username='user2', password='password123', email='user2@example.com')
+        SocialAccount.objects.create(user=self.user, provider='discord', uid='111')
+        self.client.force_authenticate(user=self.user)
+
+    def test_checkpoints_are_written_periodically(self):
+        with self.settings(BANK_CHECKPOINT_INTERVAL=5):
+            for _ in range(7):
+                services.deposit(self.user, 10, "test")
+            services.apply_batch([
+                {'type': 'withdraw', 'user': self.user, 'amount': 1, 'description': 'w'} for _ in range(3)
+            ])
+        checkpoint = BalanceCheckpoint.objects.get(user=self.user, balance=50)
+        self.assertEqual(checkpoint.transaction, Transaction.objects.filter(user=self.user).order_by('id')[4])
+        self.assertTrue(BalanceCheckpoint.objects.filter(user=self.user, balance=67).exists())
+        self.assertEqual(Wallet.objects.get(user=self.user).entries_since_checkpoint, 0)
+
+    def test_pages_carry_running_balance(self):
+        with self.settings(BANK_CHECKPOINT_INTERVAL=4):
+            for amount in range(1, 11):
+                services.deposit(self.user, amount, "test")
+            services.transfer(self.user, self.other, 5, "out", "in")
+
+        response = self.client.get('/api/bank/transactions/?limit=4')
+        self.assertTrue(response.data['has_more'])
+        results = response.data['results']
+        self.assertEqual([t['amount'] for t in results], [-5, 10, 9, 8])
+        self.assertEqual([t['balance_after'] for t in results], [50, 55, 45, 36])
+
+        pages = results
+        while response.data['has_more']:
+            response = self.client.get(f'/api/bank/transactions/?limit=4&before_id={pages[-1]["id"]}')
+            pages += response.data['results']
+        self.assertEqual(len(pages), 11)
+        self.assertEqual([t['balance_after'] for t in pages[-3:]], [6, 3, 1])
+
+    def test_running_balance_deep_in_history(self):
+        with self.settings(BANK_CHECKPOINT_INTERVAL=3):
+            for _ in range(30):
+                services.deposit(self.user, 1, "test")
+        oldest = Transaction.objects.filter(user=self.user).order_by('id')[2]
+        entries = list(Transaction.objects.filter(user=self.user, id__lte=oldest.id).order_by('-id'))
+        self.assertEqual([e.balance_after for e in services.with_running_balance(self.user.id, entries)], [3, 2, 1])
+
+class LedgerReconciliationTests(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.user2 = User.objects.create_user(username='user2', password='password123', email='user2@example.com')
+        services.deposit(self.user1, 50, "test")
+        services.transfer(self.user1, self.user2, 20, "out", "in")
+
+    def test_consistent_ledgers_are_verified_once(self):
+        self.assertEqual(reconcile(chunk_size=1), (2, []))
+        state = WalletReconciliation.objects.get(wallet__user=self.user1)
+        self.assertEqual((state.ledger_total, state.drift), (30, 0))
+        self.assertFalse(Wallet.objects.filter(needs_reconciliation=True).exists())
+        # Nothing changed, nothing to read
+        self.assertEqual(reconcile(), (0, []))
+
+    def test_only_new_entries_are_summed(self):
+        reconcile()
+        # Already-verified entries are not read again
+        Transaction.objects.filter(user=self.user2).update(amount=999)
+        services.withdraw(self.user2, 5, "test")
+        self.assertEqual(reconcile(), (1, []))
+        state = WalletReconciliation.objects.get(wallet__user=self.user2)
+        self.assertEqual(state.ledger_total, 15)
+        self.assertEqual(state.last_transaction_id, Transaction.objects.filter(user=self.user2).latest('id').id)
+
+    def test_reports_drift(self):
+        reconcile()
+        Wallet.objects.filter(user=self.user2).update(balance=100, needs_reconciliation=True)
+        checked, drifted = reconcile()
+        self.assertEqual(checked, 1)
+        self.assertEqual([(state.wallet.user, state.drift) for state in drifted], [(self.user2, 80)])
+
+        out = io.StringIO()
+        call_command('reconcile_ledger', '--full', stdout=out)
+        self.assertIn('Checked 2 wallets, 1 drifting now', out.getvalue())
+
+class DiscordWalletCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer test-key')
+        self.user = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.account = SocialAccount.objects.create(user=self.user, provider='discord', uid='42')
+        discord_wallets.clear()
+
+    def balance(self, discord_id='42'):
+        with self.settings(MC_API_KEY='test-key'):
+            return self.client.get(f'/api/bank/mc/balance/{discord_id}/')
+
+    def test_warm_balance_is_one_query(self):
+        services.deposit(self.user, 7, "test")
+        self.balance()
+        with self.assertNumQueries(1):
+            response = self.balance()
+        self.assertEqual(response.data['balance'], 7)
+
+    def test_unlinking_account_invalidates(self):
+        self.balance()
+        self.account.delete()
+        self.assertEqual(self.balance().status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_user_check_creates_no_wallet(self):
+        with self.settings(MC_API_KEY='test-key'):
+            for discord_id, exists in [('42', True), ('43', False)]:
+                response = self.client.get(f'/api/bank/mc/user/any/?discord_id={discord_id}')
+                self.assertEqual(response.data['exists'], exists)
+        self.assertFalse(Wallet.objects.exists())
+
+    def test_lru_eviction_and_ttl(self):
+        cache = DiscordWalletCache(maxsize=2, ttl=60)
+        cache.set('a', 1, 1)
+        cache.set('b', 2, 2)
+        cache.get('a')
+        cache.set('c', 3, 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), (1, 1))
+        cache.ttl = -1
+        cache.set('d', 4, 4)
+        self.assertIsNone(cache.get('d'))
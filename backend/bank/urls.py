@@ -13,4 +13,5 @@ urlpatterns = [
     path('mc/deposit/', views.MCDepositView.as_view(), name='mc-deposit'),
     path('mc/withdraw/', views.MCWithdrawView.as_view(), name='mc-withdraw'),
     path('mc/transfer/', views.MCTransferView.as_view(), name='mc-transfer'),
+    path('mc/batch/', views.MCBatchView.as_view(), name='mc-batch'),
 ]
@@ -2,9 +2,11 @@ from rest_framework import generics, status, views, permissions
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
-from django.db import transaction
 from .models import Wallet, Transaction
+from . import services
+from .resolver import discord_wallets
 from .serializers import WalletSerializer, TransactionSerializer, TransferSerializer
+from .pagination import TransactionCursorPagination
 from .authentication import MCKeyAuthentication
 from allauth.socialaccount.models import SocialAccount
 
@@ -28,8 +30,14 @@ class TransactionListView(generics.ListAPIView):
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated, IsDiscordLinked]
 
+    pagination_class = TransactionCursorPagination
+
     def get_queryset(self):
-        return Transaction.objects.filter(user=self.request.user).order_by('-created_at')
+        return Transaction.objects.filter(user=self.request.user)
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        return services.with_running_balance(self.request.user.id, page)
 
 class TransferView(views.APIView):
     permission_classes = [permissions.IsAuthenticated, IsDiscordLinked]
@@ -41,10 +49,6 @@ class TransferView(views.APIView):
             to_discord_id = serializer.validated_data.get('to_discord_id')
             to_username = serializer.validated_data.get('to_username')
 
-            sender_wallet, _ = Wallet.objects.get_or_create(user=request.user)
-            if sender_wallet.balance < amount:
-                return Response({"error": "Insufficient funds"}, status=status.HTTP_400_BAD_REQUEST)
-
             target_user = None
             if to_discord_id:
                 try:
@@ -61,29 +65,16 @@ class TransferView(views.APIView):
             if target_user == request.user:
                 return Response({"error": "Cannot transfer to yourself"}, status=status.HTTP_400_BAD_REQUEST)
 
-            receiver_wallet, _ = Wallet.objects.get_or_create(user=target_user)
-
-            with transaction.atomic():
-                sender_wallet.balance -= amount
-                sender_wallet.save()
-                
-                receiver_wallet.balance += amount
-                receiver_wallet.save()
-
-                Transaction.objects.create(
-                    user=request.user,
-                    amount=-amount,
-                    transaction_type=Transaction.TransactionType.TRANSFER,
-                    description=f"Transfer to {target_user.username}"
-                )
-                Transaction.objects.create(
-                    user=target_user,
-                    amount=amount,
-                    transaction_type=Transaction.TransactionType.TRANSFER,
-                    description=f"Transfer from {request.user.username}"
+            try:
+                new_balance = services.transfer(
+                    request.user, target_user, amount,
+                    sender_description=f"Transfer to {target_user.username}",
+                    receiver_description=f"Transfer from {request.user.username}",
                 )
+            except services.WalletError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            return Response({"status": "success", "new_balance": sender_wallet.balance})
+            return Response({"status": "success", "new_balance": new_balance})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class MCUserCheckView(views.APIView):
@@ -93,7 +84,7 @@ class MCUserCheckView(views.APIView):
     def get(self, request, uuid):
         discord_id = request.query_params.get('discord_id')
         if discord_id:
-            exists = SocialAccount.objects.filter(provider='discord', uid=discord_id).exists()
+            exists = discord_wallets.is_linked(discord_id)
             return Response({"discord_id": discord_id, "exists": exists})
         
         return Response({"error": "discord_id param required"}, status=status.HTTP_400_BAD_REQUEST)
@@ -103,12 +94,20 @@ class MCBalanceView(views.APIView):
     permission_classes = []
 
     def get(self, request, discord_id):
-        try:
-            social_account = SocialAccount.objects.get(provider='discord', uid=discord_id)
-            wallet, _ = Wallet.objects.get_or_create(user=social_account.user)
-            return Response({"discord_id": discord_id, "balance": wallet.balance})
-        except SocialAccount.DoesNotExist:
+        balance = self.get_balance(discord_id)
+        if balance is None:
+            # Possibly a stale entry from another process; resolve once more
+            discord_wallets.invalidate(discord_id)
+            balance = self.get_balance(discord_id)
+        if balance is None:
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"discord_id": discord_id, "balance": balance})
+
+    def get_balance(self, discord_id):
+        resolved = discord_wallets.resolve(discord_id)
+        if resolved is None:
+            return None
+        return Wallet.objects.filter(pk=resolved[1]).values_list('balance', flat=True).first()
 
 class MCDepositView(views.APIView):
     authentication_classes = [MCKeyAuthentication]
@@ -123,19 +122,10 @@ class MCDepositView(views.APIView):
 
         try:
             social_account = SocialAccount.objects.get(provider='discord', uid=discord_id)
-            wallet, _ = Wallet.objects.get_or_create(user=social_account.user)
-            
-            with transaction.atomic():
-                wallet.balance += int(amount)
-                wallet.save()
-                Transaction.objects.create(
-                    user=social_account.user,
-                    amount=int(amount),
-                    transaction_type=Transaction.TransactionType.DEPOSIT,
-                    description="Deposit from Minecraft"
-                )
-            
-            return Response({"status": "ok", "new_balance": wallet.balance})
+            new_balance = services.deposit(social_account.user, amount, "Deposit from Minecraft")
+            return Response({"status": "ok", "new_balance": new_balance})
+        except services.WalletError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except SocialAccount.DoesNotExist:
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -152,23 +142,10 @@ class MCWithdrawView(views.APIView):
 
         try:
             social_account = SocialAccount.objects.get(provider='discord', uid=discord_id)
-            wallet, _ = Wallet.objects.get_or_create(user=social_account.user)
-            
-            amount = int(amount)
-            if wallet.balance < amount:
-                return Response({"error": "Insufficient funds"}, status=status.HTTP_400_BAD_REQUEST)
-
-            with transaction.atomic():
-                wallet.balance -= amount
-                wallet.save()
-                Transaction.objects.create(
-                    user=social_account.user,
-                    amount=-amount,
-                    transaction_type=Transaction.TransactionType.WITHDRAW,
-                    description="Withdraw to Minecraft"
-                )
-            
-            return Response({"status": "ok", "new_balance": wallet.balance})
+            new_balance = services.withdraw(social_account.user, amount, "Withdraw to Minecraft")
+            return Response({"status": "ok", "new_balance": new_balance})
+        except services.WalletError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except SocialAccount.DoesNotExist:
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -185,36 +162,95 @@ class MCTransferView(views.APIView):
             return Response({"error": "from_discord_id, to_discord_id and amount required"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            sender_sa = SocialAccount.objects.get(provider='discord', uid=from_discord_id)
-            receiver_sa = SocialAccount.objects.get(provider='discord', uid=to_discord_id)
+            sender_sa = SocialAccount.objects.select_related('user').get(provider='discord', uid=from_discord_id)
+            receiver_sa = SocialAccount.objects.select_related('user').get(provider='discord', uid=to_discord_id)
             
-            sender_wallet, _ = Wallet.objects.get_or_create(user=sender_sa.user)
-            receiver_wallet, _ = Wallet.objects.get_or_create(user=receiver_sa.user)
-            
-            amount = int(amount)
-            if sender_wallet.balance < amount:
-                return Response({"error": "Insufficient funds"}, status=status.HTTP_400_BAD_REQUEST)
-
-            with transaction.atomic():
-                sender_wallet.balance -= amount
-                sender_wallet.save()
-                
-                receiver_wallet.balance += amount
-                receiver_wallet.save()
-
-                Transaction.objects.create(
-                    user=sender_sa.user,
-                    amount=-amount,
-                    transaction_type=Transaction.TransactionType.TRANSFER,
-                    description=f"Transfer to {receiver_sa.user.username} (MC)"
-                )
-                Transaction.objects.create(
-                    user=receiver_sa.user,
-                    amount=amount,
-                    transaction_type=Transaction.TransactionType.TRANSFER,
-                    description=f"Transfer from {sender_sa.user.username} (MC)"
-                )
-
-            return Response({"status": "ok", "new_balance": sender_wallet.balance})
+            new_balance = services.transfer(
+                sender_sa.user, receiver_sa.user, amount,
+                sender_description=f"Transfer to {receiver_sa.user.username} (MC)",
+                receiver_description=f"Transfer from {sender_sa.user.username} (MC)",
+            )
+            return Response({"status": "ok", "new_balance": new_balance})
+        except services.WalletError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except SocialAccount.DoesNotExist:
             return Response({"error": "One of the users not found"}, status=status.HTTP_404_NOT_FOUND)
+
+class MCBatchView(views.APIView):
+    """
+    Applies many deposit/withdraw/transfer operations in one request and one
+    database transaction, e.g. end-of-round payouts to every player:
+
+        {"operations": [
+            {"type": "deposit", "discord_id": "...", "amount": 10},
+            {"type": "withdraw", "discord_id": "...", "amount": 5},
+            {"type": "transfer", "from_discord_id": "...", "to_discord_id": "...", "amount": 3}
+        ]}
+
+    Returns one result per operation, in order. Failed operations are reported
+    without rolling back the rest.
+    """
+    authentication_classes = [MCKeyAuthentication]
+    permission_classes = []
+    max_operations = 1000
+
+    def post(self, request):
+        operations = request.data.get('operations')
+        if not isinstance(operations, list) or not operations:
+            return Response({"error": "operations list required"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(operations) > self.max_operations:
+            return Response({"error": f"At most {self.max_operations} operations per batch"}, status=status.HTTP_400_BAD_REQUEST)
+
+        discord_ids = set()
+        for op in operations:
+            if isinstance(op, dict):
+                for key in ('discord_id', 'from_discord_id', 'to_discord_id'):
+                    if op.get(key):
+                        discord_ids.add(str(op[key]))
+        users = {
+            sa.uid: sa.user
+            for sa in SocialAccount.objects.filter(provider='discord', uid__in=discord_ids).select_related('user')
+        }
+
+        results = [None] * len(operations)
+        prepared = []
+        for index, op in enumerate(operations):
+            try:
+                prepared.append((index, self.prepare(op, users)))
+            except (ValueError, services.WalletError) as e:
+                results[index] = {"status": "error", "error": str(e)}
+
+        outcomes = services.apply_batch([op for _, op in prepared])
+        for (index, _), outcome in zip(prepared, outcomes):
+            if isinstance(outcome, services.WalletError):
+                results[index] = {"status": "error", "error": str(outcome)}
+            else:
+                results[index] = {"status": "ok", "new_balance": outcome}
+
+        return Response({"results": results})
+
+    def prepare(self, op, users):
+        if not isinstance(op, dict):
+            raise ValueError("Operation must be an object")
+        op_type = op.get('type')
+        amount = services.clean_amount(op.get('amount'))
+
+        if op_type in ('deposit', 'withdraw'):
+            user = users.get(str(op.get('discord_id')))
+            if user is None:
+                raise ValueError("User not found")
+            description = "Deposit from Minecraft" if op_type == 'deposit' else "Withdraw to Minecraft"
+            return {"type": op_type, "user": user, "amount": amount, "description": description}
+
+        if op_type == 'transfer':
+            sender = users.get(str(op.get('from_discord_id')))
+            receiver = users.get(str(op.get('to_discord_id')))
+            if sender is None or receiver is None:
+                raise ValueError("One of the users not found")
+            return {
+                "type": op_type, "user": sender, "to_user": receiver, "amount": amount,
+                "description": f"Transfer to {receiver.username} (MC)",
+                "to_description": f"Transfer from {sender.username} (MC)",
+            }
+
+        raise ValueError("Unknown operation type")
@@ -0,0 +1,136 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class ViewStats:
+    def __init__(self, latency_buckets):
+        self.latency = Histogram(latency_buckets)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.query_seconds = 0.0
+        self.response_bytes = 0
+        self.statuses = {}
+
+
+class ViewMetrics:
+    """
+    In-process aggregates per (view, method): latency and queries-per-request
+    histograms, SQL time and response bytes. Each worker process keeps its
+    own numbers; Prometheus sums them across scrape targets.
+    """
+
+    def __init__(self, latency_buckets=None):
+        self.latency_buckets = tuple(latency_buckets or getattr(
+            settings, 'METRICS_LATENCY_BUCKETS', DEFAULT_LATENCY_BUCKETS
+        ))
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, method, status, seconds, queries, query_seconds, response_bytes):
+        status_class = f'{status // 100}xx'
+        with self._lock:
+            stats = self._views.get((view, method))
+            if stats is None:
+                stats = self._views[(view, method)] = ViewStats(self.latency_buckets)
+            stats.latency.observe(seconds)
+            stats.queries.observe(queries)
+            stats.query_seconds += query_seconds
+            stats.response_bytes += response_bytes
+            stats.statuses[status_class] = stats.statuses.get(status_class, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            snapshot = sorted(self._views.items())
+            lines = []
+            self._render_histogram(lines, snapshot, 'django_view_latency_seconds',
+                                   'Time spent producing the response.', lambda stats: stats.latency)
+            self._render_histogram(lines, snapshot, 'django_view_db_queries',
+                                   'SQL queries per request.', lambda stats: stats.queries)
+            lines += ['# HELP django_view_db_query_seconds_total Time spent in SQL queries.',
+                      '# TYPE django_view_db_query_seconds_total counter']
+            for (view, method), stats in snapshot:
+                lines.append(f'django_view_db_query_seconds_total{{{_labels(view, method)}}} {stats.query_seconds:.6f}')
+            lines += ['# HELP django_view_response_bytes_total Response body bytes sent.',
+                      '# TYPE django_view_response_bytes_total counter']
+            for (view, method), stats in snapshot:
+                lines.append(f'django_view_response_bytes_total{{{_labels(view, method)}}} {stats.response_bytes}')
+            lines += ['# HELP django_view_responses_total Responses by status class.',
+                      '# TYPE django_view_responses_total counter']
+            for (view, method), stats in snapshot:
+                for status_class, count in sorted(stats.statuses.items()):
+                    lines.append(
+                        f'django_view_responses_total{{{_labels(view, method)},status="{status_class}"}} {count}'
+                    )
+        return '\n'.join(lines) + '\n'
+
+    def _render_histogram(self, lines, snapshot, name, help_text, get):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (view, method), stats in snapshot:
+            histogram = get(stats)
+            labels = _labels(view, method)
+            for bound, total in histogram.cumulative():
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum:g}')
+            lines.append(f'{name}_count{{{labels}}} {sum(histogram.counts)}')
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(view, method):
+    return f'view="{_escape(view)}",method="{_escape(method)}"'
+
+
+class QueryCounter:
+    """Database execute wrapper counting the queries one request runs and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+    def install(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+view_metrics = ViewMetrics()
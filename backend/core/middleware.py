@@ -1,23 +1,86 @@
-from django.utils import timezone
-from social.models import SocialProfile
+import random
+import time
+
+from django.conf import settings
+
+from social.presence import tracker
+from social.push import publish_presence
+from .metrics import QueryCounter, view_metrics
+from .routers import pin_to_primary, routing_scope
 
 class UpdateLastActivityMiddleware:
     """
-    Middleware to automatically update user's last_activity on each request
+    Middleware to record user's activity on each request.
+    Activity goes to the presence tracker and is flushed to
+    SocialProfile.last_activity in periodic batches.
     """
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        # Update last activity before processing the request
+        # Record activity before processing the request
         if request.user.is_authenticated:
             try:
-                profile, created = SocialProfile.objects.get_or_create(user=request.user)
-                # auto_now=True will automatically update the timestamp
-                profile.save(update_fields=['last_activity'])
+                if tracker.touch(request.user.id):
+                    publish_presence(request.user.id, True)
+                tracker.flush_if_due()
             except Exception:
                 # Silently fail to avoid breaking requests
                 pass
 
         response = self.get_response(request)
         return response
+
+class ViewMetricsMiddleware:
+    """
+    Records latency, SQL query count/time and response size per resolved view
+    into core.metrics. Placed first so the other middleware's work is counted.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with counter.install():
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        # Event streams stay open indefinitely; their timings say nothing useful
+        if not response.streaming:
+            match = request.resolver_match
+            view_metrics.record(
+                match.route if match else '<unresolved>', request.method, response.status_code,
+                elapsed, counter.count, counter.seconds, len(response.content),
+            )
+        return response
+
+class ReplicaRoutingMiddleware:
+    """
+    Opens the routing scope core.routers.PrimaryReplicaRouter reads. Safe
+    requests to views with replica_reads = True read from a replica, unless
+    the user was written for recently: a request that writes pins its user to
+    the primary until replicas caught up (see core.routers.pin_to_primary).
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with routing_scope() as scope:
+            request.replica_routing = scope
+            response = self.get_response(request)
+        # DRF hands the user it authenticated back to the request
+        user = getattr(request, 'user', None)
+        if scope.wrote and user is not None and user.is_authenticated:
+            pin_to_primary(user.id)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in ('GET', 'HEAD', 'OPTIONS')
+            and getattr(view_class, 'replica_reads', False)
+        ):
+            # Picked once, so every read of the request sees the same snapshot
+            request.replica_routing.replica = random.choice(settings.DATABASE_REPLICAS)
@@ -0,0 +1,55 @@
+import re
+
+from django.db import connections
+
+FULL_SCAN = 'full scan'
+TEMP_BTREE = 'temp b-tree'
+INDEX_UNUSED = 'index not used'
+
+# SQLite plan lines: "SCAN t" reads every row of t (or of one of its
+# indexes), "USE TEMP B-TREE FOR ..." sorts or de-duplicates rows in memory
+_FULL_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)')
+_TEMP_BTREE = re.compile(r'^USE TEMP B-TREE FOR ')
+
+
+def explain(queryset):
+    """
+    Returns the SQLite query plan of a queryset as (depth, detail) pairs, in
+    the order EXPLAIN QUERY PLAN reports them.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'sqlite':
+        raise NotImplementedError('Query plans are only read from SQLite.')
+    sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        rows = cursor.fetchall()
+
+    depths = {0: -1}
+    plan = []
+    for node_id, parent_id, _, detail in rows:
+        depths[node_id] = depths.get(parent_id, -1) + 1
+        plan.append((depths[node_id], detail))
+    return plan
+
+
+def find_issues(plan, allow=(), uses=()):
+    """
+    Full table/index scans and temp B-tree sorts in a plan, plus any index
+    named in uses that the plan does not touch, as (kind, detail) pairs.
+    Kinds listed in allow are left out.
+    """
+    issues = []
+    for _, detail in plan:
+        if _FULL_SCAN.match(detail):
+            kind = FULL_SCAN
+        elif _TEMP_BTREE.match(detail):
+            kind = TEMP_BTREE
+        else:
+            continue
+        if kind not in allow:
+            issues.append((kind, detail))
+    for index in uses:
+        if not any(re.search(rf'\bINDEX {index}\b', detail) for _, detail in plan):
+            issues.append((INDEX_UNUSED, index))
+    return issues
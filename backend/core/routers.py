@@ -0,0 +1,103 @@
+import datetime
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_scope = ContextVar('replica_routing_scope', default=None)
+
+
+class RoutingScope:
+    """Routing state of one request: the replica it may read from, if any, and whether it wrote."""
+
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+@contextmanager
+def routing_scope():
+    scope = RoutingScope()
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+def replica_lag():
+    """How far behind the primary a replica read may be."""
+    if not settings.DATABASE_REPLICAS:
+        return datetime.timedelta(0)
+    return datetime.timedelta(seconds=settings.DATABASE_REPLICA_LAG)
+
+
+def pin_to_primary(*user_ids):
+    """
+    Keeps these users' reads on the primary, from any of their clients, until
+    replicas have caught up: the writer of a change and everyone told about it.
+    """
+    if settings.DATABASE_REPLICAS and user_ids:
+        cache.set_many({f'read-primary:{user_id}': True for user_id in user_ids},
+                       timeout=settings.DATABASE_REPLICA_LAG)
+
+
+def reads_primary(user_id):
+    return cache.get(f'read-primary:{user_id}', False)
+
+
+class ReplicaReadsMixin:
+    """
+    Opts a DRF view's safe requests into replica reads (see
+    core.middleware.ReplicaRoutingMiddleware). The user is only known once
+    authentication has run, so that is where pinned users go back to the primary.
+    """
+    replica_reads = True
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        scope = _scope.get()
+        if scope is not None and scope.replica and reads_primary(request.user.id):
+            scope.replica = None
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads to the replica ReplicaRoutingMiddleware picked for a safe
+    request to an opted-in view; the same one for the whole request, so its
+    reads never mix replicas at different lag.
+    Everything else, including reads after the request's first write and
+    reads inside a transaction, stays on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        scope = _scope.get()
+        if scope is None or scope.replica not in settings.DATABASE_REPLICAS or scope.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related lookups follow the object they start from
+            return instance._state.db
+        return scope.replica
+
+    def db_for_write(self, model, **hints):
+        scope = _scope.get()
+        if scope is not None:
+            scope.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary along with the data
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
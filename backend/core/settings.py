@@ -67,6 +67,8 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'core.middleware.ViewMetricsMiddleware',  # Outermost, so it times everything below
+    'core.middleware.ReplicaRoutingMiddleware',  # Before anything that queries the database
     'corsheaders.middleware.CorsMiddleware', # CORS first
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -107,8 +109,45 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts, so concurrent
+            # writers wait on the busy timeout instead of failing on upgrade
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # File-backed test database: the shared in-memory one uses table locks
+        # that ignore the busy timeout, which breaks the concurrency tests
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    }
+}
+
+# Read replicas: comma-separated SQLite files that core.replication copies the
+# primary into (the replicate_databases command). Safe requests to views with
+# replica_reads = True read from them; a user who just wrote, or was sent an
+# event about a write, stays on the primary for DATABASE_REPLICA_LAG seconds,
+# which must cover the copy interval.
+# Tests give each replica its own file, so routing is checked against a replica
+# that really lags; replicate() copies the schema into it.
+DATABASE_REPLICAS = []
+for index, name in enumerate(filter(None, os.getenv('DATABASE_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'NAME': BASE_DIR / f'test_replica{index}.sqlite3'},
     }
+    DATABASE_REPLICAS.append(f'replica{index}')
+# Always declared so core.tests can run routing against a replica without any
+# configured; nothing reads from it unless it is listed in DATABASE_REPLICAS
+DATABASES['test_replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'test_replica.sqlite3',
+    'TEST': {'NAME': BASE_DIR / 'test_replica.sqlite3', 'MIGRATE': False},
 }
+DATABASE_REPLICA_LAG = 5  # seconds
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
 
 
 # Password validation
@@ -148,6 +187,25 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Hash uploads as they stream in, so attachments can be deduplicated by content
+FILE_UPLOAD_HANDLERS = [
+    'social.blobs.HashingMemoryFileUploadHandler',
+    'social.blobs.HashingTemporaryFileUploadHandler',
+]
+
+# Attachment previews, generated in the background after upload
+# (Pillow for images, ffmpeg on PATH for video poster frames)
+THUMBNAIL_SIZE = (320, 320)
+
+# Message retention: `manage.py archive_messages` (run it from cron) moves
+# read messages older than this into compressed per-conversation segments
+MESSAGE_RETENTION_DAYS = 180
+MESSAGE_ARCHIVE_SEGMENT_SIZE = 500
+
+# Off-request work (previews, file purges) runs on a background thread;
+# set to False to run it inline when the transaction commits
+BACKGROUND_TASKS_ASYNC = True
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -302,6 +360,39 @@ CONTENT_SECURITY_POLICY = {
 RATELIMIT_ENABLE = True
 RATELIMIT_USE_CACHE = 'default'
 
+# Presence: last activity lives in this cache and is written behind to
+# SocialProfile.last_activity at most once per interval (seconds)
+PRESENCE_CACHE = 'default'
+PRESENCE_FLUSH_INTERVAL = 60
+
+# Seconds the current user's own payload (/api/auth/user/, /api/social/me/)
+# stays cached; saves to User, SocialProfile or SocialAccount drop it sooner
+SELF_PAYLOAD_CACHE_TTL = 600
+
+# Conditional GETs on the friends list, friend requests, profile settings and
+# current user compare a per-user change version. Friends connecting or
+# disconnecting bump it; going idle does not, so the ETag also rolls over
+# every this many seconds
+ETAG_PRESENCE_WINDOW = 60
+
+# Push channel (Server-Sent Events at /api/social/events/, ASGI only).
+# The in-process broker only reaches streams served by the same process;
+# swap in a shared broker when running several ASGI workers.
+PUSH_BROKER = 'social.push.InProcessBroker'
+PUSH_KEEPALIVE = 15  # seconds between keepalive comments
+
+# MC API: Discord UID -> (user, wallet) resolution cache
+MC_RESOLVER_CACHE_SIZE = 10000
+MC_RESOLVER_CACHE_TTL = 300  # seconds
+
+# Per-view metrics (core.metrics), served to staff at /api/metrics/ in
+# Prometheus text format. Latency histogram buckets, in seconds:
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Bank history: a balance checkpoint is written every this many ledger
+# entries per wallet, bounding the work to show a running balance
+BANK_CHECKPOINT_INTERVAL = 100
+
 # Logging Configuration
 LOGGING = {
     'version': 1,
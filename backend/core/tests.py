@@ -0,0 +1,115 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from social.models import FriendRequest, Friendship
+from social.views import FriendListView
+from .metrics import view_metrics
+from .middleware import ReplicaRoutingMiddleware
+from .replication import replicate
+from .routers import PrimaryReplicaRouter, reads_primary
+
+User = get_user_model()
+
+class ViewMetricsTests(TestCase):
+    def setUp(self):
+        view_metrics.reset()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.staff = User.objects.create_user(username='admin', password='password123', email='admin@example.com',
+                                              is_staff=True)
+
+    def test_records_views_and_serves_prometheus_text(self):
+        self.client.force_authenticate(user=self.user)
+        for _ in range(3):
+            self.client.get('/api/social/friends/')
+        self.assertEqual(self.client.get('/api/metrics/').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.staff)
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+
+        labels = 'view="api/social/friends/",method="GET"'
+        self.assertIn(f'django_view_latency_seconds_count{{{labels}}} 3', body)
+        self.assertIn(f'django_view_latency_seconds_bucket{{{labels},le="+Inf"}} 3', body)
+        self.assertIn(f'django_view_responses_total{{{labels},status="2xx"}} 3', body)
+        self.assertIn('view="api/metrics/",method="GET",status="4xx"} 1', body)
+        queries = next(line for line in body.splitlines() if line.startswith(f'django_view_db_queries_sum{{{labels}}}'))
+        self.assertGreater(float(queries.split()[-1]), 0)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    # A test-only alias from settings, kept in sync by core.replication
+    databases = {'default', 'test_replica'}
+
+    def setUp(self):
+        override = self.settings(DATABASE_REPLICAS=['test_replica'])
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user1 = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.user2 = User.objects.create_user(username='user2', password='password123', email='user2@example.com')
+        replicate()
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user1)
+
+    def friend_ids(self, client=None):
+        return [friend['id'] for friend in (client or self.client).get('/api/social/friends/').data]
+
+    def test_safe_reads_use_the_replica(self):
+        Friendship.link(self.user1.id, self.user2.id)
+        self.assertEqual(self.friend_ids(), [])
+        # Views that did not opt in keep reading the primary
+        self.assertEqual(self.client.get('/api/social/friends/requests/').status_code, status.HTTP_200_OK)
+
+        replicate()
+        self.assertEqual(self.friend_ids(), [self.user2.id])
+
+    def test_user_reads_own_writes_from_every_client(self):
+        request = FriendRequest.objects.create(from_user=self.user2, to_user=self.user1)
+        self.client.patch(f'/api/social/friends/requests/{request.id}/', {'status': 'accepted'})
+        self.assertTrue(reads_primary(self.user1.id))
+        self.assertEqual(self.friend_ids(), [self.user2.id])
+
+        other = APIClient()
+        other.force_authenticate(user=self.user1)
+        self.assertEqual(self.friend_ids(other), [self.user2.id])
+
+    def test_event_recipients_read_the_primary(self):
+        request = FriendRequest.objects.create(from_user=self.user2, to_user=self.user1)
+        cache.clear()
+        self.client.patch(f'/api/social/friends/requests/{request.id}/', {'status': 'accepted'})
+
+        # user2 only hears about the acceptance, and reloads right away
+        other = APIClient()
+        other.force_authenticate(user=self.user2)
+        self.assertEqual(self.friend_ids(other), [self.user1.id])
+
+    def test_writes_without_replicas_pin_nobody(self):
+        with self.settings(DATABASE_REPLICAS=[]):
+            request = FriendRequest.objects.create(from_user=self.user2, to_user=self.user1)
+            self.client.patch(f'/api/social/friends/requests/{request.id}/', {'status': 'accepted'})
+            self.assertFalse(reads_primary(self.user1.id))
+            self.assertEqual(self.friend_ids(), [self.user2.id])
+
+
+class ReplicaSelectionTests(SimpleTestCase):
+    def test_one_replica_serves_the_whole_request(self):
+        aliases = set()
+        view = FriendListView.as_view()
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            aliases.update(PrimaryReplicaRouter().db_for_read(User) for _ in range(20))
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        with self.settings(DATABASE_REPLICAS=['replica1', 'replica2']):
+            middleware(RequestFactory().get('/api/social/friends/'))
+        self.assertEqual(len(aliases), 1)
+        self.assertTrue(aliases <= {'replica1', 'replica2'})
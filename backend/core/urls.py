@@ -16,11 +16,14 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from .views import get_csrf_token
+from users.views import CachedUserDetailsView
+from .views import get_csrf_token, MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/csrf/', get_csrf_token, name='csrf'),
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
+    path('api/auth/user/', CachedUserDetailsView.as_view(), name='rest_user_details'),  # Shadows dj-rest-auth's view
     path('api/auth/', include('dj_rest_auth.urls')),
     path('api/auth/registration/', include('dj_rest_auth.registration.urls')),
     path('api/auth/social/', include('allauth.socialaccount.urls')), # For social auth callbacks
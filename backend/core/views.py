@@ -1,6 +1,9 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.middleware.csrf import get_token
 from django.views.decorators.http import require_http_methods
+from rest_framework import permissions, views
+
+from .metrics import view_metrics
 
 @require_http_methods(["GET"])
 def get_csrf_token(request):
@@ -9,3 +12,10 @@ def get_csrf_token(request):
     """
     csrf_token = get_token(request)
     return JsonResponse({'csrfToken': csrf_token})
+
+class MetricsView(views.APIView):
+    """Per-view request metrics of this process, in Prometheus text format. Staff only."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(view_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
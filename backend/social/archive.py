@@ -0,0 +1,269 @@
+import json
+import zlib
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils.dateparse import parse_datetime
+
+from .models import ArchiveSegment, ArchiveSegmentAttachment, Attachment, AttachmentBlob, Message, ReadWatermark
+
+User = get_user_model()
+
+DEFAULT_SEGMENT_SIZE = 500
+
+
+def conversation_pair(user_id, other_user_id):
+    user_id, other_user_id = int(user_id), int(other_user_id)
+    return min(user_id, other_user_id), max(user_id, other_user_id)
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def _record(message):
+    reply = message.reply_to
+    return {
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'receiver_id': message.receiver_id,
+        'content': message.content,
+        'timestamp': _isoformat(message.timestamp),
+        'forwarded_from_id': message.forwarded_from_id,
+        # Snapshot of the quoted message, so the segment reads on its own
+        'reply_to': {
+            'id': reply.id,
+            'sender_id': reply.sender_id,
+            'content': reply.content,
+            'timestamp': _isoformat(reply.timestamp),
+        } if reply else None,
+        'attachments': [
+            {
+                'id': attachment.id,
+                'file': attachment.file.name,
+                'name': attachment.name,
+                'blob_id': attachment.blob_id,
+                'uploaded_at': _isoformat(attachment.uploaded_at),
+            }
+            for attachment in message.attachments.all()
+        ],
+    }
+
+
+def encode_segment(records):
+    return zlib.compress(json.dumps(records, separators=(',', ':')).encode(), 6)
+
+
+def decode_segment(data):
+    records = json.loads(zlib.decompress(bytes(data)))
+    for record in records:
+        record['timestamp'] = parse_datetime(record['timestamp'])
+    return records
+
+
+def _read_up_to():
+    """The receiver's read watermark for the sender of the message being filtered."""
+    return Coalesce(Subquery(ReadWatermark.objects.filter(
+        reader_id=OuterRef('receiver_id'), partner_id=OuterRef('sender_id')
+    ).values('last_read_id')[:1]), 0)
+
+
+def archivable_messages(cutoff):
+    """
+    Read messages older than cutoff. Messages that a newer or unread message
+    still replies to stay in the hot table, so no live reply loses its quote.
+    """
+    unread_replies = Message.objects.filter(reply_to=OuterRef('pk'), id__gt=_read_up_to())
+    return Message.objects.filter(timestamp__lt=cutoff, id__lte=_read_up_to()).exclude(
+        replies__timestamp__gte=cutoff
+    ).exclude(Exists(unread_replies))
+
+
+def archive_messages(cutoff, segment_size=DEFAULT_SEGMENT_SIZE):
+    """
+    Moves archivable messages into ArchiveSegment rows, one conversation at a
+    time and at most segment_size messages per segment. Segments are only
+    ever appended; later runs add new ones next to the old.
+
+    Attachment rows go into the segment too, but the blob references they hold
+    are kept, so the files stay on disk until the conversation is purged.
+    Returns (messages archived, segments written).
+    """
+    candidates = archivable_messages(cutoff)
+    pairs = candidates.annotate(
+        low=Least('sender_id', 'receiver_id'), high=Greatest('sender_id', 'receiver_id')
+    ).values_list('low', 'high').distinct().order_by()
+
+    archived = segments = 0
+    for low, high in list(pairs):
+        conversation = candidates.filter(
+            Q(sender_id=low, receiver_id=high) | Q(sender_id=high, receiver_id=low)
+        )
+        while True:
+            count = archive_batch(conversation, low, high, segment_size)
+            if not count:
+                break
+            archived += count
+            segments += 1
+    return archived, segments
+
+
+def archive_batch(conversation, low, high, segment_size):
+    with transaction.atomic():
+        batch = list(
+            conversation.select_related('reply_to').prefetch_related('attachments')
+            .order_by('timestamp', 'id')[:segment_size]
+        )
+        if not batch:
+            return 0
+        segment = ArchiveSegment.objects.create(
+            user_low_id=low,
+            user_high_id=high,
+            first_timestamp=batch[0].timestamp,
+            first_id=batch[0].id,
+            last_timestamp=batch[-1].timestamp,
+            last_id=batch[-1].id,
+            min_id=min(message.id for message in batch),
+            max_id=max(message.id for message in batch),
+            message_count=len(batch),
+            data=encode_segment([_record(message) for message in batch]),
+        )
+        ArchiveSegmentAttachment.objects.bulk_create([
+            ArchiveSegmentAttachment(segment=segment, blob_id=attachment.blob_id,
+                                     file='' if attachment.blob_id else attachment.file.name)
+            for message in batch for attachment in message.attachments.all()
+        ])
+
+        ids = [message.id for message in batch]
+        # Only other archived messages can still quote these; they were snapshotted
+        Message.objects.filter(reply_to_id__in=ids).update(reply_to=None)
+        # Raw deletes skip post_delete, which would release the blob references
+        # the segment now holds
+        attachments = Attachment.objects.filter(message_id__in=ids)
+        attachments._raw_delete(attachments.db)
+        messages = Message.objects.filter(id__in=ids)
+        messages._raw_delete(messages.db)
+    return len(batch)
+
+
+def _key(record):
+    return record['timestamp'], record['id']
+
+
+class ArchivedConversation:
+    """
+    Read access to the archived part of one conversation, for the history
+    pagination. Records are turned back into unsaved Message instances that
+    MessageSerializer renders like live ones.
+    """
+
+    def __init__(self, user_id, other_user_id):
+        self.user_low, self.user_high = conversation_pair(user_id, other_user_id)
+
+    def segments(self):
+        return ArchiveSegment.objects.filter(user_low_id=self.user_low, user_high_id=self.user_high)
+
+    def find(self, message_id):
+        segments = self.segments().filter(min_id__lte=message_id, max_id__gte=message_id)
+        for data in segments.values_list('data', flat=True):
+            for record in decode_segment(data):
+                if record['id'] == message_id:
+                    return record
+        return None
+
+    def before(self, key, limit, floor=None):
+        """
+        Up to limit records older than key, or the newest ones when key is None
+        (newest first), skipping anything at or below floor.
+        """
+        segments = self.segments()
+        if key is not None:
+            timestamp, message_id = key
+            segments = segments.filter(
+                Q(first_timestamp__lt=timestamp) | Q(first_timestamp=timestamp, first_id__lt=message_id)
+            )
+        if floor is not None:
+            segments = segments.filter(
+                Q(last_timestamp__gt=floor[0]) | Q(last_timestamp=floor[0], last_id__gt=floor[1])
+            )
+        segments = segments.order_by('-last_timestamp', '-last_id')
+        return self._collect(
+            segments, lambda record: key is None or _key(record) < key, limit, reverse=True, bound='last'
+        )
+
+    def after(self, key, limit, ceiling=None):
+        """Up to limit records newer than key (oldest first), skipping anything at or above ceiling."""
+        timestamp, message_id = key
+        segments = self.segments().filter(
+            Q(last_timestamp__gt=timestamp) | Q(last_timestamp=timestamp, last_id__gt=message_id)
+        )
+        if ceiling is not None:
+            segments = segments.filter(
+                Q(first_timestamp__lt=ceiling[0]) | Q(first_timestamp=ceiling[0], first_id__lt=ceiling[1])
+            )
+        segments = segments.order_by('first_timestamp', 'first_id')
+        return self._collect(segments, lambda record: _key(record) > key, limit, reverse=False, bound='first')
+
+    def _collect(self, segments, matches, limit, reverse, bound):
+        # Segments from different runs may overlap in time, so keep reading
+        # until the next segment cannot beat the records already collected
+        collected = []
+        for segment in segments.only('data', f'{bound}_timestamp', f'{bound}_id').iterator():
+            if len(collected) >= limit:
+                edge = _key(collected[limit - 1])
+                segment_key = (getattr(segment, f'{bound}_timestamp'), getattr(segment, f'{bound}_id'))
+                if (segment_key < edge) if reverse else (segment_key > edge):
+                    break
+            collected.extend(record for record in decode_segment(segment.data) if matches(record))
+            collected.sort(key=_key, reverse=reverse)
+        return collected[:limit]
+
+
+def to_messages(records):
+    """Rebuilds unsaved Message instances (with users, reply and attachments) from archive records."""
+    user_ids = set()
+    blob_ids = set()
+    for record in records:
+        user_ids.update((record['sender_id'], record['receiver_id'], record['forwarded_from_id']))
+        if record['reply_to']:
+            user_ids.add(record['reply_to']['sender_id'])
+        blob_ids.update(attachment['blob_id'] for attachment in record['attachments'])
+    users = User.objects.select_related('social_profile').in_bulk(user_ids - {None})
+    blobs = AttachmentBlob.objects.in_bulk(blob_ids - {None})
+
+    messages = []
+    for record in records:
+        message = Message(
+            id=record['id'],
+            sender=users.get(record['sender_id']),
+            receiver=users.get(record['receiver_id']),
+            content=record['content'],
+            timestamp=record['timestamp'],
+            forwarded_from=users.get(record['forwarded_from_id']),
+        )
+        reply = record['reply_to']
+        if reply and reply['sender_id'] in users:
+            message.reply_to = Message(
+                id=reply['id'],
+                sender=users.get(reply['sender_id']),
+                content=reply['content'],
+                timestamp=parse_datetime(reply['timestamp']),
+            )
+        else:
+            message.reply_to = None
+        message._state.adding = False
+        message._prefetched_objects_cache = {'attachments': [
+            Attachment(
+                id=attachment['id'],
+                message_id=message.id,
+                file=attachment['file'],
+                name=attachment['name'],
+                blob=blobs.get(attachment['blob_id']),
+                uploaded_at=parse_datetime(attachment['uploaded_at']),
+            )
+            for attachment in record['attachments']
+        ]}
+        messages.append(message)
+    return messages
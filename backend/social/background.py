@@ -0,0 +1,31 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='social-background')
+
+
+def run_after_commit(func, *args):
+    """
+    Runs func(*args) off the request path once the current transaction
+    commits, on a single background thread. With BACKGROUND_TASKS_ASYNC off
+    (e.g. in tests) it runs inline on commit instead.
+    """
+    if getattr(settings, 'BACKGROUND_TASKS_ASYNC', True):
+        transaction.on_commit(lambda: _executor.submit(_run, func, *args))
+    else:
+        transaction.on_commit(lambda: func(*args))
+
+
+def _run(func, *args):
+    close_old_connections()
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Background task %s failed", func.__name__)
+    finally:
+        close_old_connections()
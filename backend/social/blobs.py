@@ -0,0 +1,92 @@
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import transaction, IntegrityError
+from django.db.models import F
+
+from .models import AttachmentBlob
+from .purge import queue_file_deletions
+from . import thumbnails
+
+
+class HashingUploadMixin:
+    """
+    Computes the SHA-256 of an upload while Django receives it, so storing it
+    in the blob store needs no second read. The digest ends up on the
+    uploaded file as ``sha256``.
+    """
+
+    def new_file(self, *args, **kwargs):
+        self.hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        passed_on = super().receive_data_chunk(raw_data, start)
+        if passed_on is None:
+            # This handler kept the chunk, so it is the one producing the file
+            self.hasher.update(raw_data)
+        return passed_on
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.hasher.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def file_digest(file):
+    digest = getattr(file, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    file.seek(0)
+    return hasher.hexdigest()
+
+
+def blob_path(digest, filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return f'chat_attachments/blobs/{digest[:2]}/{digest}{ext}'
+
+
+def store(file):
+    """
+    Returns the blob holding file's content, with one more reference taken.
+    Bytes are only written when no blob with the same hash exists yet.
+    """
+    digest = file_digest(file)
+    if AttachmentBlob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1):
+        return AttachmentBlob.objects.get(sha256=digest)
+
+    name = default_storage.save(blob_path(digest, file.name), file)
+    try:
+        with transaction.atomic():
+            blob = AttachmentBlob.objects.create(sha256=digest, file=name, size=file.size, ref_count=1)
+    except IntegrityError:
+        # Same content stored concurrently; keep theirs
+        default_storage.delete(name)
+        AttachmentBlob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1)
+        return AttachmentBlob.objects.get(sha256=digest)
+    thumbnails.schedule(blob.id)
+    return blob
+
+
+def release(blob_id):
+    """Drops one reference; the blob and its file go away with the last one."""
+    AttachmentBlob.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    blob = AttachmentBlob.objects.filter(pk=blob_id, ref_count=0).first()
+    if blob is None:
+        return
+    if AttachmentBlob.objects.filter(pk=blob_id, ref_count=0).delete()[0]:
+        queue_file_deletions([blob.file.name, blob.thumbnail.name])
@@ -0,0 +1,121 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Q, prefetch_related_objects
+
+from allauth.socialaccount.models import SocialAccount
+
+from .models import UnreadCounter, MutedUser, BlockedUser, ReadWatermark
+from .presence import tracker
+
+User = get_user_model()
+
+AVATAR_PROVIDERS = ('discord', 'google')
+
+
+class UserRelationLoader:
+    """
+    Resolves the per-viewer data UserSerializer needs (avatar, unread count,
+    mute/block flags, presence and social_profile) for many users at once,
+    and the read watermarks MessageSerializer compares message ids with.
+
+    One loader lives in the serializer context for the whole request, so a page
+    of N users costs a fixed number of queries instead of ~5 per user.
+    """
+
+    def __init__(self, viewer=None):
+        self.viewer = viewer if viewer is not None and viewer.is_authenticated else None
+        self._loaded = set()
+        self._avatars = {}
+        self._unread = {}
+        self._muted = set()
+        self._blocked = set()
+        self._presence = {}
+        self._watermarks = {}
+        self._watermark_partners = set()
+
+    def load(self, users):
+        users = [u for u in users if u is not None]
+        missing = {u.pk for u in users} - self._loaded
+        if not missing:
+            return
+
+        without_profile = [u for u in users if u.pk in missing and not User.social_profile.is_cached(u)]
+        if without_profile:
+            prefetch_related_objects(without_profile, 'social_profile')
+
+        self._presence.update(tracker.last_seen_many(missing))
+
+        accounts = SocialAccount.objects.filter(
+            user_id__in=missing, provider__in=AVATAR_PROVIDERS
+        ).order_by('pk')
+        by_user = {}
+        for account in accounts:
+            by_user.setdefault(account.user_id, {}).setdefault(account.provider, account)
+        for user_id, providers in by_user.items():
+            for provider in AVATAR_PROVIDERS:
+                if provider in providers:
+                    self._avatars[user_id] = providers[provider].get_avatar_url()
+                    break
+
+        if self.viewer is not None:
+            self._unread.update(UnreadCounter.objects.filter(
+                receiver=self.viewer, sender_id__in=missing, count__gt=0
+            ).values_list('sender_id', 'count'))
+
+            self._muted.update(MutedUser.objects.filter(
+                muter=self.viewer, muted_id__in=missing
+            ).values_list('muted_id', flat=True))
+            self._blocked.update(BlockedUser.objects.filter(
+                blocker=self.viewer, blocked_id__in=missing
+            ).values_list('blocked_id', flat=True))
+
+        self._loaded |= missing
+
+    def avatar(self, user):
+        self.load([user])
+        return self._avatars.get(user.pk)
+
+    def last_activity(self, user):
+        self.load([user])
+        if user.pk in self._presence:
+            return self._presence[user.pk]
+        if hasattr(user, 'social_profile'):
+            return user.social_profile.last_activity
+        return None
+
+    def unread_count(self, user):
+        self.load([user])
+        return self._unread.get(user.pk, 0)
+
+    def read_up_to(self, reader_id, partner_id):
+        """Last message id from partner that reader has read, for conversations of the viewer."""
+        if self.viewer is None:
+            return 0
+        other_id = partner_id if reader_id == self.viewer.pk else reader_id
+        if other_id not in self._watermark_partners:
+            # Both directions of the conversation in one query
+            self._watermarks.update(
+                ((reader, partner), last_read_id)
+                for reader, partner, last_read_id in ReadWatermark.objects.filter(
+                    Q(reader=self.viewer, partner_id=other_id) | Q(reader_id=other_id, partner=self.viewer)
+                ).values_list('reader_id', 'partner_id', 'last_read_id')
+            )
+            self._watermark_partners.add(other_id)
+        return self._watermarks.get((reader_id, partner_id), 0)
+
+    def is_muted(self, user):
+        self.load([user])
+        return user.pk in self._muted
+
+    def is_blocked(self, user):
+        self.load([user])
+        return user.pk in self._blocked
+
+
+def get_user_loader(context):
+    """Returns the loader shared by every serializer in this context, creating it on first use."""
+    loader = context.get('user_loader')
+    if loader is None:
+        request = context.get('request')
+        loader = UserRelationLoader(getattr(request, 'user', None))
+        context['user_loader'] = loader
+    return loader
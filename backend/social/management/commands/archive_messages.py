@@ -0,0 +1,27 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from social.archive import archive_messages, DEFAULT_SEGMENT_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Moves read messages older than the retention period into compressed archive segments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Archive messages older than this many days (default: MESSAGE_RETENTION_DAYS).')
+        parser.add_argument('--segment-size', type=int, default=None,
+                            help='Maximum messages per archive segment.')
+
+    def handle(self, *args, **options):
+        days = options['days'] or getattr(settings, 'MESSAGE_RETENTION_DAYS', 180)
+        segment_size = options['segment_size'] or getattr(settings, 'MESSAGE_ARCHIVE_SEGMENT_SIZE', DEFAULT_SEGMENT_SIZE)
+        cutoff = timezone.now() - datetime.timedelta(days=days)
+
+        archived, segments = archive_messages(cutoff, segment_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} messages older than {days} days into {segments} segments.'
+        ))
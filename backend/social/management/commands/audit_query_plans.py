@@ -0,0 +1,148 @@
+import datetime
+
+from allauth.socialaccount.models import SocialAccount
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from bank.models import BalanceCheckpoint, Transaction, Wallet
+from core.query_plans import FULL_SCAN, TEMP_BTREE, explain, find_issues
+from social.archive import ArchivedConversation, archivable_messages
+from social.loaders import AVATAR_PROVIDERS
+from social.models import (
+    Attachment, BlockedUser, ChangeVersion, FriendRequest, Message, MessageTombstone, MutedUser,
+    PendingFileDeletion, ReadWatermark, UnreadCounter,
+)
+from social.search import search_users
+from social.views import conversation_filter
+
+User = get_user_model()
+
+
+def query(label, queryset, allow=(), uses=()):
+    return label, queryset, allow, uses
+
+
+def representative_queries(user, other):
+    """
+    The statements the API runs on every request and the background jobs run
+    per batch, built the way the views and services build them. allow lists
+    issue kinds that are fine by design, with the reason alongside; uses names
+    indexes the plan must go through.
+    """
+    since = timezone.now() - datetime.timedelta(minutes=5)
+    conversation = Message.objects.filter(conversation_filter(user, other.id))
+    # Each direction of a conversation is its own index range; putting the two
+    # in time order takes a sort over the conversation's rows
+    merged_directions = (TEMP_BTREE,)
+    return [
+        query('UserSearchView: trigram search', search_users('user', user),
+              # Matches are counted per user and ranked by computed expressions,
+              # over the few users whose names share every trigram
+              allow=(TEMP_BTREE,)),
+        query('FriendRequestListView: requests', FriendRequest.objects.filter(
+            Q(from_user=user) | Q(to_user=user)
+        ).select_related('from_user__social_profile', 'to_user__social_profile').order_by('-created_at'),
+              # Sent and received requests come from two index ranges; one user's requests
+              allow=(TEMP_BTREE,)),
+        query('versions: pending request counterparts', FriendRequest.objects.filter(
+            Q(from_user_id=user.id) | Q(to_user_id=user.id), status='pending'
+        ).values_list('from_user_id', 'to_user_id'),
+              uses=('friendrequest_from_status_idx', 'friendrequest_to_status_idx')),
+        query('FriendListView: friends', User.objects.filter(friend_of__user=user).select_related('social_profile')),
+        query('UserSerializer: avatars', SocialAccount.objects.filter(
+            user_id__in=[other.id], provider__in=AVATAR_PROVIDERS
+        ).order_by('pk')),
+        query('UserSerializer: unread counts', UnreadCounter.objects.filter(
+            receiver=user, sender_id__in=[other.id], count__gt=0
+        )),
+        query('UserSerializer: muted', MutedUser.objects.filter(muter=user, muted_id__in=[other.id])),
+        query('UserSerializer: blocked', BlockedUser.objects.filter(blocker=user, blocked_id__in=[other.id])),
+        query('conditional GETs: change version', ChangeVersion.objects.filter(user_id=user.id)),
+        query('MessageReadView: newest message acknowledged', Message.objects.filter(
+            receiver=user, sender_id=other.id, id__lte=1
+        ).order_by('-id').values_list('id', flat=True)[:1], uses=('message_received_idx',)),
+        query('UnreadCounter: recount past the watermark', Message.objects.filter(
+            receiver=user, sender_id=other.id, id__gt=1
+        ).values('pk'), uses=('message_received_idx',)),
+        query('MessageSerializer: read watermarks', ReadWatermark.objects.filter(
+            Q(reader=user, partner_id=other.id) | Q(reader_id=other.id, partner=user)
+        ).values_list('reader_id', 'partner_id', 'last_read_id')),
+        query('MessageListView: newest page', conversation.order_by('-timestamp', '-id')[:51],
+              allow=merged_directions),
+        query('MessageListView: page before a message', conversation.filter(
+            Q(timestamp__lt=since) | Q(timestamp=since, id__lt=1)
+        ).order_by('-timestamp', '-id')[:51], allow=merged_directions, uses=('message_conversation_idx',)),
+        query('MessageListView: sync, new messages', conversation.filter(timestamp__gt=since).values_list('id'),
+              uses=('message_conversation_idx',)),
+        query('MessageListView: sync, deletions', MessageTombstone.objects.filter(
+            conversation_filter(user, other.id), deleted_at__gt=since
+        ).values_list('message_id'), uses=('tombstone_conversation_idx',)),
+        query('MessageListView: archived history', ArchivedConversation(user.id, other.id).segments().order_by(
+            '-last_timestamp', '-last_id'
+        ), uses=('archive_conversation_idx',)),
+        query('MessageListView: archived catch-up', ArchivedConversation(user.id, other.id).segments().filter(
+            last_timestamp__gt=since
+        ).order_by('first_timestamp', 'first_id'),
+              # Reading forward from a message in the archive is rare, and a
+              # conversation has only a handful of segments
+              allow=(TEMP_BTREE,)),
+        query('MessageListView: attachments', Attachment.objects.filter(message_id__in=[1, 2])),
+        query('TransactionListView: history page', Transaction.objects.filter(user=user).order_by(
+            '-created_at', '-id'
+        )[:21], uses=('transaction_history_idx',)),
+        query('TransactionListView: running balance anchor', BalanceCheckpoint.objects.filter(
+            user_id=user.id, transaction_id__gte=1
+        ).order_by('transaction_id').values_list('transaction_id', 'balance')[:1], uses=('checkpoint_user_idx',)),
+        query('bank services: newest entry', Transaction.objects.filter(user_id=user.id).order_by('-id').values_list(
+            'id', flat=True
+        )[:1]),
+        query('MC API: discord account', SocialAccount.objects.filter(provider='discord', uid='1')),
+        query('MC API: wallet', Wallet.objects.filter(user_id=user.id)),
+        query('reconcile_ledger: wallets to check', Wallet.objects.filter(
+            needs_reconciliation=True, id__gt=0
+        ).order_by('id')[:500], uses=('wallet_unreconciled_idx',)),
+        query('archive_messages: candidates', archivable_messages(timezone.now()), uses=('message_timestamp_idx',)),
+        query('purge_files: queue head', PendingFileDeletion.objects.order_by('id')[:500],
+              # Drains the queue from the front: reads the first rows and stops
+              allow=(FULL_SCAN,)),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the representative queries of the API views and background jobs through EXPLAIN QUERY PLAN '
+        'and reports full scans and temp B-tree sorts, so a missing or unused index shows up mechanically.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not only flagged ones.')
+        parser.add_argument('--strict', action='store_true', help='Exit with an error when anything is flagged.')
+
+    def handle(self, *args, **options):
+        # Plans do not depend on the rows existing; unsaved users only supply ids
+        user, other = User(id=1, username='user1'), User(id=2, username='user2')
+        flagged = 0
+        queries = representative_queries(user, other)
+        for label, queryset, allow, uses in queries:
+            try:
+                plan = explain(queryset)
+            except NotImplementedError as error:
+                raise CommandError(str(error))
+            issues = find_issues(plan, allow, uses)
+            flagged += bool(issues)
+            if issues:
+                self.stdout.write(self.style.WARNING(f'{label}:'))
+                for kind, detail in issues:
+                    self.stdout.write(self.style.WARNING(f'  {kind}: {detail}'))
+            elif options['verbose_plans']:
+                self.stdout.write(f'{label}: ok')
+            if issues or options['verbose_plans']:
+                for depth, detail in plan:
+                    self.stdout.write(f"    {'  ' * depth}{detail}")
+
+        summary = f'{len(queries)} queries checked, {flagged} flagged.'
+        if flagged and options['strict']:
+            raise CommandError(summary)
+        self.stdout.write(self.style.WARNING(summary) if flagged else self.style.SUCCESS(summary))
@@ -0,0 +1,300 @@
+import http.client
+import json
+import random
+import re
+import statistics
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from bank.models import Transaction
+from social.models import Friendship, Message
+
+User = get_user_model()
+
+METRIC_LINE = re.compile(r'^(django_view_db_queries_(?:sum|count))\{view="([^"]*)",method="([^"]*)"\} (\S+)$')
+
+
+class Client:
+    """
+    One keep-alive HTTP connection, like a single browser tab or game server.
+    Revalidates GETs with the last ETag seen per path, as a browser cache does.
+    """
+
+    def __init__(self, base_url, cookie=None, token=None):
+        parts = urlsplit(base_url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        self.etags = {}
+        self.headers = {'Accept': 'application/json'}
+        if cookie:
+            self.headers['Cookie'] = cookie
+        if token:
+            self.headers['Authorization'] = f'Bearer {token}'
+
+    def request(self, method, path, body=None):
+        headers = dict(self.headers)
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if method == 'GET' and path in self.etags:
+            headers['If-None-Match'] = self.etags[path]
+        try:
+            self.connection.request(method, path, payload, headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            raise
+        if method == 'GET' and response.status == 200 and response.getheader('ETag'):
+            self.etags[path] = response.getheader('ETag')
+        return response.status, data
+
+
+class Command(BaseCommand):
+    help = (
+        'Replays the polling traffic of the chat and friends list plus Minecraft bank calls against '
+        'a running server, then reports latency percentiles, throughput and queries per request. '
+        'Run generate_dataset first; with the same seed and request count, runs are comparable across commits.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000')
+        parser.add_argument('--prefix', default='bench_', help='Username prefix used by generate_dataset.')
+        parser.add_argument('--clients', type=int, default=20, help='Simulated users polling at once.')
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Polling steps to replay (a friends list reload is four requests).')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Write results as JSON to this file.')
+        parser.add_argument('--compare', help='Earlier JSON results to compare against.')
+
+    def handle(self, *args, **options):
+        self.base_url = options['url'].rstrip('/')
+        rng = random.Random(options['seed'])
+        users = list(User.objects.filter(username__startswith=options['prefix'], is_staff=False).order_by('id'))
+        staff = User.objects.filter(username__startswith=options['prefix'], is_staff=True).first()
+        if len(users) < 2 or staff is None:
+            raise CommandError('No generated dataset found; run generate_dataset first.')
+
+        plan = self.build_plan(rng, users, options['clients'], options['requests'])
+        before = self.scrape_queries(staff)
+        samples, elapsed = self.run(plan)
+        after = self.scrape_queries(staff)
+
+        results = self.summarize(samples, elapsed, before, after, users, options)
+        self.report(results)
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                self.compare(json.load(baseline), results)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+
+    def build_plan(self, rng, users, clients, total):
+        """
+        A fixed request schedule per simulated user, mirroring the frontend:
+        ChatWindow syncs every 3s and FriendsList reloads four endpoints every
+        5s, so five chat syncs go out for every three friends list reloads.
+        """
+        chosen = rng.sample(users, min(clients, len(users)))
+        sessions = []
+        for user in chosen:
+            friend_ids = list(Friendship.friend_ids(user.id))
+            partner = rng.choice(friend_ids) if friend_ids else rng.choice(users).id
+            cookie = f"{settings.REST_AUTH['JWT_AUTH_COOKIE']}={AccessToken.for_user(user)}"
+            sessions.append({'user': user, 'partner': partner, 'cookie': cookie, 'watermark': '', 'acknowledged': 0})
+
+        cycle = ['chat', 'friends', 'chat', 'friends', 'chat', 'chat', 'friends', 'chat', 'mc']
+        plan = []
+        while len(plan) < total:
+            for session in sessions:
+                plan.append((session, cycle[len(plan) // len(sessions) % len(cycle)], rng.random()))
+        return plan[:total]
+
+    def run(self, plan):
+        samples = []
+        lock = threading.Lock()
+
+        def worker(session_items):
+            clients = {}
+            for session, kind, roll in session_items:
+                # The game server talks to the API with its key, the browser with the JWT cookie
+                key = 'mc' if kind == 'mc' else 'web'
+                if key not in clients:
+                    clients[key] = self.client_for(session, key)
+                requests = self.requests_for(session, kind, roll)
+                while requests:
+                    label, method, path, body = requests.pop(0)
+                    start = time.perf_counter()
+                    try:
+                        status, data = clients[key].request(method, path, body)
+                    except (OSError, http.client.HTTPException):
+                        status, data = 0, b''
+                        clients[key] = self.client_for(session, key)
+                    seconds = time.perf_counter() - start
+                    if label == 'chat sync' and status == 200:
+                        requests += self.after_sync(session, json.loads(data))
+                    with lock:
+                        samples.append((label, status, seconds))
+
+        # Each simulated user is served by one thread, in order, like a real tab
+        by_session = defaultdict(list)
+        for item in plan:
+            by_session[item[0]['user'].id].append(item)
+        threads = [threading.Thread(target=worker, args=(items,)) for items in by_session.values()]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, time.perf_counter() - start
+
+    def client_for(self, session, key):
+        if key == 'mc':
+            return Client(self.base_url, token=settings.MC_API_KEY)
+        return Client(self.base_url, cookie=session['cookie'])
+
+    def requests_for(self, session, kind, roll):
+        if kind == 'chat':
+            query = urlencode({'user_id': session['partner'], 'since': session['watermark']})
+            return [('chat sync', 'GET', f'/api/social/messages/?{query}', None)]
+        if kind == 'friends':
+            return [
+                ('friends', 'GET', '/api/social/friends/', None),
+                ('friend requests', 'GET', '/api/social/friends/requests/', None),
+                ('profile settings', 'GET', '/api/social/profile/settings/', None),
+                ('current user', 'GET', '/api/social/me/', None),
+            ]
+        discord_id = session['user'].username
+        if roll < 0.6:
+            return [('mc balance', 'GET', f'/api/bank/mc/balance/{discord_id}/', None)]
+        if roll < 0.9:
+            return [('mc deposit', 'POST', '/api/bank/mc/deposit/', {'discord_id': discord_id, 'amount': 1})]
+        return [('mc batch', 'POST', '/api/bank/mc/batch/', {'operations': [
+            {'type': 'deposit', 'discord_id': discord_id, 'amount': 1} for _ in range(20)
+        ]})]
+
+    def after_sync(self, session, data):
+        """Like ChatWindow, acknowledges new messages from the partner once a sync shows them."""
+        session['watermark'] = data.get('watermark', '')
+        last_read_id = data.get('last_read_id', 0)
+        newest = max((m['id'] for m in data['messages'] if m['sender']['id'] == session['partner']), default=0)
+        if newest <= max(last_read_id, session['acknowledged']):
+            return []
+        session['acknowledged'] = newest
+        return [('chat read', 'POST', '/api/social/messages/read/', {'user_id': session['partner'], 'message_id': newest})]
+
+    def scrape_queries(self, staff):
+        cookie = f"{settings.REST_AUTH['JWT_AUTH_COOKIE']}={AccessToken.for_user(staff)}"
+        try:
+            status, data = Client(self.base_url, cookie=cookie).request('GET', '/api/metrics/')
+        except (OSError, http.client.HTTPException) as error:
+            raise CommandError(f'Cannot reach {self.base_url}: {error}')
+        totals = defaultdict(lambda: [0.0, 0.0])
+        if status != 200:
+            return totals
+        for line in data.decode().splitlines():
+            match = METRIC_LINE.match(line)
+            if match:
+                name, view, method, value = match.groups()
+                totals[f'{method} {view}'][0 if name.endswith('sum') else 1] = float(value)
+        return totals
+
+    def summarize(self, samples, elapsed, before, after, users, options):
+        by_label = defaultdict(list)
+        errors = defaultdict(int)
+        for label, status, seconds in samples:
+            by_label[label].append(seconds)
+            if not (200 <= status < 300 or status == 304):
+                errors[label] += 1
+
+        endpoints = {}
+        for label, timings in sorted(by_label.items()):
+            endpoints[label] = {
+                'requests': len(timings),
+                'errors': errors[label],
+                **percentiles(timings, scale=1000),
+            }
+
+        queries = {}
+        for view, (total, count) in sorted(after.items()):
+            previous_total, previous_count = before.get(view, (0.0, 0.0))
+            if count > previous_count:
+                queries[view] = round((total - previous_total) / (count - previous_count), 2)
+
+        return {
+            'commit': git_commit(),
+            'options': {key: options[key] for key in ('clients', 'requests', 'seed')},
+            'dataset': {
+                'users': len(users),
+                'friendships': Friendship.objects.count() // 2,
+                'messages': Message.objects.count(),
+                'transactions': Transaction.objects.count(),
+            },
+            'elapsed_seconds': round(elapsed, 3),
+            'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else 0,
+            'latency_ms': {'all': percentiles([seconds for _, _, seconds in samples], scale=1000)},
+            'endpoints': endpoints,
+            'queries_per_request': queries,
+        }
+
+    def report(self, results):
+        self.stdout.write(f"Commit {results['commit'] or 'unknown'}, dataset {results['dataset']}")
+        self.stdout.write(f"{results['throughput_rps']} req/s over {results['elapsed_seconds']}s, "
+                          f"latency (ms) {results['latency_ms']['all']}")
+        self.stdout.write(f"{'endpoint':<20}{'requests':>10}{'errors':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for label, row in results['endpoints'].items():
+            self.stdout.write(f"{label:<20}{row['requests']:>10}{row['errors']:>8}"
+                              f"{row['p50']:>10}{row['p95']:>10}{row['p99']:>10}")
+        if results['queries_per_request']:
+            self.stdout.write('Queries per request (server side):')
+            for view, average in results['queries_per_request'].items():
+                self.stdout.write(f'  {average:>8}  {view}')
+        else:
+            self.stdout.write(self.style.WARNING('No server metrics; is ViewMetricsMiddleware enabled?'))
+
+    def compare(self, baseline, results):
+        self.stdout.write(f"Compared with {baseline.get('commit') or 'baseline'}:")
+        for label, row in results['endpoints'].items():
+            old = baseline.get('endpoints', {}).get(label)
+            if not old:
+                continue
+            changes = ', '.join(
+                f"{name} {old[name]} -> {row[name]} ({delta(old[name], row[name])})" for name in ('p50', 'p95', 'p99')
+            )
+            self.stdout.write(f'  {label}: {changes}')
+        for view, average in results['queries_per_request'].items():
+            old = baseline.get('queries_per_request', {}).get(view)
+            if old is not None and old != average:
+                self.stdout.write(f'  queries {view}: {old} -> {average}')
+
+
+def percentiles(values, scale=1):
+    if not values:
+        return {'p50': 0, 'p95': 0, 'p99': 0}
+    if len(values) == 1:
+        return {name: round(values[0] * scale, 2) for name in ('p50', 'p95', 'p99')}
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return {'p50': round(cuts[49] * scale, 2), 'p95': round(cuts[94] * scale, 2), 'p99': round(cuts[98] * scale, 2)}
+
+
+def delta(old, new):
+    if not old:
+        return 'n/a'
+    return f'{(new - old) / old:+.0%}'
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
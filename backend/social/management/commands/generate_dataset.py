@@ -0,0 +1,230 @@
+import datetime
+import hashlib
+import random
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from allauth.socialaccount.models import SocialAccount, SocialApp
+from django.contrib.sites.models import Site
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from bank.models import Transaction, Wallet
+from social.blobs import blob_path
+from social.models import (
+    Attachment, AttachmentBlob, FriendRequest, Friendship, Message, ReadWatermark, SocialProfile, UnreadCounter,
+    UsernameTrigram, sanitize_text,
+)
+from social.search import username_trigrams
+
+User = get_user_model()
+
+BATCH_SIZE = 2000
+PASSWORD = 'benchmark'
+GAMES = ['Minecraft', 'Terraria', 'Factorio', 'Valheim', 'Rust', 'Stardew Valley', '']
+WORDS = ('gg', 'ok', 'lol', 'brb', 'nice', 'where', 'are', 'you', 'base', 'diamonds', 'trade', 'server',
+         'tonight', 'build', 'farm', 'coming', 'wait', 'see', 'that', 'the', 'at', 'spawn', 'yes', 'no')
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    # auto_now_add would stamp every generated row with the current time
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates a synthetic, reproducible dataset: users with a scale-free friend graph, '
+        'conversations, attachments and wallets. Same arguments give the same data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--friends', type=int, default=8,
+                            help='Friendships each new user forms (preferential attachment).')
+        parser.add_argument('--messages', type=int, default=40, help='Mean messages per friendship.')
+        parser.add_argument('--attachment-rate', type=float, default=0.02,
+                            help='Share of messages carrying an attachment.')
+        parser.add_argument('--days', type=int, default=60, help='Spread messages over this many days.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--prefix', default='bench_', help='Username prefix of generated users.')
+        parser.add_argument('--replace', action='store_true', help='Delete users from a previous run first.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        existing = User.objects.filter(username__startswith=prefix)
+        if existing.exists():
+            if not options['replace']:
+                raise CommandError(f'Users named {prefix}* already exist; pass --replace to regenerate them.')
+            existing.delete()
+
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        with transaction.atomic():
+            users = self.create_users(prefix, options['users'])
+            edges = self.create_friendships(users, options['friends'])
+            messages = self.create_messages(edges, options['messages'], options['days'])
+            attachments = self.create_attachments(messages, options['attachment_rate'], prefix)
+            self.create_wallets(users)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(users)} users (+ {prefix}staff), {len(edges)} friendships, '
+            f'{len(messages)} messages and {attachments} attachments. Password: {PASSWORD}'
+        ))
+
+    def create_users(self, prefix, count):
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            [User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password=password) for i in range(count)]
+            + [User(username=f'{prefix}staff', email=f'{prefix}staff@example.com', password=password, is_staff=True)],
+            batch_size=BATCH_SIZE,
+        )
+        everyone = list(User.objects.filter(username__startswith=prefix).order_by('id'))
+        users = [user for user in everyone if not user.is_staff]
+
+        # bulk_create skips the signals that normally create these
+        profiles = []
+        for user in everyone:
+            bio = self.sentence(self.rng.randint(0, 12))
+            game = self.rng.choice(GAMES)
+            profiles.append(SocialProfile(
+                user=user, bio=bio, favorite_game=game,
+                sanitized_bio=sanitize_text(bio), sanitized_favorite_game=sanitize_text(game),
+                banner_color=self.rng.choice(['purple', 'blue', 'green', 'red', 'orange']),
+            ))
+        SocialProfile.objects.bulk_create(profiles, batch_size=BATCH_SIZE)
+        UsernameTrigram.objects.bulk_create(
+            [UsernameTrigram(user=user, trigram=trigram) for user in everyone for trigram in username_trigrams(user.username)],
+            batch_size=BATCH_SIZE, ignore_conflicts=True,
+        )
+        SocialAccount.objects.bulk_create(
+            [SocialAccount(user=user, provider='discord', uid=user.username) for user in users],
+            batch_size=BATCH_SIZE,
+        )
+        # Avatar lookups need the provider app, normally added in the admin
+        if not SocialApp.objects.filter(provider='discord').exists():
+            app = SocialApp.objects.create(provider='discord', name='Discord', client_id=f'{prefix}client')
+            app.sites.add(Site.objects.get_current())
+        return users
+
+    def create_friendships(self, users, per_user):
+        # Preferential attachment: popular users keep gaining friends, which
+        # gives the long-tailed friend counts real communities have
+        ids = [user.id for user in users]
+        edges = set()
+        weighted = []
+        for index, user_id in enumerate(ids):
+            chosen = set()
+            while len(chosen) < min(per_user, index):
+                if weighted and self.rng.random() < 0.8:
+                    chosen.add(self.rng.choice(weighted))
+                else:
+                    chosen.add(ids[self.rng.randrange(index)])
+            for friend_id in chosen:
+                edges.add((friend_id, user_id))
+                weighted += [friend_id, user_id]
+
+        requests = [FriendRequest(from_user_id=a, to_user_id=b, status='accepted') for a, b in edges]
+        # A few requests still waiting for an answer
+        for _ in range(len(ids) // 10):
+            a, b = self.rng.sample(ids, 2)
+            if (a, b) not in edges and (b, a) not in edges:
+                requests.append(FriendRequest(from_user_id=a, to_user_id=b, status='pending'))
+        FriendRequest.objects.bulk_create(requests, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        Friendship.objects.bulk_create(
+            [Friendship(user_id=a, friend_id=b) for pair in edges for a, b in (pair, pair[::-1])],
+            batch_size=BATCH_SIZE, ignore_conflicts=True,
+        )
+        return sorted(edges)
+
+    def create_messages(self, edges, mean, days):
+        messages = []
+        span = days * 86400
+        for a, b in edges:
+            # Pareto(1.5) has mean 3: a few chatty pairs, many quiet ones
+            count = min(int(self.rng.paretovariate(1.5) * mean / 3), mean * 20)
+            offsets = sorted(self.rng.uniform(0, span) for _ in range(count))
+            for offset in offsets:
+                sender, receiver = (a, b) if self.rng.random() < 0.5 else (b, a)
+                timestamp = self.now - datetime.timedelta(seconds=span - offset)
+                messages.append(Message(
+                    sender_id=sender, receiver_id=receiver, content=self.sentence(self.rng.randint(1, 15)),
+                    timestamp=timestamp,
+                ))
+
+        with explicit_timestamps(Message._meta.get_field('timestamp')):
+            Message.objects.bulk_create(messages, batch_size=BATCH_SIZE)
+
+        # Ids come back in creation order, so each list runs oldest to newest
+        received = defaultdict(list)
+        for message in messages:
+            received[(message.receiver_id, message.sender_id)].append(message.id)
+        watermarks, counters = [], []
+        for (receiver, sender), ids in received.items():
+            # Readers are caught up except for the last few messages of some conversations
+            unread = min(self.rng.choice((0, 0, 1, 2, 3)), len(ids))
+            if unread < len(ids):
+                watermarks.append(ReadWatermark(reader_id=receiver, partner_id=sender, last_read_id=ids[-unread - 1]))
+            if unread:
+                counters.append(UnreadCounter(receiver_id=receiver, sender_id=sender, count=unread))
+        ReadWatermark.objects.bulk_create(watermarks, batch_size=BATCH_SIZE)
+        UnreadCounter.objects.bulk_create(counters, batch_size=BATCH_SIZE)
+        return messages
+
+    def create_attachments(self, messages, rate, prefix):
+        # A small pool of shared files, so deduplication sees repeats
+        blobs = []
+        for index in range(20):
+            content = f'{prefix} sample attachment {index}\n'.encode() * (index + 1) * 64
+            digest = hashlib.sha256(content).hexdigest()
+            blob = AttachmentBlob.objects.filter(sha256=digest).first()
+            if blob is None:
+                name = default_storage.save(blob_path(digest, 'sample.txt'), ContentFile(content))
+                blob = AttachmentBlob.objects.create(
+                    sha256=digest, file=name, size=len(content), thumbnail_status='unsupported'
+                )
+            blobs.append(blob)
+
+        attachments = []
+        refs = Counter()
+        for message in messages:
+            if self.rng.random() < rate:
+                blob = self.rng.choice(blobs)
+                refs[blob.id] += 1
+                attachments.append(Attachment(
+                    message_id=message.id, file=blob.file.name, name=f'file_{len(attachments)}.txt',
+                    blob=blob, uploaded_at=message.timestamp,
+                ))
+        with explicit_timestamps(Attachment._meta.get_field('uploaded_at')):
+            Attachment.objects.bulk_create(attachments, batch_size=BATCH_SIZE)
+        for blob in blobs:
+            AttachmentBlob.objects.filter(pk=blob.pk).update(ref_count=blob.ref_count + refs[blob.id])
+        return len(attachments)
+
+    def create_wallets(self, users):
+        balances = {user.id: self.rng.randint(0, 5000) for user in users}
+        Wallet.objects.bulk_create(
+            [Wallet(user_id=user_id, balance=balance, entries_since_checkpoint=1 if balance else 0)
+             for user_id, balance in balances.items()],
+            batch_size=BATCH_SIZE,
+        )
+        Transaction.objects.bulk_create(
+            [Transaction(user_id=user_id, amount=balance, transaction_type=Transaction.TransactionType.DEPOSIT,
+                         description='Initial balance')
+             for user_id, balance in balances.items() if balance],
+            batch_size=BATCH_SIZE,
+        )
+
+    def sentence(self, words):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words))
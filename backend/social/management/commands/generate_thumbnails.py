@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from social.models import AttachmentBlob
+from social.thumbnails import generate
+
+
+class Command(BaseCommand):
+    help = 'Builds previews for attachment blobs still waiting for one (e.g. after a restart or for pre-existing uploads).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='Also retry blobs whose preview failed before.')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            AttachmentBlob.objects.filter(thumbnail_status='failed').update(thumbnail_status='pending')
+
+        blob_ids = list(AttachmentBlob.objects.filter(thumbnail_status='pending').values_list('id', flat=True))
+        for blob_id in blob_ids:
+            generate(blob_id)
+
+        statuses = AttachmentBlob.objects.filter(id__in=blob_ids).values_list('thumbnail_status', flat=True)
+        ready = sum(1 for status in statuses if status == 'ready')
+        self.stdout.write(self.style.SUCCESS(f'Processed {len(blob_ids)} blobs, {ready} previews ready.'))
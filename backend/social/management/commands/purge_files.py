@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from social.purge import process_file_deletions
+
+
+class Command(BaseCommand):
+    help = 'Removes attachment files queued for deletion (e.g. left over after a restart).'
+
+    def handle(self, *args, **options):
+        processed = process_file_deletions()
+        self.stdout.write(self.style.SUCCESS(f'Removed {processed} queued files.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from social.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the username trigram index behind user search. Signals keep it current on save; '
+        'run this after changing usernames with bulk updates or raw SQL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per insert.')
+
+    def handle(self, *args, **options):
+        written = rebuild_index(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {written} username trigrams.'))
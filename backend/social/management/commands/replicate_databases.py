@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.replication import replicate
+
+
+class Command(BaseCommand):
+    help = 'Copies the primary database into the read replicas listed in DATABASE_REPLICAS, once or every few seconds.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Keep copying every this many seconds; keep it below DATABASE_REPLICA_LAG.')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas configured; set DATABASE_REPLICAS.')
+        interval = options['interval']
+        if interval and interval >= settings.DATABASE_REPLICA_LAG:
+            self.stdout.write(self.style.WARNING(
+                f'Copying every {interval}s while clients stay on the primary for only '
+                f'{settings.DATABASE_REPLICA_LAG}s after a write; they may read stale data.'
+            ))
+        while True:
+            started = time.monotonic()
+            aliases = replicate()
+            self.stdout.write(f"Copied the primary into {', '.join(aliases)} in {time.monotonic() - started:.2f}s.")
+            if not interval:
+                return
+            time.sleep(max(interval - (time.monotonic() - started), 0))
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0008_alter_attachment_file_muteduser'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'receiver', 'timestamp'], name='message_conversation_idx'),
+        ),
+    ]
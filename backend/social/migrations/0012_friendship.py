@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_friendships(apps, schema_editor):
+    FriendRequest = apps.get_model('social', 'FriendRequest')
+    Friendship = apps.get_model('social', 'Friendship')
+    rows = []
+    for from_user_id, to_user_id in FriendRequest.objects.filter(status='accepted').values_list('from_user_id', 'to_user_id'):
+        rows.append(Friendship(user_id=from_user_id, friend_id=to_user_id))
+        rows.append(Friendship(user_id=to_user_id, friend_id=from_user_id))
+    Friendship.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0011_unreadcounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Friendship',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('friend', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friend_of', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friendships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'friend')},
+            },
+        ),
+        migrations.RunPython(backfill_friendships, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_trigrams(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UsernameTrigram = apps.get_model('social', 'UsernameTrigram')
+    rows = []
+    for user_id, username in User.objects.values_list('id', 'username').iterator():
+        username = username.lower()
+        for trigram in {username[i:i + 3] for i in range(len(username) - 2)}:
+            rows.append(UsernameTrigram(user_id=user_id, trigram=trigram))
+    UsernameTrigram.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0012_friendship'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsernameTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='username_trigrams', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('trigram', 'user')},
+            },
+        ),
+        migrations.RunPython(backfill_trigrams, migrations.RunPython.noop),
+    ]
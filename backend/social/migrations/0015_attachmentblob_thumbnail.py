@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0014_attachmentblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachmentblob',
+            name='thumbnail',
+            field=models.FileField(blank=True, upload_to='chat_attachments/thumbnails/'),
+        ),
+        migrations.AddField(
+            model_name='attachmentblob',
+            name='thumbnail_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed'), ('unsupported', 'Unsupported')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0016_pendingfiledeletion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_timestamp', models.DateTimeField()),
+                ('first_id', models.PositiveBigIntegerField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('last_id', models.PositiveBigIntegerField()),
+                ('min_id', models.PositiveBigIntegerField()),
+                ('max_id', models.PositiveBigIntegerField()),
+                ('message_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_low', 'user_high', 'last_timestamp'], name='archive_conversation_idx')],
+            },
+        ),
+    ]
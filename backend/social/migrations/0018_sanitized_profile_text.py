@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:10
+
+import bleach
+from django.db import migrations, models
+
+
+def backfill_sanitized_text(apps, schema_editor):
+    SocialProfile = apps.get_model('social', 'SocialProfile')
+    batch = []
+    for profile in SocialProfile.objects.only('id', 'bio', 'favorite_game').iterator():
+        profile.sanitized_bio = bleach.clean(profile.bio or '', tags=[], strip=True)
+        profile.sanitized_favorite_game = bleach.clean(profile.favorite_game or '', tags=[], strip=True)
+        batch.append(profile)
+        if len(batch) >= 1000:
+            SocialProfile.objects.bulk_update(batch, ['sanitized_bio', 'sanitized_favorite_game'])
+            batch = []
+    SocialProfile.objects.bulk_update(batch, ['sanitized_bio', 'sanitized_favorite_game'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0017_archivesegment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='socialprofile',
+            name='sanitized_bio',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='socialprofile',
+            name='sanitized_favorite_game',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill_sanitized_text, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0019_changeversion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='archivesegment',
+            name='archive_conversation_idx',
+        ),
+        migrations.AddIndex(
+            model_name='archivesegment',
+            index=models.Index(fields=['user_low', 'user_high', 'last_timestamp', 'last_id'], name='archive_conversation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(fields=['from_user', 'status'], name='friendrequest_from_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(fields=['to_user', 'status'], name='friendrequest_to_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['receiver', 'sender'], name='message_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['timestamp'], name='message_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Min, Q
+
+
+def backfill_read_watermarks(apps, schema_editor):
+    """
+    Each watermark stops just before the reader's oldest unread message, so
+    nothing unread turns read. Read messages above it count as unread again,
+    and the counters are recomputed to match.
+    """
+    Message = apps.get_model('social', 'Message')
+    ReadWatermark = apps.get_model('social', 'ReadWatermark')
+    UnreadCounter = apps.get_model('social', 'UnreadCounter')
+    rows = Message.objects.values('receiver_id', 'sender_id').annotate(
+        newest=Max('id'), oldest_unread=Min('id', filter=Q(is_read=False))
+    )
+    watermarks = []
+    for row in rows:
+        receiver_id, sender_id = row['receiver_id'], row['sender_id']
+        last_read_id = row['oldest_unread'] - 1 if row['oldest_unread'] else row['newest']
+        watermarks.append(ReadWatermark(reader_id=receiver_id, partner_id=sender_id, last_read_id=last_read_id))
+        if row['oldest_unread']:
+            count = Message.objects.filter(receiver_id=receiver_id, sender_id=sender_id, id__gt=last_read_id).count()
+            UnreadCounter.objects.update_or_create(
+                receiver_id=receiver_id, sender_id=sender_id, defaults={'count': count}
+            )
+    ReadWatermark.objects.bulk_create(watermarks, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0020_query_plan_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_id', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('partner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('reader', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_watermarks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('reader', 'partner')},
+            },
+        ),
+        migrations.RunPython(backfill_read_watermarks, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='message_read_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='message_unread_idx',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='read_at',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['receiver', 'sender'], name='message_received_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:59
+
+import json
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_segment_attachments(apps, schema_editor):
+    ArchiveSegment = apps.get_model('social', 'ArchiveSegment')
+    ArchiveSegmentAttachment = apps.get_model('social', 'ArchiveSegmentAttachment')
+    rows = []
+    for segment_id, data in ArchiveSegment.objects.values_list('id', 'data').iterator():
+        for record in json.loads(zlib.decompress(bytes(data))):
+            for attachment in record['attachments']:
+                rows.append(ArchiveSegmentAttachment(
+                    segment_id=segment_id, blob_id=attachment['blob_id'],
+                    file='' if attachment['blob_id'] else attachment['file'],
+                ))
+    ArchiveSegmentAttachment.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0021_read_watermarks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveSegmentAttachment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.CharField(blank=True, default='', max_length=255)),
+                ('blob', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='social.attachmentblob')),
+                ('segment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='social.archivesegment')),
+            ],
+        ),
+        migrations.RunPython(backfill_segment_attachments, migrations.RunPython.noop),
+    ]
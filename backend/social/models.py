@@ -1,11 +1,18 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.core.exceptions import ValidationError
+import bleach
 import mimetypes
 import os
 
 User = get_user_model()
 
+def sanitize_text(value):
+    """Strips markup from user-written profile text to prevent XSS."""
+    return bleach.clean(value or '', tags=[], strip=True)
+
 class SocialProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='social_profile')
     is_online_hidden = models.BooleanField(default=False)
@@ -14,10 +21,41 @@ class SocialProfile(models.Model):
     bio = models.TextField(max_length=500, blank=True, default='')
     banner_color = models.CharField(max_length=20, default='purple')
     favorite_game = models.CharField(max_length=100, blank=True, default='')
+    # Copies of bio/favorite_game with markup stripped, kept up to date by
+    # save() so serializers can render them as-is
+    sanitized_bio = models.TextField(blank=True, default='', editable=False)
+    sanitized_favorite_game = models.TextField(blank=True, default='', editable=False)
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
+    def save(self, *args, **kwargs):
+        self.sanitized_bio = sanitize_text(self.bio)
+        self.sanitized_favorite_game = sanitize_text(self.favorite_game)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'bio' in update_fields:
+                update_fields.add('sanitized_bio')
+            if 'favorite_game' in update_fields:
+                update_fields.add('sanitized_favorite_game')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
+class UsernameTrigram(models.Model):
+    """
+    Search index over usernames: one row per distinct lowercase trigram of a
+    username. Kept in sync with User by signals; see social.search.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='username_trigrams')
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        unique_together = ('trigram', 'user')
+
+    def __str__(self):
+        return f"{self.trigram} -> {self.user_id}"
+
 class BlockedUser(models.Model):
     blocker = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blocking')
     blocked = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blocked_by')
@@ -52,22 +90,243 @@ class FriendRequest(models.Model):
 
     class Meta:
         unique_together = ('from_user', 'to_user')
+        indexes = [
+            # Pending requests of a user, on either side
+            models.Index(fields=['from_user', 'status'], name='friendrequest_from_status_idx'),
+            models.Index(fields=['to_user', 'status'], name='friendrequest_to_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.from_user} -> {self.to_user} ({self.status})"
 
+class Friendship(models.Model):
+    """
+    Accepted friendships, stored as two rows per pair (a->b and b->a) so that
+    "friends of X" is a single indexed lookup on user. Kept in sync with
+    FriendRequest by signals.
+    """
+    user = models.ForeignKey(User, related_name='friendships', on_delete=models.CASCADE)
+    friend = models.ForeignKey(User, related_name='friend_of', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'friend')
+
+    def __str__(self):
+        return f"{self.user} <-> {self.friend}"
+
+    @classmethod
+    def link(cls, user_id, friend_id):
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, friend_id=friend_id), cls(user_id=friend_id, friend_id=user_id)],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def unlink(cls, user_id, friend_id):
+        cls.objects.filter(
+            models.Q(user_id=user_id, friend_id=friend_id) |
+            models.Q(user_id=friend_id, friend_id=user_id)
+        ).delete()
+
+    @classmethod
+    def friend_ids(cls, user_id):
+        return cls.objects.filter(user_id=user_id).values_list('friend_id', flat=True)
+
+    @classmethod
+    def are_friends(cls, user_id, other_user_id):
+        return cls.objects.filter(user_id=user_id, friend_id=other_user_id).exists()
+
+    @classmethod
+    def mutual_friend_ids(cls, user_id, other_user_id):
+        return cls.objects.filter(
+            user_id=user_id, friend_id__in=cls.friend_ids(other_user_id)
+        ).values_list('friend_id', flat=True)
+
 class Message(models.Model):
     sender = models.ForeignKey(User, related_name='sent_messages', on_delete=models.CASCADE)
     receiver = models.ForeignKey(User, related_name='received_messages', on_delete=models.CASCADE)
     content = models.CharField(max_length=1000, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
     reply_to = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='replies')
     forwarded_from = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='forwarded_messages')
 
+    class Meta:
+        indexes = [
+            # Conversation history: (sender, receiver) pair ordered by time
+            models.Index(fields=['sender', 'receiver', 'timestamp'], name='message_conversation_idx'),
+            # One sender's messages to a reader in id order, which is how read
+            # watermarks are compared and unread counts recomputed
+            models.Index(fields=['receiver', 'sender'], name='message_received_idx'),
+            # archive_messages: everything older than the retention cutoff
+            models.Index(fields=['timestamp'], name='message_timestamp_idx'),
+        ]
+
     def __str__(self):
         return f"From {self.sender} to {self.receiver} at {self.timestamp}"
 
+class ArchiveSegment(models.Model):
+    """
+    Compressed, append-only batch of old messages from one conversation,
+    written by social.archive. user_low/user_high is the ordered user pair.
+    """
+    user_low = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    user_high = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    # Oldest and newest message by (timestamp, id), and the id range inside
+    first_timestamp = models.DateTimeField()
+    first_id = models.PositiveBigIntegerField()
+    last_timestamp = models.DateTimeField()
+    last_id = models.PositiveBigIntegerField()
+    min_id = models.PositiveBigIntegerField()
+    max_id = models.PositiveBigIntegerField()
+    message_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Newest segments first when scrolling back; last_id breaks timestamp ties
+            models.Index(fields=['user_low', 'user_high', 'last_timestamp', 'last_id'], name='archive_conversation_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.message_count} messages between {self.user_low_id} and {self.user_high_id}"
+
+class ArchiveSegmentAttachment(models.Model):
+    """
+    Attachment archived inside a segment, kept outside the compressed data so
+    purging a conversation can release blob references without decoding it.
+    file is only set for attachments from before deduplication, which have no blob.
+    """
+    segment = models.ForeignKey(ArchiveSegment, related_name='attachments', on_delete=models.CASCADE)
+    blob = models.ForeignKey('AttachmentBlob', null=True, blank=True, on_delete=models.PROTECT, related_name='+')
+    file = models.CharField(max_length=255, blank=True, default='')
+
+    def __str__(self):
+        return f"Attachment in segment {self.segment_id}"
+
+class ChangeVersion(models.Model):
+    """
+    Per-user counter bumped whenever something the user's friends list, friend
+    requests, settings or own profile shows changes. Conditional GETs compare
+    it instead of rebuilding the response (see social.versions).
+    """
+    # Not a foreign key: delete signals bump users whose own row is being
+    # deleted in the same transaction; signals drop the row afterwards
+    user_id = models.BigIntegerField(primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"User {self.user_id} at version {self.version}"
+
+    @classmethod
+    def bump(cls, *user_ids):
+        user_ids = {user_id for user_id in user_ids if user_id}
+        if not user_ids:
+            return
+        cls.objects.bulk_create([cls(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+        cls.objects.filter(user_id__in=user_ids).update(version=F('version') + 1)
+
+    @classmethod
+    def current(cls, user_id):
+        return cls.objects.filter(user_id=user_id).values_list('version', flat=True).first() or 0
+
+class UnreadCounter(models.Model):
+    """Number of unread messages receiver has from sender, kept in step with Message writes."""
+    receiver = models.ForeignKey(User, related_name='unread_counters', on_delete=models.CASCADE)
+    sender = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('receiver', 'sender')
+
+    def __str__(self):
+        return f"{self.receiver} has {self.count} unread from {self.sender}"
+
+    @classmethod
+    def increment(cls, receiver_id, sender_id):
+        if not cls.objects.filter(receiver_id=receiver_id, sender_id=sender_id).update(count=F('count') + 1):
+            try:
+                with transaction.atomic():
+                    cls.objects.create(receiver_id=receiver_id, sender_id=sender_id, count=1)
+            except IntegrityError:
+                # Created concurrently by another message
+                cls.objects.filter(receiver_id=receiver_id, sender_id=sender_id).update(count=F('count') + 1)
+        # After the change, so a reader never pairs the new version with old data
+        ChangeVersion.bump(receiver_id)
+
+    @classmethod
+    def decrement(cls, receiver_id, sender_id):
+        if cls.objects.filter(receiver_id=receiver_id, sender_id=sender_id, count__gt=0).update(count=F('count') - 1):
+            ChangeVersion.bump(receiver_id)
+
+    @classmethod
+    def recount(cls, receiver_id, sender_id, last_read_id):
+        """Sets the count to the messages from sender past the receiver's read watermark."""
+        remaining = Message.objects.filter(receiver_id=receiver_id, sender_id=sender_id, id__gt=last_read_id).count()
+        if cls.objects.filter(receiver_id=receiver_id, sender_id=sender_id).exclude(count=remaining).update(
+            count=remaining
+        ):
+            ChangeVersion.bump(receiver_id)
+
+    @classmethod
+    def clear_conversation(cls, user_id, other_user_id):
+        cls.objects.filter(
+            models.Q(receiver_id=user_id, sender_id=other_user_id) |
+            models.Q(receiver_id=other_user_id, sender_id=user_id)
+        ).delete()
+        ChangeVersion.bump(user_id, other_user_id)
+
+class ReadWatermark(models.Model):
+    """
+    How far reader has read their conversation with partner: every message
+    from partner with an id up to last_read_id counts as read. Only moves
+    forward, when the reader acknowledges messages (see MessageReadView).
+    """
+    reader = models.ForeignKey(User, related_name='read_watermarks', on_delete=models.CASCADE)
+    partner = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    last_read_id = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('reader', 'partner')
+
+    def __str__(self):
+        return f"{self.reader} has read {self.partner}'s messages up to {self.last_read_id}"
+
+    @classmethod
+    def advance(cls, reader_id, partner_id, message_id):
+        """Moves the watermark up to message_id; returns whether it moved."""
+        cls.objects.bulk_create([cls(reader_id=reader_id, partner_id=partner_id)], ignore_conflicts=True)
+        return bool(cls.objects.filter(
+            reader_id=reader_id, partner_id=partner_id, last_read_id__lt=message_id
+        ).update(last_read_id=message_id, updated_at=timezone.now()))
+
+    @classmethod
+    def read_up_to(cls, reader_id, partner_id):
+        return cls.objects.filter(
+            reader_id=reader_id, partner_id=partner_id
+        ).values_list('last_read_id', flat=True).first() or 0
+
+class MessageTombstone(models.Model):
+    """
+    Records deletions so delta sync can tell clients which messages to drop.
+    A row without message_id means the whole conversation was cleared.
+    """
+    sender = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    receiver = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    message_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sender', 'receiver', 'deleted_at'], name='tombstone_conversation_idx'),
+        ]
+
+    def __str__(self):
+        target = self.message_id or 'all messages'
+        return f"Deleted {target} between {self.sender} and {self.receiver}"
+
 def validate_file_size(value):
     limit = 15 * 1024 * 1024  # 15 MB
     if value.size > limit:
@@ -113,10 +372,44 @@ def validate_file_type(value):
     if mime_type not in allowed_mime_types:
         raise ValidationError(f'Invalid file type. Allowed types: images, videos, PDF, and text files.')
 
+class AttachmentBlob(models.Model):
+    """
+    Content-addressed file shared by every Attachment with the same bytes.
+    ref_count tracks how many attachments point at it; see social.blobs.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='chat_attachments/blobs/')
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Small preview (image thumbnail or video poster frame), built off the
+    # request path by social.thumbnails
+    thumbnail = models.FileField(upload_to='chat_attachments/thumbnails/', blank=True)
+    thumbnail_status = models.CharField(
+        max_length=20,
+        choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed'), ('unsupported', 'Unsupported')],
+        default='pending'
+    )
+
+    def __str__(self):
+        return f"Blob {self.sha256[:12]} ({self.ref_count} refs)"
+
 class Attachment(models.Model):
     message = models.ForeignKey(Message, related_name='attachments', on_delete=models.CASCADE)
     file = models.FileField(upload_to='chat_attachments/', validators=[validate_file_size, validate_file_type])
+    # Original upload name; file points at the shared blob. Attachments
+    # uploaded before deduplication have no blob and own their file.
+    name = models.CharField(max_length=255, blank=True, default='')
+    blob = models.ForeignKey(AttachmentBlob, null=True, blank=True, on_delete=models.PROTECT, related_name='attachments')
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Attachment for message {self.message.id}"
+
+class PendingFileDeletion(models.Model):
+    """Storage path whose file is waiting to be removed by social.purge."""
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,111 @@
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+from .archive import to_messages
+
+
+class MessageCursorPagination(BasePagination):
+    """
+    Keyset pagination for conversation history, anchored on a message id.
+
+    ?limit=N             -> newest N messages
+    ?before_id=X&limit=N -> N messages right before X (scrolling up)
+    ?after_id=X&limit=N  -> N messages right after X (catching up)
+
+    Pages are returned oldest-first. The cost depends only on the page size,
+    not on how long the conversation is. Without any of these params the view
+    returns the plain, unpaginated list.
+
+    When the view offers get_archive(), archived messages (see social.archive)
+    are merged into the pages, so history reads the same after archiving.
+    """
+    default_limit = 50
+    max_limit = 200
+    cursor_params = ('before_id', 'after_id', 'limit')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not any(param in request.query_params for param in self.cursor_params):
+            return None
+        return self.get_page(queryset, request, view)
+
+    def get_page(self, queryset, request, view=None):
+        """The page the cursor params ask for; the newest page without any."""
+        params = request.query_params
+        self.limit = self.get_limit(request)
+        before_id = self.get_int(params, 'before_id')
+        after_id = self.get_int(params, 'after_id')
+        if before_id is not None and after_id is not None:
+            raise ValidationError({"error": "Use either before_id or after_id, not both"})
+        archive = view.get_archive() if view is not None and hasattr(view, 'get_archive') else None
+
+        if after_id is not None:
+            timestamp = self.get_anchor(queryset, after_id, archive)
+            page = queryset.filter(
+                Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=after_id)
+            ).order_by('timestamp', 'id')[:self.limit + 1]
+            page = list(page)
+            if archive is not None:
+                ceiling = self.key(page[-1]) if len(page) > self.limit else None
+                archived = archive.after((timestamp, after_id), self.limit + 1, ceiling)
+                page = self.merge(page, archived, reverse=False)
+        else:
+            key = None
+            if before_id is not None:
+                timestamp = self.get_anchor(queryset, before_id, archive)
+                key = (timestamp, before_id)
+                queryset = queryset.filter(
+                    Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=before_id)
+                )
+            page = list(queryset.order_by('-timestamp', '-id')[:self.limit + 1])
+            if archive is not None:
+                floor = self.key(page[-1]) if len(page) > self.limit else None
+                archived = archive.before(key, self.limit + 1, floor)
+                page = self.merge(page, archived, reverse=True)
+
+        self.has_more = len(page) > self.limit
+        page = page[:self.limit]
+        if after_id is None:
+            page.reverse()
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            "results": data,
+            "has_more": self.has_more,
+        })
+
+    def get_limit(self, request):
+        limit = self.get_int(request.query_params, 'limit')
+        if limit is None or limit < 1:
+            return self.default_limit
+        return min(limit, self.max_limit)
+
+    def get_int(self, params, name):
+        value = params.get(name)
+        if value is None or value == '':
+            return None
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValidationError({"error": f"{name} must be an integer"})
+
+    def get_anchor(self, queryset, message_id, archive=None):
+        timestamp = queryset.filter(id=message_id).values_list('timestamp', flat=True).first()
+        if timestamp is None and archive is not None:
+            record = archive.find(message_id)
+            timestamp = record['timestamp'] if record else None
+        if timestamp is None:
+            raise NotFound("Message not found")
+        return timestamp
+
+    def key(self, message):
+        return message.timestamp, message.id
+
+    def merge(self, page, records, reverse):
+        if not records:
+            return page
+        merged = page + to_messages(records)
+        merged.sort(key=self.key, reverse=reverse)
+        return merged[:self.limit + 1]
@@ -0,0 +1,90 @@
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Case, When, Value
+from django.utils import timezone
+
+from .models import SocialProfile
+
+CACHE_KEY = 'presence:{}'
+FLUSH_BATCH_SIZE = 500
+
+
+class PresenceTracker:
+    """
+    Keeps users' last activity in the cache and writes it behind to
+    SocialProfile.last_activity in coalesced batches.
+
+    Requests only touch the cache; each process flushes its pending users at
+    most once per PRESENCE_FLUSH_INTERVAL seconds with a single UPDATE.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'PRESENCE_CACHE', 'default')]
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'PRESENCE_FLUSH_INTERVAL', 60)
+
+    def touch(self, user_id):
+        """Records activity; returns True when the user has just come online."""
+        now = timezone.now()
+        with self._lock:
+            previous = self._pending.get(user_id)
+            # Requests within the same few seconds add nothing worth recording
+            if previous and (now - previous).total_seconds() < 5:
+                return False
+            self._pending[user_id] = now
+        came_online = previous is None and not is_recent(self.last_seen(user_id))
+        self.cache.set(CACHE_KEY.format(user_id), now, timeout=self.flush_interval * 15)
+        return came_online
+
+    def last_seen_many(self, user_ids):
+        keys = {CACHE_KEY.format(user_id): user_id for user_id in user_ids}
+        found = self.cache.get_many(list(keys))
+        return {keys[key]: value for key, value in found.items()}
+
+    def last_seen(self, user_id):
+        return self.cache.get(CACHE_KEY.format(user_id))
+
+    def flush_if_due(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        updated = 0
+        items = list(pending.items())
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            batch = items[start:start + FLUSH_BATCH_SIZE]
+            updated += SocialProfile.objects.filter(user_id__in=[user_id for user_id, _ in batch]).update(
+                last_activity=Case(*[When(user_id=user_id, then=Value(seen)) for user_id, seen in batch])
+            )
+        if updated < len(pending):
+            existing = set(SocialProfile.objects.filter(user_id__in=pending).values_list('user_id', flat=True))
+            SocialProfile.objects.bulk_create(
+                [SocialProfile(user_id=user_id) for user_id in pending if user_id not in existing],
+                ignore_conflicts=True,
+            )
+        return len(pending)
+
+
+tracker = PresenceTracker()
+
+
+def is_recent(last_activity):
+    return last_activity is not None and (timezone.now() - last_activity) < datetime.timedelta(minutes=5)
@@ -0,0 +1,133 @@
+from collections import Counter, defaultdict
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Greatest
+
+from .archive import ArchivedConversation
+from .background import run_after_commit
+from .models import ArchiveSegmentAttachment, Attachment, AttachmentBlob, Message, PendingFileDeletion
+
+BATCH_SIZE = 500
+
+
+def _chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def queue_file_deletions(names):
+    """
+    Records storage paths to remove and drains the queue in the background
+    after commit. Files are only touched once the rows that pointed at them
+    are gone for good, so a rolled-back purge never loses data.
+    """
+    names = [name for name in names if name]
+    if not names:
+        return
+    PendingFileDeletion.objects.bulk_create(
+        [PendingFileDeletion(name=name) for name in names], batch_size=BATCH_SIZE
+    )
+    run_after_commit(process_file_deletions)
+
+
+def process_file_deletions(batch_size=BATCH_SIZE):
+    """Removes queued files batch by batch. Returns how many were processed."""
+    processed = 0
+    while True:
+        batch = list(PendingFileDeletion.objects.order_by('id').values_list('id', 'name')[:batch_size])
+        if not batch:
+            return processed
+        for _, name in batch:
+            try:
+                default_storage.delete(name)
+            except OSError:
+                pass  # Already gone or unreachable; nothing left to reclaim
+        PendingFileDeletion.objects.filter(id__in=[pk for pk, _ in batch]).delete()
+        processed += len(batch)
+
+
+def _blob_references(attachments):
+    """Blob references (grouped per blob) and unshared file paths held by attachment rows."""
+    refs = Counter(dict(
+        attachments.filter(blob__isnull=False).values_list('blob_id').annotate(refs=Count('id')).order_by()
+    ))
+    files = list(attachments.filter(blob__isnull=True).values_list('file', flat=True))
+    return refs, files
+
+
+def _release(refs, files):
+    """
+    Drops blob references in bulk, one statement per group of blobs losing
+    the same number of references, and queues the files of blobs that end up
+    unreferenced together with the given unshared files.
+    """
+    released = defaultdict(list)
+    for blob_id, count in refs.items():
+        released[count].append(blob_id)
+
+    blob_ids = []
+    for count, ids in released.items():
+        for chunk in _chunks(ids):
+            AttachmentBlob.objects.filter(id__in=chunk).update(
+                ref_count=Greatest(F('ref_count') - count, Value(0))
+            )
+        blob_ids.extend(ids)
+    for chunk in _chunks(blob_ids):
+        orphaned = AttachmentBlob.objects.filter(id__in=chunk, ref_count=0)
+        for file, thumbnail in orphaned.values_list('file', 'thumbnail'):
+            files.extend((file, thumbnail))
+        orphaned._raw_delete(orphaned.db)
+
+    queue_file_deletions(files)
+
+
+def purge_archive(segments):
+    """
+    Deletes archive segments, releasing the blob references their attachments
+    hold from ArchiveSegmentAttachment rows, without decoding any segment.
+    Returns the number of messages the segments held.
+    """
+    with transaction.atomic():
+        archived = ArchiveSegmentAttachment.objects.filter(segment__in=segments.values('id'))
+        refs, files = _blob_references(archived)
+        messages = segments.aggregate(total=Sum('message_count'))['total'] or 0
+        archived._raw_delete(archived.db)
+        segments._raw_delete(segments.db)
+        _release(refs, files)
+    return messages
+
+
+def purge_conversation(user_id, other_user_id):
+    """
+    Deletes every message between two users, with their attachments and
+    archive segments, using a fixed number of set-based statements instead of
+    one delete per row.
+
+    Blob references are released in bulk (grouped by how many references each
+    blob loses) and the files that end up unreferenced are handed to the
+    deferred deletion queue. Returns the number of messages deleted, live
+    and archived.
+    """
+    messages = Message.objects.filter(
+        Q(sender_id=user_id, receiver_id=other_user_id) |
+        Q(sender_id=other_user_id, receiver_id=user_id)
+    )
+    message_ids = messages.values('id')
+
+    with transaction.atomic():
+        attachments = Attachment.objects.filter(message_id__in=message_ids)
+        refs, files = _blob_references(attachments)
+        # Raw deletes skip the per-row post_delete signals; blob references
+        # are released below in bulk instead
+        attachments._raw_delete(attachments.db)
+        archived = purge_archive(ArchivedConversation(user_id, other_user_id).segments())
+
+        # Replies from elsewhere keep their text but lose the quoted message
+        Message.objects.filter(reply_to_id__in=message_ids).update(reply_to=None)
+        deleted = messages._raw_delete(messages.db)
+
+        _release(refs, files)
+    return deleted + archived
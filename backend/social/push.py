@@ -0,0 +1,120 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from core.routers import pin_to_primary
+
+
+class Subscription:
+    """One connected event stream. Events may be put from any thread."""
+
+    max_pending = 100
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+
+    def put(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # Event loop already closed; the stream is going away
+            pass
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow consumer: drop the event, the client's fallback poll catches up
+            pass
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    """
+    Fan-out of per-user events to the streams connected to this process.
+
+    Only streams served by the same process see each other's events. To run
+    several ASGI workers, point PUSH_BROKER at a broker with the same
+    publish/subscribe/has_subscribers interface backed by a shared bus.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+    @asynccontextmanager
+    async def subscribe(self, user_id):
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                self._subscribers[user_id].discard(subscription)
+                if not self._subscribers[user_id]:
+                    del self._subscribers[user_id]
+
+    def has_subscribers(self, user_id):
+        with self._lock:
+            return bool(self._subscribers.get(user_id))
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(getattr(settings, 'PUSH_BROKER', 'social.push.InProcessBroker'))()
+    return _broker
+
+
+def publish(user_ids, event_type, payload):
+    """
+    Publishes an event to each user once the current transaction commits.
+    Recipients are pinned to the primary first, so the reload an event
+    triggers cannot miss the change on a lagging replica.
+    """
+    event = {"type": event_type, **payload}
+
+    def send():
+        recipients = set(user_ids)
+        pin_to_primary(*recipients)
+        broker = get_broker()
+        for user_id in recipients:
+            broker.publish(user_id, event)
+
+    transaction.on_commit(send)
+
+
+def publish_presence(user_id, is_online):
+    from .models import ChangeVersion, Friendship, SocialProfile
+
+    if SocialProfile.objects.filter(user_id=user_id, is_online_hidden=True).exists():
+        return
+    friend_ids = list(Friendship.friend_ids(user_id))
+    if friend_ids:
+        # Friend lists show the online dot, so their ETags must not outlive it
+        ChangeVersion.bump(*friend_ids)
+        publish(friend_ids, 'presence', {"user_id": user_id, "is_online": is_online})
+
+
+def format_event(event):
+    """Server-Sent Events wire format."""
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import FriendRequest, Message, Attachment
+from .models import FriendRequest, Attachment, UnreadCounter
 import bleach
 
 from allauth.socialaccount.models import SocialAccount
@@ -52,11 +52,8 @@ class UserSerializer(serializers.ModelSerializer):
     def get_unread_count(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return Message.objects.filter(
-                sender=obj,
-                receiver=request.user,
-                is_read=False
-            ).count()
+            counter = UnreadCounter.objects.filter(sender=obj, receiver=request.user).first()
+            return counter.count if counter else 0
         return 0
 
     def get_bio(self, obj):
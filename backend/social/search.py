@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, When, Value, IntegerField, Count, Q
+from django.db.models.functions import Length
+
+from .models import UsernameTrigram, BlockedUser
+
+User = get_user_model()
+
+MIN_QUERY_LENGTH = 3
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+
+
+def username_trigrams(username):
+    username = (username or '').lower()
+    return {username[i:i + 3] for i in range(len(username) - 2)}
+
+
+def index_user(user):
+    """Brings the user's trigram rows in line with their current username."""
+    wanted = username_trigrams(user.username)
+    existing = set(UsernameTrigram.objects.filter(user=user).values_list('trigram', flat=True))
+    if wanted == existing:
+        return
+    if existing - wanted:
+        UsernameTrigram.objects.filter(user=user, trigram__in=existing - wanted).delete()
+    UsernameTrigram.objects.bulk_create(
+        [UsernameTrigram(user=user, trigram=trigram) for trigram in wanted - existing],
+        ignore_conflicts=True,
+    )
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Rebuilds every user's trigram rows from scratch, for usernames changed
+    without signals (bulk updates, raw SQL). Returns the number of rows written.
+    """
+    written = 0
+    with transaction.atomic():
+        UsernameTrigram.objects.all().delete()
+        rows = []
+        for user_id, username in User.objects.values_list('id', 'username').iterator(chunk_size=batch_size):
+            rows.extend(UsernameTrigram(user_id=user_id, trigram=trigram) for trigram in username_trigrams(username))
+            if len(rows) >= batch_size:
+                UsernameTrigram.objects.bulk_create(rows, ignore_conflicts=True)
+                written += len(rows)
+                rows = []
+        UsernameTrigram.objects.bulk_create(rows, ignore_conflicts=True)
+    return written + len(rows)
+
+
+def search_users(query, viewer, limit=DEFAULT_LIMIT):
+    """
+    Users whose username contains query (case-insensitive), found through the
+    trigram index rather than a table scan. Prefix matches rank first, then
+    shorter names. The viewer and users blocked in either direction are left out.
+    """
+    query = query.lower()
+    trigrams = username_trigrams(query)
+    if len(query) < MIN_QUERY_LENGTH or not trigrams:
+        return User.objects.none()
+
+    candidates = UsernameTrigram.objects.filter(trigram__in=trigrams).values('user_id').annotate(
+        matched=Count('trigram')
+    ).filter(matched=len(trigrams)).values('user_id')
+
+    blocked = BlockedUser.objects.filter(
+        Q(blocker=viewer) | Q(blocked=viewer)
+    ).values_list('blocker_id', 'blocked_id')
+    hidden = {viewer.id}
+    for blocker_id, blocked_id in blocked:
+        hidden.add(blocker_id)
+        hidden.add(blocked_id)
+
+    return User.objects.filter(
+        id__in=candidates, username__icontains=query
+    ).exclude(id__in=hidden).annotate(
+        rank=Case(When(username__istartswith=query, then=Value(0)), default=Value(1), output_field=IntegerField()),
+        name_length=Length('username'),
+    ).select_related('social_profile').order_by('rank', 'name_length', 'username')[:limit]
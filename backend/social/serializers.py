@@ -1,12 +1,27 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import FriendRequest, Message, Attachment, MutedUser, BlockedUser
-import bleach
-
-from allauth.socialaccount.models import SocialAccount
+from django.db import models
+from .models import FriendRequest, Message, Attachment
+from .loaders import get_user_loader
+from . import blobs
+from .presence import is_recent
 
 User = get_user_model()
 
+class RelatedUsersListSerializer(serializers.ListSerializer):
+    """
+    Primes the shared UserRelationLoader with every user the page renders,
+    so nested UserSerializer fields resolve from memory.
+    """
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        items = list(iterable)
+        users = []
+        for item in items:
+            users.extend(self.child.get_related_users(item))
+        get_user_loader(self.context).load(users)
+        return super().to_representation(items)
+
 class UserSerializer(serializers.ModelSerializer):
     avatar = serializers.SerializerMethodField()
     is_online = serializers.SerializerMethodField()
@@ -22,29 +37,21 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'avatar', 'is_online', 'is_online_hidden', 'unread_count', 'bio', 'banner_color', 'favorite_game', 'date_joined', 'last_activity', 'is_muted', 'is_blocked']
+        list_serializer_class = RelatedUsersListSerializer
+
+    def get_related_users(self, obj):
+        return [obj]
 
     def get_avatar(self, obj):
-        # Try Discord first
-        discord_account = SocialAccount.objects.filter(user=obj, provider='discord').first()
-        if discord_account:
-            return discord_account.get_avatar_url()
-        
-        # Try Google
-        google_account = SocialAccount.objects.filter(user=obj, provider='google').first()
-        if google_account:
-            return google_account.get_avatar_url()
-            
-        return None
+        # Discord first, then Google
+        return get_user_loader(self.context).avatar(obj)
 
     def get_is_online(self, obj):
         if hasattr(obj, 'social_profile'):
             if obj.social_profile.is_online_hidden:
                 return False
             # Check if last activity was within 5 minutes
-            from django.utils import timezone
-            import datetime
-            if obj.social_profile.last_activity:
-                return (timezone.now() - obj.social_profile.last_activity) < datetime.timedelta(minutes=5)
+            return is_recent(get_user_loader(self.context).last_activity(obj))
         return False
 
     def get_is_online_hidden(self, obj):
@@ -53,19 +60,11 @@ class UserSerializer(serializers.ModelSerializer):
         return False
 
     def get_unread_count(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Message.objects.filter(
-                sender=obj,
-                receiver=request.user,
-                is_read=False
-            ).count()
-        return 0
+        return get_user_loader(self.context).unread_count(obj)
 
     def get_bio(self, obj):
         if hasattr(obj, 'social_profile'):
-            # Sanitize bio to prevent XSS
-            return bleach.clean(obj.social_profile.bio, tags=[], strip=True)
+            return obj.social_profile.sanitized_bio
         return ''
 
     def get_banner_color(self, obj):
@@ -75,26 +74,17 @@ class UserSerializer(serializers.ModelSerializer):
 
     def get_favorite_game(self, obj):
         if hasattr(obj, 'social_profile'):
-            # Sanitize favorite_game to prevent XSS
-            return bleach.clean(obj.social_profile.favorite_game, tags=[], strip=True)
+            return obj.social_profile.sanitized_favorite_game
         return ''
 
     def get_last_activity(self, obj):
-        if hasattr(obj, 'social_profile') and obj.social_profile.last_activity:
-            return obj.social_profile.last_activity
-        return None
+        return get_user_loader(self.context).last_activity(obj)
 
     def get_is_muted(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return MutedUser.objects.filter(muter=request.user, muted=obj).exists()
-        return False
+        return get_user_loader(self.context).is_muted(obj)
 
     def get_is_blocked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return BlockedUser.objects.filter(blocker=request.user, blocked=obj).exists()
-        return False
+        return get_user_loader(self.context).is_blocked(obj)
 
 class FriendRequestSerializer(serializers.ModelSerializer):
     from_user = UserSerializer(read_only=True)
@@ -105,6 +95,10 @@ class FriendRequestSerializer(serializers.ModelSerializer):
         model = FriendRequest
         fields = ['id', 'from_user', 'to_user', 'to_user_id', 'status', 'created_at']
         read_only_fields = ['from_user', 'status', 'created_at']
+        list_serializer_class = RelatedUsersListSerializer
+
+    def get_related_users(self, obj):
+        return [obj.from_user, obj.to_user]
 
     def create(self, validated_data):
         to_user_id = validated_data.pop('to_user_id')
@@ -120,9 +114,18 @@ class FriendRequestSerializer(serializers.ModelSerializer):
         return FriendRequest.objects.create(from_user=from_user, to_user=to_user, **validated_data)
 
 class AttachmentSerializer(serializers.ModelSerializer):
+    thumbnail = serializers.SerializerMethodField()
+
     class Meta:
         model = Attachment
-        fields = ['id', 'file', 'uploaded_at']
+        fields = ['id', 'file', 'name', 'thumbnail', 'uploaded_at']
+
+    def get_thumbnail(self, obj):
+        if obj.blob and obj.blob.thumbnail:
+            request = self.context.get('request')
+            url = obj.blob.thumbnail.url
+            return request.build_absolute_uri(url) if request else url
+        return None
 
 class MessageSerializer(serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
@@ -131,6 +134,7 @@ class MessageSerializer(serializers.ModelSerializer):
     reply_to_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
     forwarded_from_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
     reply_to = serializers.SerializerMethodField()
+    is_read = serializers.SerializerMethodField()
     attachments = AttachmentSerializer(many=True, read_only=True)
     uploaded_files = serializers.ListField(
         child=serializers.FileField(max_length=100000, allow_empty_file=False, use_url=False),
@@ -141,18 +145,29 @@ class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = ['id', 'sender', 'receiver', 'receiver_id', 'content', 'timestamp', 'is_read', 'attachments', 'uploaded_files', 'reply_to', 'reply_to_id', 'forwarded_from', 'forwarded_from_id']
-        read_only_fields = ['sender', 'timestamp', 'is_read', 'forwarded_from']
+        read_only_fields = ['sender', 'timestamp', 'forwarded_from']
+        list_serializer_class = RelatedUsersListSerializer
+
+    def get_related_users(self, obj):
+        users = [obj.sender, obj.receiver]
+        if obj.reply_to:
+            users.append(obj.reply_to.sender)
+        return users
 
     def get_reply_to(self, obj):
         if obj.reply_to:
             return {
                 'id': obj.reply_to.id,
-                'sender': UserSerializer(obj.reply_to.sender).data,
+                'sender': UserSerializer(obj.reply_to.sender, context=self.context).data,
                 'content': obj.reply_to.content,
                 'timestamp': obj.reply_to.timestamp
             }
         return None
 
+    def get_is_read(self, obj):
+        # Read once the receiver's watermark for this sender has passed it
+        return obj.id <= get_user_loader(self.context).read_up_to(obj.receiver_id, obj.sender_id)
+
     def validate_uploaded_files(self, value):
         limit = 15 * 1024 * 1024  # 15 MB
         for file in value:
@@ -198,6 +213,8 @@ class MessageSerializer(serializers.ModelSerializer):
         )
 
         for file in uploaded_files:
-            Attachment.objects.create(message=message, file=file)
+            # Identical content is stored once and shared between attachments
+            blob = blobs.store(file)
+            Attachment.objects.create(message=message, file=blob.file.name, name=file.name, blob=blob)
 
         return message
@@ -1,7 +1,17 @@
-from django.db.models.signals import post_save
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import SocialProfile
+from allauth.socialaccount.models import SocialAccount
+from .models import (
+    SocialProfile, Message, MessageTombstone, FriendRequest, Friendship, UnreadCounter, Attachment, ChangeVersion,
+    BlockedUser, MutedUser, ArchiveSegment,
+)
+from .push import publish
+from .search import index_user
+from .purge import purge_archive, queue_file_deletions
+from .versions import bump_with_related
+from . import blobs
 
 User = get_user_model()
 
@@ -13,3 +23,108 @@ def create_social_profile(sender, instance, created, **kwargs):
         # Ensure profile exists for existing users
         if not hasattr(instance, 'social_profile'):
             SocialProfile.objects.get_or_create(user=instance)
+
+@receiver(post_save, sender=User)
+def index_username(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'username' in update_fields:
+        index_user(instance)
+
+@receiver(post_save, sender=Message)
+def count_unread_message(sender, instance, created, **kwargs):
+    # New messages are always past the receiver's read watermark
+    if created:
+        UnreadCounter.increment(instance.receiver_id, instance.sender_id)
+
+@receiver(post_save, sender=Message)
+def push_new_message(sender, instance, created, **kwargs):
+    if created:
+        publish([instance.sender_id, instance.receiver_id], 'message', {
+            "id": instance.id,
+            "sender_id": instance.sender_id,
+            "receiver_id": instance.receiver_id,
+        })
+
+@receiver(post_save, sender=MessageTombstone)
+def push_deleted_message(sender, instance, created, **kwargs):
+    if created:
+        publish([instance.sender_id, instance.receiver_id], 'message_deleted', {
+            "id": instance.message_id,
+            "sender_id": instance.sender_id,
+            "receiver_id": instance.receiver_id,
+        })
+
+@receiver(post_save, sender=FriendRequest)
+def sync_friendship(sender, instance, created, **kwargs):
+    if instance.status == 'accepted':
+        Friendship.link(instance.from_user_id, instance.to_user_id)
+    elif not created:
+        Friendship.unlink(instance.from_user_id, instance.to_user_id)
+
+@receiver(post_delete, sender=FriendRequest)
+def remove_friendship(sender, instance, **kwargs):
+    if instance.status == 'accepted':
+        Friendship.unlink(instance.from_user_id, instance.to_user_id)
+
+@receiver(post_save, sender=FriendRequest)
+def push_friend_request(sender, instance, **kwargs):
+    publish([instance.from_user_id, instance.to_user_id], 'friend_request', {
+        "id": instance.id,
+        "status": instance.status,
+        "from_user_id": instance.from_user_id,
+        "to_user_id": instance.to_user_id,
+    })
+
+@receiver(post_delete, sender=FriendRequest)
+def push_deleted_friend_request(sender, instance, **kwargs):
+    publish([instance.from_user_id, instance.to_user_id], 'friend_request', {
+        "id": instance.id,
+        "status": "deleted",
+        "from_user_id": instance.from_user_id,
+        "to_user_id": instance.to_user_id,
+    })
+
+@receiver(post_delete, sender=Attachment)
+def release_attachment_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        blobs.release(instance.blob_id)
+    elif instance.file:
+        # Pre-deduplication attachment owns its file
+        queue_file_deletions([instance.file.name])
+
+@receiver(pre_delete, sender=User)
+def release_archived_attachments(sender, instance, **kwargs):
+    # The cascade would drop archived attachment rows along with the user's
+    # segments, leaving the blob references they hold behind
+    purge_archive(ArchiveSegment.objects.filter(Q(user_low=instance) | Q(user_high=instance)))
+
+# Change versions (social.versions). Registered last, so they run after the
+# receivers above have finished their own writes.
+
+@receiver([post_save, post_delete], sender=FriendRequest)
+def bump_friend_request_versions(sender, instance, **kwargs):
+    ChangeVersion.bump(instance.from_user_id, instance.to_user_id)
+
+@receiver([post_save, post_delete], sender=BlockedUser)
+def bump_block_versions(sender, instance, **kwargs):
+    ChangeVersion.bump(instance.blocker_id, instance.blocked_id)
+
+@receiver([post_save, post_delete], sender=MutedUser)
+def bump_mute_versions(sender, instance, **kwargs):
+    ChangeVersion.bump(instance.muter_id)
+
+@receiver(post_save, sender=User)
+def bump_user_versions(sender, instance, **kwargs):
+    bump_with_related(instance.pk)
+
+@receiver(post_delete, sender=User)
+def drop_user_version(sender, instance, **kwargs):
+    ChangeVersion.objects.filter(user_id=instance.pk).delete()
+
+@receiver(post_save, sender=SocialProfile)
+def bump_profile_versions(sender, instance, **kwargs):
+    bump_with_related(instance.user_id)
+
+@receiver([post_save, post_delete], sender=SocialAccount)
+def bump_account_versions(sender, instance, **kwargs):
+    # The avatar comes from the social account
+    bump_with_related(instance.user_id)
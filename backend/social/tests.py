@@ -1,8 +1,33 @@
 from django.test import TestCase
+from unittest import mock, skipUnless
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import BlockedUser
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import datetime
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from .models import (
+    ArchiveSegment, ArchiveSegmentAttachment, Attachment, AttachmentBlob, BlockedUser, ChangeVersion, FriendRequest,
+    Friendship, Message, MutedUser, PendingFileDeletion, ReadWatermark,
+    SocialProfile, UnreadCounter, UsernameTrigram,
+)
+from .archive import archive_messages
+from .presence import tracker
+from .purge import purge_conversation
+from .thumbnails import Image
+from core.query_plans import FULL_SCAN, INDEX_UNUSED, TEMP_BTREE, explain, find_issues
+from .push import get_broker, publish_presence
+from asgiref.sync import async_to_sync, sync_to_async
+import asyncio
+import hashlib
+import io
+import os
+import shutil
+import tempfile
 
 User = get_user_model()
 
@@ -35,3 +60,689 @@ class BlockUserTests(TestCase):
         # Should probably return 200 or 404 depending on implementation, 
         # currently implementation returns 200 "unblocked" even if not blocked (filter().delete() is no-op)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+class ProfileSanitizationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.client.force_authenticate(user=self.user)
+
+    def test_profile_text_is_sanitized_on_write(self):
+        self.client.post('/api/social/profile/settings/', {
+            'bio': '<script>alert(1)</script><b>hi</b>', 'favorite_game': '<i>Minecraft</i>',
+        }, format='json')
+        profile = SocialProfile.objects.get(user=self.user)
+        self.assertEqual(profile.bio, '<script>alert(1)</script><b>hi</b>')
+        self.assertEqual(profile.sanitized_bio, 'alert(1)hi')
+        self.assertEqual(profile.sanitized_favorite_game, 'Minecraft')
+
+        self.client.force_authenticate(user=User.objects.get(pk=self.user.pk))
+        response = self.client.get('/api/social/me/')
+        self.assertEqual(response.data['bio'], 'alert(1)hi')
+        self.assertEqual(response.data['favorite_game'], 'Minecraft')
+
+    def test_update_fields_save_refreshes_sanitized_copy(self):
+        profile = SocialProfile.objects.get(user=self.user)
+        profile.bio = '<em>x</em> & y'
+        profile.save(update_fields=['bio'])
+        profile.refresh_from_db()
+        self.assertEqual(profile.sanitized_bio, 'x &amp; y')
+
+class FriendListQueryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='owner', password='password123', email='owner@example.com')
+        self.client.force_authenticate(user=self.user)
+
+    def add_friends(self, count, offset=0):
+        for i in range(offset, offset + count):
+            friend = User.objects.create_user(username=f'friend{i}', password='password123', email=f'friend{i}@example.com')
+            FriendRequest.objects.create(from_user=self.user, to_user=friend, status='accepted')
+            Message.objects.create(sender=friend, receiver=self.user, content='hi')
+            MutedUser.objects.create(muter=self.user, muted=friend)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/social/friends/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response.data
+
+    def test_query_count_does_not_grow_with_friends(self):
+        self.add_friends(2)
+        small, _ = self.count_queries()
+        self.add_friends(8, offset=2)
+        large, data = self.count_queries()
+        self.assertEqual(small, large)
+        self.assertEqual(len(data), 10)
+        self.assertTrue(all(f['unread_count'] == 1 and f['is_muted'] for f in data))
+
+class MessageCursorPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user1 = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.user2 = User.objects.create_user(username='user2', password='password123', email='user2@example.com')
+        self.client.force_authenticate(user=self.user1)
+        self.messages = [
+            Message.objects.create(sender=self.user1 if i % 2 else self.user2,
+                                   receiver=self.user2 if i % 2 else self.user1,
+                                   content=f'm{i}')
+            for i in range(7)
+        ]
+        self.url = f'/api/social/messages/?user_id={self.user2.id}'
+
+    def ids(self, response):
+        return [m['id'] for m in response.data['results']]
+
+    def test_without_cursor_returns_full_list(self):
+        response = self.client.get(self.url)
+        self.assertEqual([m['id'] for m in response.data], [m.id for m in self.messages])
+
+    def test_latest_page(self):
+        response = self.client.get(self.url + '&limit=3')
+        self.assertEqual(self.ids(response), [m.id for m in self.messages[4:]])
+        self.assertTrue(response.data['has_more'])
+
+    def test_before_id(self):
+        response = self.client.get(self.url + f'&limit=3&before_id={self.messages[2].id}')
+        self.assertEqual(self.ids(response), [m.id for m in self.messages[:2]])
+        self.assertFalse(response.data['has_more'])
+
+    def test_after_id(self):
+        response = self.client.get(self.url + f'&limit=3&after_id={self.messages[2].id}')
+        self.assertEqual(self.ids(response), [m.id for m in self.messages[3:6]])
+        self.assertTrue(response.data['has_more'])
+
+    def test_unknown_anchor(self):
+        response = self.client.get(self.url + '&before_id=999999')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class MessageArchiveTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user1 = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.user2 = User.objects.create_user(username='user2', password='password123', email='user2@example.com')
+        self.client.force_authenticate(user=self.user1)
+        old = timezone.now() - datetime.timedelta(days=400)
+        self.messages = []
+        for i in range(10):
+            message = Message.objects.create(sender=self.user1 if i % 2 else self.user2,
+                                             receiver=self.user2 if i % 2 else self.user1,
+                                             content=f'm{i}',
+                                             reply_to=self.messages[-1] if i == 5 else None)
+            Message.objects.filter(pk=message.pk).update(timestamp=old + datetime.timedelta(minutes=i))
+            self.messages.append(message)
+        self.blob = AttachmentBlob.objects.create(sha256='a' * 64, file='chat_attachments/blobs/aa/a.txt', size=1, ref_count=1)
+        Attachment.objects.create(message=self.messages[3], file=self.blob.file.name, name='a.txt', blob=self.blob)
+        ReadWatermark.advance(self.user1.id, self.user2.id, self.messages[-2].id)
+        ReadWatermark.advance(self.user2.id, self.user1.id, self.messages[-1].id)
+        # A recent reply keeps the message it quotes in the hot table
+        self.messages.append(Message.objects.create(sender=self.user1, receiver=self.user2, content='new',
+                                                    reply_to=self.messages[8]))
+        self.url = f'/api/social/messages/?user_id={self.user2.id}'
+
+    def archive(self):
+        return archive_messages(timezone.now() - datetime.timedelta(days=180), segment_size=4)
+
+    def test_archive_moves_old_messages_into_segments(self):
+        self.assertEqual(self.archive(), (9, 3))
+        self.assertEqual(list(Message.objects.order_by('id').values_list('content', flat=True)), ['m8', 'new'])
+        self.assertFalse(Attachment.objects.exists())
+        self.blob.refresh_from_db()
+        self.assertEqual(self.blob.ref_count, 1)
+        # Append-only: a second run finds nothing new to move
+        self.assertEqual(self.archive(), (0, 0))
+
+    def test_history_pages_through_archive(self):
+        self.archive()
+        self.assertTrue(self.client.get(self.url + '&since=&limit=4').data['has_more'])
+        response = self.client.get(self.url + '&limit=4')
+        ids = [m['id'] for m in response.data['results']]
+        while response.data['has_more']:
+            response = self.client.get(self.url + f'&limit=4&before_id={ids[0]}')
+            ids = [m['id'] for m in response.data['results']] + ids
+        self.assertEqual(ids, [m.id for m in self.messages])
+
+        response = self.client.get(self.url + f'&limit=3&after_id={self.messages[2].id}')
+        results = response.data['results']
+        self.assertEqual([m['id'] for m in results], [m.id for m in self.messages[3:6]])
+        self.assertEqual(results[0]['attachments'][0]['name'], 'a.txt')
+        self.assertEqual(results[0]['sender']['username'], 'user1')
+        self.assertEqual(results[2]['reply_to']['content'], 'm4')
+
+    def test_clear_chat_releases_archived_attachments(self):
+        self.archive()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/social/users/{self.user2.id}/clear-chat/')
+        self.assertFalse(ArchiveSegment.objects.exists())
+        self.assertFalse(AttachmentBlob.objects.filter(pk=self.blob.pk).exists())
+        self.assertFalse(Message.objects.exists())
+
+    def test_clearing_a_fully_archived_chat_is_reported(self):
+        self.archive()
+        Message.objects.all().delete()
+        watermark = self.client.get(self.url + '&since=').data['watermark']
+        self.client.delete(f'/api/social/users/{self.user2.id}/clear-chat/')
+        self.assertFalse(ArchiveSegment.objects.exists())
+        self.assertTrue(self.client.get(self.url + f'&since={watermark}').data['cleared'])
+
+class MessageSyncTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user1 = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.user2 = User.objects.create_user(username='user2', password='password123', email='user2@example.com')
+        self.client.force_authenticate(user=self.user1)
+        self.url = f'/api/social/messages/?user_id={self.user2.id}&since='
+
+    def sync(self, watermark=''):
+        response = self.client.get(self.url + watermark)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def age(self, *messages):
+        old = timezone.now() - datetime.timedelta(minutes=1)
+        Message.objects.filter(id__in=[m.id for m in messages]).update(timestamp=old)
+
+    def test_idle_poll_is_empty(self):
+        message = Message.objects.create(sender=self.user2, receiver=self.user1, content='hi')
+        first = self.sync()
+        self.assertEqual([m['id'] for m in first['messages']], [message.id])
+        self.assertFalse(first['has_more'])
+        self.age(message)
+        second = self.sync(first['watermark'])
+        self.assertEqual(second['messages'], [])
+        self.assertNotIn('has_more', second)
+        self.assertEqual(second['deleted_ids'], [])
+
+    def test_first_sync_returns_the_newest_page(self):
+        messages = [Message.objects.create(sender=self.user2, receiver=self.user1, content=str(i)) for i in range(3)]
+        first = self.client.get(self.url + '&limit=2').data
+        self.assertEqual([m['id'] for m in first['messages']], [m.id for m in messages[1:]])
+        self.assertTrue(first['has_more'])
+
+    def test_returns_new_and_deleted_messages_and_read_watermarks(self):
+        read = Message.objects.create(sender=self.user1, receiver=self.user2, content='read me')
+        doomed = Message.objects.create(sender=self.user1, receiver=self.user2, content='delete me')
+        self.age(read, doomed)
+        first = self.sync()
+        self.assertEqual((first['read_up_to'], first['last_read_id']), (0, 0))
+
+        ReadWatermark.advance(self.user2.id, self.user1.id, read.id)
+        self.client.delete(f'/api/social/messages/{doomed.id}/')
+        new = Message.objects.create(sender=self.user2, receiver=self.user1, content='new')
+
+        data = self.sync(first['watermark'])
+        self.assertEqual([m['id'] for m in data['messages']], [new.id])
+        self.assertEqual(data['deleted_ids'], [doomed.id])
+        self.assertFalse(data['cleared'])
+        self.assertEqual((data['read_up_to'], data['last_read_id']), (read.id, 0))
+
+    def test_clear_chat_is_reported(self):
+        message = Message.objects.create(sender=self.user1, receiver=self.user2, content='hi')
+        self.age(message)
+        watermark = self.sync()['watermark']
+        self.client.delete(f'/api/social/users/{self.user2.id}/clear-chat/')
+        self.assertTrue(self.sync(watermark)['cleared'])
+
+    def test_invalid_watermark(self):
+        response = self.client.get(self.url + 'yesterday')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class PresenceTrackerTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.client.force_authenticate(user=self.user)
+        self.old = timezone.now() - datetime.timedelta(hours=1)
+        SocialProfile.objects.filter(user=self.user).update(last_activity=self.old)
+        cache.clear()
+        tracker.flush()
+
+    def test_requests_do_not_write_profile(self):
+        self.client.get('/api/social/me/')
+        self.assertEqual(SocialProfile.objects.get(user=self.user).last_activity, self.old)
+        self.assertTrue(self.client.get('/api/social/me/').data['is_online'])
+
+    def test_flush_writes_last_activity(self):
+        tracker.touch(self.user.id)
+        self.assertEqual(tracker.flush(), 1)
+        profile = SocialProfile.objects.get(user=self.user)
+        self.assertEqual(profile.last_activity, tracker.last_seen(self.user.id))
+
+class PushChannelTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user1 = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.user2 = User.objects.create_user(username='user2', password='password123', email='user2@example.com')
+        self.client.force_authenticate(user=self.user1)
+
+    def test_new_message_reaches_receiver_stream(self):
+        def send_message():
+            with self.captureOnCommitCallbacks(execute=True):
+                Message.objects.create(sender=self.user1, receiver=self.user2, content='hi')
+
+        async def scenario():
+            async with get_broker().subscribe(self.user2.id) as subscription:
+                await sync_to_async(send_message)()
+                return await asyncio.wait_for(subscription.get(), timeout=1)
+
+        event = async_to_sync(scenario)()
+        self.assertEqual(event['type'], 'message')
+        self.assertEqual(event['sender_id'], self.user1.id)
+
+    def test_stream_requires_asgi(self):
+        response = self.client.get('/api/social/events/', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user1 = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.user2 = User.objects.create_user(username='user2', password='password123', email='user2@example.com')
+        self.client.force_authenticate(user=self.user1)
+
+    def unread(self):
+        counter = UnreadCounter.objects.filter(receiver=self.user1, sender=self.user2).first()
+        return counter.count if counter else 0
+
+    def test_counter_follows_messages(self):
+        first = Message.objects.create(sender=self.user2, receiver=self.user1, content='one')
+        Message.objects.create(sender=self.user2, receiver=self.user1, content='two')
+        self.assertEqual(self.unread(), 2)
+
+        self.client.force_authenticate(user=self.user2)
+        self.client.delete(f'/api/social/messages/{first.id}/')
+        self.assertEqual(self.unread(), 1)
+
+        self.client.force_authenticate(user=self.user1)
+        self.client.post('/api/social/messages/read/', {'user_id': self.user2.id, 'message_id': first.id + 1})
+        self.assertEqual(self.unread(), 0)
+
+    def test_clear_chat_drops_counters(self):
+        Message.objects.create(sender=self.user2, receiver=self.user1, content='one')
+        self.client.delete(f'/api/social/users/{self.user2.id}/clear-chat/')
+        self.assertFalse(UnreadCounter.objects.exists())
+
+class ReadWatermarkTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user1 = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.user2 = User.objects.create_user(username='user2', password='password123', email='user2@example.com')
+        self.client.force_authenticate(user=self.user1)
+        self.received = [Message.objects.create(sender=self.user2, receiver=self.user1, content=f'r{i}') for i in range(3)]
+        self.sent = Message.objects.create(sender=self.user1, receiver=self.user2, content='sent')
+
+    def acknowledge(self, message_id):
+        response = self.client.post('/api/social/messages/read/', {'user_id': self.user2.id, 'message_id': message_id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['last_read_id']
+
+    def read_flags(self):
+        response = self.client.get(f'/api/social/messages/?user_id={self.user2.id}')
+        return {m['content']: m['is_read'] for m in response.data}
+
+    def test_fetching_messages_writes_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.read_flags()
+        self.assertFalse([q for q in queries if q['sql'].startswith(('UPDATE', 'INSERT'))])
+        self.assertEqual(UnreadCounter.objects.get(receiver=self.user1).count, 3)
+
+    def test_acknowledging_moves_one_watermark_forward_only(self):
+        self.assertEqual(self.acknowledge(self.received[1].id), self.received[1].id)
+        self.assertEqual(self.read_flags(), {'r0': True, 'r1': True, 'r2': False, 'sent': False})
+        self.assertEqual(UnreadCounter.objects.get(receiver=self.user1).count, 1)
+
+        self.assertEqual(self.acknowledge(self.received[0].id), self.received[1].id)
+        # Clamped to the newest message that has arrived
+        self.assertEqual(self.acknowledge(self.sent.id + 100), self.received[2].id)
+        self.assertEqual(UnreadCounter.objects.get(receiver=self.user1).count, 0)
+        self.assertEqual(ReadWatermark.objects.count(), 1)
+
+        self.client.force_authenticate(user=self.user2)
+        self.client.post('/api/social/messages/read/', {'user_id': self.user1.id, 'message_id': self.sent.id})
+        self.client.force_authenticate(user=self.user1)
+        self.assertTrue(self.read_flags()['sent'])
+
+    def test_deleting_a_read_message_keeps_the_count(self):
+        self.acknowledge(self.received[0].id)
+        self.client.force_authenticate(user=self.user2)
+        self.client.delete(f'/api/social/messages/{self.received[0].id}/')
+        self.client.delete(f'/api/social/messages/{self.received[2].id}/')
+        self.assertEqual(UnreadCounter.objects.get(receiver=self.user1).count, 1)
+
+    def test_invalid_acknowledgement(self):
+        response = self.client.post('/api/social/messages/read/', {'user_id': self.user2.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class ChangeVersionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user1 = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.user2 = User.objects.create_user(username='user2', password='password123', email='user2@example.com')
+        FriendRequest.objects.create(from_user=self.user1, to_user=self.user2, status='accepted')
+        self.client.force_authenticate(user=self.user1)
+
+    def etag(self, path='/api/social/friends/'):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response['ETag']
+
+    def test_unchanged_lists_answer_304_without_building_them(self):
+        for path in ['/api/social/friends/', '/api/social/friends/requests/',
+                     '/api/social/profile/settings/', '/api/social/me/']:
+            etag = self.etag(path)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertFalse(response.content)
+            self.assertEqual(len([q for q in queries if 'changeversion' not in q['sql']]), 0, path)
+
+    def test_changes_that_show_in_the_lists_bump_the_version(self):
+        etag = self.etag()
+        changes = [
+            lambda: Message.objects.create(sender=self.user2, receiver=self.user1, content='hi'),
+            lambda: self.client.post('/api/social/messages/read/', {
+                'user_id': self.user2.id, 'message_id': Message.objects.latest('id').id,
+            }),
+            lambda: self.client.post(f'/api/social/users/{self.user2.id}/mute/'),
+            lambda: SocialProfile.objects.get(user=self.user2).save(),
+            lambda: publish_presence(self.user2.id, False),
+            lambda: FriendRequest.objects.filter(from_user=self.user1).delete(),
+        ]
+        for change in changes:
+            change()
+            new_etag = self.etag()
+            self.assertNotEqual(new_etag, etag)
+            etag = new_etag
+
+    def test_versions_of_deleted_users_are_dropped(self):
+        self.user2.delete()
+        self.assertEqual(list(ChangeVersion.objects.values_list('user_id', flat=True)), [self.user1.id])
+
+class FriendshipTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user1 = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.user2 = User.objects.create_user(username='user2', password='password123', email='user2@example.com')
+        self.user3 = User.objects.create_user(username='user3', password='password123', email='user3@example.com')
+
+    def test_accept_and_remove_keep_table_in_sync(self):
+        request = FriendRequest.objects.create(from_user=self.user1, to_user=self.user2)
+        self.assertFalse(Friendship.are_friends(self.user1.id, self.user2.id))
+
+        self.client.force_authenticate(user=self.user2)
+        self.client.patch(f'/api/social/friends/requests/{request.id}/', {'status': 'accepted'})
+        self.assertTrue(Friendship.are_friends(self.user1.id, self.user2.id))
+        self.assertTrue(Friendship.are_friends(self.user2.id, self.user1.id))
+        self.assertEqual([f['id'] for f in self.client.get('/api/social/friends/').data], [self.user1.id])
+
+        self.client.delete(f'/api/social/users/{self.user1.id}/remove-friend/')
+        self.assertFalse(Friendship.objects.exists())
+
+    def test_mutual_friends(self):
+        FriendRequest.objects.create(from_user=self.user1, to_user=self.user3, status='accepted')
+        FriendRequest.objects.create(from_user=self.user3, to_user=self.user2, status='accepted')
+        self.assertEqual(list(Friendship.mutual_friend_ids(self.user1.id, self.user2.id)), [self.user3.id])
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='searcher', password='password123', email='searcher@example.com')
+        self.client.force_authenticate(user=self.user)
+        for name in ['xsteve', 'steve', 'stevenson', 'bob']:
+            User.objects.create_user(username=name, password='password123', email=f'{name}@example.com')
+
+    def search(self, query, **params):
+        response = self.client.get('/api/social/users/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [u['username'] for u in response.data]
+
+    def test_prefix_matches_rank_first(self):
+        self.assertEqual(self.search('STEVE'), ['steve', 'stevenson', 'xsteve'])
+        self.assertEqual(self.search('steve', limit=1), ['steve'])
+
+    def test_index_follows_username_changes(self):
+        bob = User.objects.get(username='bob')
+        bob.username = 'robert'
+        bob.save()
+        self.assertEqual(self.search('bert'), ['robert'])
+        self.assertEqual(UsernameTrigram.objects.filter(user=bob, trigram='bob').count(), 0)
+
+    def test_rebuild_command_picks_up_bulk_renames(self):
+        User.objects.filter(username='bob').update(username='robert')
+        self.assertEqual(self.search('bert'), [])
+        out = io.StringIO()
+        call_command('rebuild_search_index', '--batch-size', '5', stdout=out)
+        self.assertEqual(self.search('bert'), ['robert'])
+        self.assertIn(f'Indexed {UsernameTrigram.objects.count()} username trigrams', out.getvalue())
+
+    def test_blocked_users_are_excluded(self):
+        steve = User.objects.get(username='steve')
+        BlockedUser.objects.create(blocker=steve, blocked=self.user)
+        self.assertNotIn('steve', self.search('steve'))
+
+class AttachmentDeduplicationTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=self.media, BACKGROUND_TASKS_ASYNC=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client = APIClient()
+        self.user1 = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.user2 = User.objects.create_user(username='user2', password='password123', email='user2@example.com')
+        self.client.force_authenticate(user=self.user1)
+
+    def send(self, name, content):
+        upload = SimpleUploadedFile(name, content, content_type='text/plain')
+        response = self.client.post('/api/social/messages/', {
+            'receiver_id': self.user2.id, 'content': '', 'uploaded_files': [upload],
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.send('meme.txt', b'same bytes')
+        second = self.send('copy.txt', b'same bytes')
+        self.send('other.txt', b'different bytes')
+
+        self.assertEqual(AttachmentBlob.objects.count(), 2)
+        blob = AttachmentBlob.objects.get(sha256=hashlib.sha256(b'same bytes').hexdigest())
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(sorted(Attachment.objects.filter(blob=blob).values_list('name', flat=True)), ['copy.txt', 'meme.txt'])
+        path = blob.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/social/messages/{first}/')
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/social/messages/{second}/')
+        self.assertFalse(AttachmentBlob.objects.filter(pk=blob.pk).exists())
+        self.assertFalse(os.path.exists(path))
+
+class ConversationPurgeTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=self.media, BACKGROUND_TASKS_ASYNC=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client = APIClient()
+        self.user1 = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.user2 = User.objects.create_user(username='user2', password='password123', email='user2@example.com')
+        self.user3 = User.objects.create_user(username='user3', password='password123', email='user3@example.com')
+        self.client.force_authenticate(user=self.user1)
+
+    def send(self, receiver, name, content, **extra):
+        upload = SimpleUploadedFile(name, content, content_type='text/plain')
+        response = self.client.post('/api/social/messages/', {
+            'receiver_id': receiver.id, 'content': '', 'uploaded_files': [upload], **extra,
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def test_clear_chat_releases_blobs_and_removes_files(self):
+        for _ in range(3):
+            self.send(self.user2, 'meme.txt', b'shared bytes')
+        first = self.send(self.user2, 'only.txt', b'only here')
+        self.send(self.user3, 'meme.txt', b'shared bytes', reply_to_id=first)
+        legacy = Message.objects.create(sender=self.user2, receiver=self.user1, content='old')
+        legacy_file = Attachment.objects.create(message=legacy, file=SimpleUploadedFile('legacy.txt', b'legacy'))
+        legacy_path = legacy_file.file.path
+
+        shared = AttachmentBlob.objects.get(sha256=hashlib.sha256(b'shared bytes').hexdigest())
+        only = AttachmentBlob.objects.get(sha256=hashlib.sha256(b'only here').hexdigest())
+        self.assertEqual(shared.ref_count, 4)
+        only_path = only.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/social/users/{self.user2.id}/clear-chat/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertFalse(Message.objects.filter(receiver=self.user2).exists())
+        self.assertFalse(Message.objects.filter(pk=legacy.pk).exists())
+        shared.refresh_from_db()
+        self.assertEqual(shared.ref_count, 1)
+        self.assertTrue(os.path.exists(shared.file.path))
+        self.assertFalse(AttachmentBlob.objects.filter(pk=only.pk).exists())
+        self.assertFalse(os.path.exists(only_path))
+        self.assertFalse(os.path.exists(legacy_path))
+        self.assertFalse(PendingFileDeletion.objects.exists())
+        # The reply to user3 survives without its quoted message
+        self.assertIsNone(Message.objects.get(receiver=self.user3).reply_to_id)
+
+    def test_archived_attachments_are_released_without_decoding_segments(self):
+        self.send(self.user2, 'meme.txt', b'shared bytes')
+        self.send(self.user3, 'meme.txt', b'shared bytes')
+        legacy = Message.objects.create(sender=self.user1, receiver=self.user2, content='old')
+        legacy_path = Attachment.objects.create(message=legacy, file=SimpleUploadedFile('legacy.txt', b'legacy')).file.path
+        ReadWatermark.advance(self.user2.id, self.user1.id, legacy.id)
+        Message.objects.filter(receiver=self.user2).update(timestamp=timezone.now() - datetime.timedelta(days=400))
+        self.assertEqual(archive_messages(timezone.now() - datetime.timedelta(days=180)), (2, 1))
+        shared = Attachment.objects.get(message__receiver=self.user3).blob
+
+        with mock.patch('zlib.decompress', side_effect=AssertionError('segment decoded')):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(purge_conversation(self.user1.id, self.user2.id), 2)
+        self.assertFalse(ArchiveSegment.objects.exists())
+        shared.refresh_from_db()
+        self.assertEqual(shared.ref_count, 1)
+        self.assertFalse(os.path.exists(legacy_path))
+
+    def test_deleting_a_user_releases_archived_attachments(self):
+        self.send(self.user2, 'only.txt', b'only here')
+        self.send(self.user2, 'meme.txt', b'shared bytes')
+        self.send(self.user3, 'meme.txt', b'shared bytes')
+        newest = Message.objects.filter(receiver=self.user2).latest('id')
+        ReadWatermark.advance(self.user2.id, self.user1.id, newest.id)
+        Message.objects.filter(receiver=self.user2).update(timestamp=timezone.now() - datetime.timedelta(days=400))
+        self.assertEqual(archive_messages(timezone.now() - datetime.timedelta(days=180)), (2, 1))
+        only = AttachmentBlob.objects.get(sha256=hashlib.sha256(b'only here').hexdigest())
+        only_path = only.file.path
+        shared = Attachment.objects.get(message__receiver=self.user3).blob
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user2.delete()
+        self.assertFalse(ArchiveSegmentAttachment.objects.exists())
+        self.assertFalse(AttachmentBlob.objects.filter(pk=only.pk).exists())
+        self.assertFalse(os.path.exists(only_path))
+        shared.refresh_from_db()
+        self.assertEqual(shared.ref_count, 1)
+
+    def test_purge_query_count_does_not_grow_with_history(self):
+        def fill(count):
+            for i in range(count):
+                message = Message.objects.create(sender=self.user1, receiver=self.user2, content=str(i))
+                Attachment.objects.create(message=message, file=f'chat_attachments/missing{i}.txt')
+
+        fill(2)
+        with CaptureQueriesContext(connection) as small:
+            purge_conversation(self.user1.id, self.user2.id)
+        fill(40)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(purge_conversation(self.user1.id, self.user2.id), 40)
+        self.assertEqual(len(small), len(large))
+
+@skipUnless(Image, 'Pillow is not installed')
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=self.media, BACKGROUND_TASKS_ASYNC=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client = APIClient()
+        self.user1 = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.user2 = User.objects.create_user(username='user2', password='password123', email='user2@example.com')
+        self.client.force_authenticate(user=self.user1)
+
+    def test_image_upload_gets_thumbnail(self):
+        output = io.BytesIO()
+        Image.new('RGBA', (1200, 800), (255, 0, 0, 128)).save(output, format='PNG')
+        upload = SimpleUploadedFile('big.png', output.getvalue(), content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/social/messages/', {
+                'receiver_id': self.user2.id, 'content': '', 'uploaded_files': [upload],
+            }, format='multipart')
+
+        blob = AttachmentBlob.objects.get()
+        self.assertEqual(blob.thumbnail_status, 'ready')
+        with Image.open(blob.thumbnail.path) as thumbnail:
+            self.assertLessEqual(max(thumbnail.size), 320)
+
+        attachment = self.client.get(f'/api/social/messages/?user_id={self.user2.id}').data[0]['attachments'][0]
+        self.assertTrue(attachment['thumbnail'].endswith('.jpg'))
+
+    def test_other_files_are_marked_unsupported(self):
+        upload = SimpleUploadedFile('notes.txt', b'hello', content_type='text/plain')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/social/messages/', {
+                'receiver_id': self.user2.id, 'content': '', 'uploaded_files': [upload],
+            }, format='multipart')
+        self.assertEqual(AttachmentBlob.objects.get().thumbnail_status, 'unsupported')
+
+
+class DatasetGeneratorTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=self.media, BACKGROUND_TASKS_ASYNC=False)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def generate(self, *args):
+        call_command('generate_dataset', '--users', '30', '--friends', '3', '--messages', '10', *args, stdout=io.StringIO())
+        return list(Message.objects.order_by('id').values_list('content', flat=True))
+
+    def test_same_seed_gives_same_data(self):
+        first = self.generate()
+        second = self.generate('--replace')
+        self.assertTrue(first)
+        self.assertEqual(first, second)
+
+    def test_generated_state_is_consistent(self):
+        self.generate()
+        self.assertEqual(Friendship.objects.count(), 2 * FriendRequest.objects.filter(status='accepted').count())
+        for receiver_id, sender_id in Message.objects.values_list('receiver_id', 'sender_id').distinct():
+            counter = UnreadCounter.objects.filter(receiver_id=receiver_id, sender_id=sender_id).first()
+            self.assertEqual(counter.count if counter else 0, Message.objects.filter(
+                receiver_id=receiver_id, sender_id=sender_id,
+                id__gt=ReadWatermark.read_up_to(receiver_id, sender_id),
+            ).count())
+        for blob in AttachmentBlob.objects.all():
+            self.assertEqual(blob.ref_count, blob.attachments.count())
+
+
+class QueryPlanAuditTests(TestCase):
+    def test_hot_queries_use_their_indexes(self):
+        out = io.StringIO()
+        call_command('audit_query_plans', '--strict', stdout=out)
+        self.assertIn('0 flagged', out.getvalue())
+
+    def test_unindexed_filters_and_sorts_are_flagged(self):
+        plan = explain(Message.objects.filter(content__contains='hi').order_by('content'))
+        self.assertEqual([kind for kind, _ in find_issues(plan)], [FULL_SCAN, TEMP_BTREE])
+        self.assertEqual(find_issues(plan, allow=(FULL_SCAN, TEMP_BTREE), uses=('message_received_idx',)),
+                         [(INDEX_UNUSED, 'message_received_idx')])
@@ -0,0 +1,94 @@
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .background import run_after_commit
+from .models import AttachmentBlob
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; image previews are skipped without it
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+VIDEO_EXTENSIONS = {'.mp4', '.webm', '.mov'}
+
+def thumbnail_size():
+    return getattr(settings, 'THUMBNAIL_SIZE', (320, 320))
+
+
+def schedule(blob_id):
+    """Queues preview generation for a blob once the current transaction commits."""
+    run_after_commit(generate, blob_id)
+
+
+def generate(blob_id):
+    blob = AttachmentBlob.objects.filter(pk=blob_id, thumbnail_status='pending').first()
+    if blob is None:
+        return
+
+    ext = os.path.splitext(blob.file.name)[1].lower()
+    try:
+        if ext in IMAGE_EXTENSIONS and Image is not None:
+            with blob.file.open('rb') as source:
+                data = render_image(source)
+        elif ext in VIDEO_EXTENSIONS and shutil.which('ffmpeg'):
+            data = render_video_poster(blob.file.path)
+        else:
+            data = None
+    except Exception:
+        logger.exception("Could not build preview for blob %s", blob_id)
+        AttachmentBlob.objects.filter(pk=blob_id).update(thumbnail_status='failed')
+        return
+
+    if data is None:
+        AttachmentBlob.objects.filter(pk=blob_id).update(thumbnail_status='unsupported')
+        return
+
+    blob.thumbnail.save(f'{blob.sha256}.jpg', ContentFile(data), save=False)
+    AttachmentBlob.objects.filter(pk=blob_id).update(thumbnail=blob.thumbnail.name, thumbnail_status='ready')
+
+
+def render_image(source):
+    with Image.open(source) as image:
+        image.seek(0)  # first frame of animated GIF/WebP
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(thumbnail_size())
+        if image.mode not in ('RGB', 'L'):
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            image = image.convert('RGBA')
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=80, optimize=True)
+        return output.getvalue()
+
+
+def render_video_poster(path):
+    width, height = thumbnail_size()
+    with tempfile.TemporaryDirectory() as tmp:
+        target = os.path.join(tmp, 'poster.jpg')
+        subprocess.run(
+            [
+                'ffmpeg', '-loglevel', 'error', '-y', '-ss', '1', '-i', path, '-frames:v', '1',
+                '-vf', f'scale={width}:{height}:force_original_aspect_ratio=decrease', target,
+            ],
+            check=True, timeout=30,
+        )
+        if not os.path.exists(target):
+            # Clip shorter than the seek offset; take the very first frame
+            subprocess.run(
+                ['ffmpeg', '-loglevel', 'error', '-y', '-i', path, '-frames:v', '1',
+                 '-vf', f'scale={width}:{height}:force_original_aspect_ratio=decrease', target],
+                check=True, timeout=30,
+            )
+        with open(target, 'rb') as poster:
+            return poster.read()
@@ -1,9 +1,9 @@
 from django.urls import path
 from .views import (
     UserSearchView, FriendRequestListView, FriendRequestDetailView,
-    FriendListView, MessageListView, MessageDetailView, BlockUserView, ClearChatView, 
+    FriendListView, MessageListView, MessageDetailView, MessageReadView, BlockUserView, ClearChatView, 
     BlockedUsersListView, UpdateProfileSettingsView, RemoveFriendView, CurrentUserView,
-    MuteUserView, UnmuteUserView
+    MuteUserView, UnmuteUserView, EventStreamView
 )
 
 urlpatterns = [
@@ -12,6 +12,7 @@ urlpatterns = [
     path('friends/requests/<int:pk>/', FriendRequestDetailView.as_view(), name='friend-request-detail'),
     path('friends/', FriendListView.as_view(), name='friend-list'),
     path('messages/', MessageListView.as_view(), name='message-list'),
+    path('messages/read/', MessageReadView.as_view(), name='message-read'),
     path('messages/<int:pk>/', MessageDetailView.as_view(), name='message-detail'),
     path('users/<int:user_id>/block/', BlockUserView.as_view(), name='block-user'),
     path('users/<int:user_id>/clear-chat/', ClearChatView.as_view(), name='clear-chat'),
@@ -21,4 +22,5 @@ urlpatterns = [
     path('profile/settings/', UpdateProfileSettingsView.as_view(), name='profile-settings'),
     path('users/<int:user_id>/mute/', MuteUserView.as_view(), name='mute-user'),
     path('users/<int:user_id>/unmute/', UnmuteUserView.as_view(), name='unmute-user'),
+    path('events/', EventStreamView.as_view(), name='event-stream'),
 ]
@@ -0,0 +1,47 @@
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import ChangeVersion, FriendRequest, Friendship
+
+
+def bump_with_related(user_id):
+    """
+    Bumps a user whose own details changed, together with everyone who sees
+    them in a list: friends and the other side of pending friend requests.
+    """
+    pending = FriendRequest.objects.filter(
+        Q(from_user_id=user_id) | Q(to_user_id=user_id), status='pending'
+    ).values_list('from_user_id', 'to_user_id')
+    related = set(Friendship.friend_ids(user_id))
+    for from_user_id, to_user_id in pending:
+        related.update((from_user_id, to_user_id))
+    ChangeVersion.bump(user_id, *related)
+
+
+def version_etag(request, *args, **kwargs):
+    # Connecting and disconnecting bump friends (social.push.publish_presence),
+    # but going idle publishes nothing, so the ETag also rolls over every
+    # ETAG_PRESENCE_WINDOW seconds
+    window = int(time.time() // settings.ETAG_PRESENCE_WINDOW)
+    return f'"{ChangeVersion.current(request.user.id)}-{window}"'
+
+
+def conditional_on_version(view_func):
+    """
+    For GET handlers whose response depends only on what the requesting user's
+    change version covers: answers If-None-Match with 304 before the handler
+    runs, and lets the browser keep the response only with revalidation.
+    """
+    conditional = condition(etag_func=version_etag)(view_func)
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        response = conditional(request, *args, **kwargs)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return wrapper
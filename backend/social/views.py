@@ -1,26 +1,72 @@
 from rest_framework import generics, status, permissions, views
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import datetime
 from django_ratelimit.decorators import ratelimit
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import ensure_csrf_cookie
-from .models import FriendRequest, Message, SocialProfile, MutedUser
+from .models import (
+    FriendRequest, Message, MessageTombstone, SocialProfile, MutedUser, UnreadCounter, ReadWatermark,
+)
 from .serializers import UserSerializer, FriendRequestSerializer, MessageSerializer
+from .loaders import get_user_loader
+from .pagination import MessageCursorPagination
+from .purge import purge_conversation
+from .archive import ArchivedConversation
+from .push import get_broker, publish, publish_presence, format_event
+from .search import search_users, DEFAULT_LIMIT, MAX_LIMIT
+from .versions import conditional_on_version
+from .presence import tracker, is_recent
+from core.routers import ReplicaReadsMixin, replica_lag
+from users.cache import cached_payload
+import asyncio
 
 User = get_user_model()
 
+# Relations every serialized message touches; joined up front so a page of
+# messages does not lazy-load its senders one row at a time.
+MESSAGE_RELATED = (
+    'sender__social_profile',
+    'receiver__social_profile',
+    'reply_to__sender__social_profile',
+)
+
+# Delta sync re-sends changes from slightly before the client's watermark, so a
+# message saved just before the watermark but committed after it is not lost.
+# Clients merge by id, so the overlap is harmless.
+SYNC_OVERLAP = datetime.timedelta(seconds=2)
+
+def conversation_filter(user, other_user_id=None, sender='sender', receiver='receiver'):
+    if other_user_id:
+        return (
+            Q(**{sender: user, f'{receiver}_id': other_user_id}) |
+            Q(**{f'{sender}_id': other_user_id, receiver: user})
+        )
+    return Q(**{sender: user}) | Q(**{receiver: user})
+
 @method_decorator(ratelimit(key='user', rate='30/m', method='GET'), name='dispatch')
-class UserSearchView(generics.ListAPIView):
+class UserSearchView(ReplicaReadsMixin, generics.ListAPIView):
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         query = self.request.query_params.get('q', '')
-        if len(query) < 3:
-            return User.objects.none()
-        return User.objects.filter(username__icontains=query).exclude(id=self.request.user.id)
+        try:
+            limit = min(int(self.request.query_params.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+        except ValueError:
+            limit = DEFAULT_LIMIT
+        return search_users(query, self.request.user, limit=max(limit, 1))
 
+@method_decorator(conditional_on_version, name='get')
 @method_decorator(ratelimit(key='user', rate='10/m', method='POST'), name='dispatch')
 class FriendRequestListView(generics.ListCreateAPIView):
     serializer_class = FriendRequestSerializer
@@ -29,7 +75,7 @@ class FriendRequestListView(generics.ListCreateAPIView):
     def get_queryset(self):
         return FriendRequest.objects.filter(
             Q(from_user=self.request.user) | Q(to_user=self.request.user)
-        ).order_by('-created_at')
+        ).select_related('from_user__social_profile', 'to_user__social_profile').order_by('-created_at')
 
     def create(self, request, *args, **kwargs):
         to_user_id = request.data.get('to_user_id')
@@ -70,51 +116,129 @@ class FriendRequestDetailView(generics.RetrieveUpdateDestroyAPIView):
             traceback.print_exc()
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class FriendListView(generics.ListAPIView):
+@method_decorator(conditional_on_version, name='get')
+class FriendListView(ReplicaReadsMixin, generics.ListAPIView):
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        user = self.request.user
-        # Get all accepted friend requests involving the user
-        friend_requests = FriendRequest.objects.filter(
-            (Q(from_user=user) | Q(to_user=user)) & Q(status='accepted')
-        )
-        
-        friend_ids = set()
-        for req in friend_requests:
-            if req.from_user == user:
-                friend_ids.add(req.to_user.id)
-            else:
-                friend_ids.add(req.from_user.id)
-                
-        return User.objects.filter(id__in=friend_ids)
+        # One indexed join over the materialized friendship table
+        return User.objects.filter(friend_of__user=self.request.user).select_related('social_profile')
 
 @method_decorator(ratelimit(key='user', rate='60/m', method='POST'), name='dispatch')
-class MessageListView(generics.ListCreateAPIView):
+class MessageListView(ReplicaReadsMixin, generics.ListCreateAPIView):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MessageCursorPagination
 
     def get_queryset(self):
         user = self.request.user
         other_user_id = self.request.query_params.get('user_id')
-        
-        if other_user_id:
-            # Mark messages as read when fetching conversation
-            Message.objects.filter(sender_id=other_user_id, receiver=user, is_read=False).update(is_read=True)
-            
-            return Message.objects.filter(
-                Q(sender=user, receiver_id=other_user_id) |
-                Q(sender_id=other_user_id, receiver=user)
-            ).order_by('timestamp')
-        
+        # Fetching never marks anything read; clients acknowledge through MessageReadView
         return Message.objects.filter(
-            Q(sender=user) | Q(receiver=user)
-        ).order_by('timestamp')
+            conversation_filter(user, other_user_id)
+        ).select_related(*MESSAGE_RELATED).prefetch_related('attachments__blob').order_by('timestamp')
+
+    def get_archive(self):
+        other_user_id = self.request.query_params.get('user_id')
+        if not other_user_id or not other_user_id.isdigit():
+            return None
+        return ArchivedConversation(self.request.user.id, other_user_id)
+
+    def list(self, request, *args, **kwargs):
+        if 'since' in request.query_params:
+            return self.sync(request)
+        return super().list(request, *args, **kwargs)
+
+    def sync(self, request):
+        """
+        Delta mode: ?since=<watermark> returns only messages created after the
+        watermark, ids deleted since then, how far each side has read, and a
+        new watermark. An empty since starts with the newest page of the
+        conversation (see MessageCursorPagination) and has_more; older pages
+        are fetched with before_id.
+        """
+        since_param = request.query_params.get('since')
+        since = None
+        if since_param:
+            since = parse_datetime(since_param)
+            if since is None:
+                return Response({"error": "Invalid since watermark"}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since, datetime.timezone.utc)
+
+        watermark = timezone.now()
+        queryset = self.get_queryset()
+        other_user_id = request.query_params.get('user_id')
+
+        deleted_ids = []
+        cleared = False
+        has_more = None
+        if since is None:
+            messages = self.paginator.get_page(queryset, request, self)
+            has_more = self.paginator.has_more
+        else:
+            # A replica may not have the newest changes yet; re-send those too
+            since -= SYNC_OVERLAP + replica_lag()
+            messages = queryset.filter(timestamp__gt=since)
+
+            tombstones = MessageTombstone.objects.filter(
+                conversation_filter(request.user, other_user_id),
+                deleted_at__gt=since,
+            ).values_list('message_id', flat=True)
+            for message_id in tombstones:
+                if message_id is None:
+                    cleared = True
+                else:
+                    deleted_ids.append(message_id)
+
+        serializer = self.get_serializer(messages, many=True)
+        data = {
+            "messages": serializer.data,
+            "deleted_ids": deleted_ids,
+            "cleared": cleared,
+            # UTC with a "Z" suffix so the value survives unencoded query strings
+            "watermark": watermark.isoformat().replace('+00:00', 'Z'),
+        }
+        if has_more is not None:
+            data["has_more"] = has_more
+        if other_user_id and other_user_id.isdigit():
+            # Read receipts travel as the two read watermarks, not as re-sent messages
+            loader = get_user_loader(serializer.context)
+            data["read_up_to"] = loader.read_up_to(int(other_user_id), request.user.id)
+            data["last_read_id"] = loader.read_up_to(request.user.id, int(other_user_id))
+        return Response(data)
 
     def perform_create(self, serializer):
         serializer.save(sender=self.request.user)
 
+@method_decorator(ratelimit(key='user', rate='60/m', method='POST'), name='dispatch')
+class MessageReadView(views.APIView):
+    """
+    Acknowledges a conversation up to message_id: one watermark row moves
+    forward instead of every unread message being updated.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        try:
+            other_user_id = int(request.data.get('user_id'))
+            message_id = int(request.data.get('message_id'))
+        except (TypeError, ValueError):
+            return Response({"error": "user_id and message_id must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        with transaction.atomic():
+            # Only messages that have arrived can be read; a larger id would mark future ones read
+            newest = Message.objects.filter(
+                receiver=user, sender_id=other_user_id, id__lte=message_id
+            ).order_by('-id').values_list('id', flat=True).first()
+            if not newest or not ReadWatermark.advance(user.id, other_user_id, newest):
+                return Response({"status": "read", "last_read_id": ReadWatermark.read_up_to(user.id, other_user_id)})
+            UnreadCounter.recount(user.id, other_user_id, newest)
+            publish([other_user_id], 'messages_read', {"reader_id": user.id, "last_read_id": newest})
+        return Response({"status": "read", "last_read_id": newest})
+
 class MessageDetailView(generics.RetrieveDestroyAPIView):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -128,9 +252,62 @@ class MessageDetailView(generics.RetrieveDestroyAPIView):
         if instance.sender != self.request.user:
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied("You can only delete your own messages.")
+        MessageTombstone.objects.create(
+            sender=instance.sender, receiver=instance.receiver, message_id=instance.id
+        )
+        if instance.id > ReadWatermark.read_up_to(instance.receiver_id, instance.sender_id):
+            UnreadCounter.decrement(instance.receiver_id, instance.sender_id)
         instance.delete()
 
 
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only error payloads go through here; the stream itself is written directly
+        return format_event({"type": "error", **(data or {})}).encode()
+
+class EventStreamView(views.APIView):
+    """
+    Server-Sent Events push channel: new messages, deletions, read receipts,
+    friend request changes and friends' presence for the current user.
+    Needs an ASGI server; under WSGI the stream would block a worker forever.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+
+    def get(self, request):
+        if not isinstance(request._request, ASGIRequest):
+            return Response({"error": "Event stream requires an ASGI server"}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        response = StreamingHttpResponse(self.stream(request.user.id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, user_id):
+        keepalive = getattr(settings, 'PUSH_KEEPALIVE', 15)
+        broker = get_broker()
+        came_online = not broker.has_subscribers(user_id)
+        try:
+            async with broker.subscribe(user_id) as subscription:
+                if came_online:
+                    await sync_to_async(publish_presence)(user_id, True)
+                yield 'retry: 3000\n\n'
+                while True:
+                    try:
+                        event = await asyncio.wait_for(subscription.get(), timeout=keepalive)
+                    except asyncio.TimeoutError:
+                        yield ': keepalive\n\n'
+                        continue
+                    yield format_event(event)
+        finally:
+            # Last stream for this user closed
+            if not broker.has_subscribers(user_id):
+                await sync_to_async(publish_presence)(user_id, False)
+
+
 class BlockUserView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -160,29 +337,40 @@ class BlockedUsersListView(generics.ListAPIView):
     
     def get(self, request):
         from .models import BlockedUser
-        blocked = BlockedUser.objects.filter(blocker=request.user).select_related('blocked')
-        data = [{"id": b.id, "blocked": UserSerializer(b.blocked).data} for b in blocked]
+        blocked = list(BlockedUser.objects.filter(blocker=request.user).select_related('blocked__social_profile'))
+        users = UserSerializer([b.blocked for b in blocked], many=True, context={'request': request}).data
+        data = [{"id": b.id, "blocked": user} for b, user in zip(blocked, users)]
         return Response(data)
 
 class ClearChatView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def delete(self, request, user_id):
-        # Delete messages where (sender=me AND receiver=them) OR (sender=them AND receiver=me)
-        Message.objects.filter(
-            (Q(sender=request.user) & Q(receiver_id=user_id)) |
-            (Q(sender_id=user_id) & Q(receiver=request.user))
-        ).delete()
+        with transaction.atomic():
+            deleted_count = purge_conversation(request.user.id, user_id)
+            if deleted_count:
+                MessageTombstone.objects.create(sender=request.user, receiver_id=user_id)
+                UnreadCounter.clear_conversation(request.user.id, user_id)
         return Response({"status": "cleared"})
 
+@method_decorator(conditional_on_version, name='get')
 class CurrentUserView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        from .serializers import UserSerializer
-        serializer = UserSerializer(request.user, context={'request': request})
-        return Response(serializer.data)
+        # Misses read the primary (no replica_reads), so a lagging replica never gets cached
+        data = cached_payload(
+            request.user, 'current', lambda: UserSerializer(request.user, context={'request': request}).data
+        )
+        # Presence moves with every request, so it is layered over the cached payload
+        last_activity = tracker.last_seen(request.user.id) or data['last_activity']
+        return Response({
+            **data,
+            'last_activity': last_activity,
+            'is_online': not data['is_online_hidden'] and is_recent(last_activity),
+        })
 
+@method_decorator(conditional_on_version, name='get')
 class UpdateProfileSettingsView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -231,10 +419,6 @@ class RemoveFriendView(views.APIView):
     
     def delete(self, request, user_id):
         try:
-            from django.db import transaction
-            import os
-            from django.conf import settings
-            
             with transaction.atomic():
                 # Delete friend requests between users
                 deleted_count = FriendRequest.objects.filter(
@@ -243,26 +427,10 @@ class RemoveFriendView(views.APIView):
                 ).delete()[0]
                 
                 if deleted_count > 0:
-                    # Get all messages between users
-                    messages = Message.objects.filter(
-                        Q(sender=request.user, receiver_id=user_id) |
-                        Q(sender_id=user_id, receiver=request.user)
-                    )
-                    
-                    # Delete all attachments and their files
-                    for message in messages:
-                        attachments = message.attachments.all()
-                        for attachment in attachments:
-                            # Delete physical file
-                            if attachment.file and os.path.isfile(attachment.file.path):
-                                try:
-                                    os.remove(attachment.file.path)
-                                except Exception:
-                                    pass  # Continue even if file deletion fails
-                            attachment.delete()
-                    
-                    # Delete all messages
-                    messages.delete()
+                    # Delete all messages and attachments; files are removed after commit
+                    purge_conversation(request.user.id, user_id)
+                    MessageTombstone.objects.create(sender=request.user, receiver_id=user_id)
+                    UnreadCounter.clear_conversation(request.user.id, user_id)
                     
                     return Response({"status": "removed", "messages_deleted": True})
                 else:
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CACHE_KEY = 'self_payload:{}:{}'
+# /api/auth/user/ (CustomUserDetailsSerializer) and /api/social/me/ (UserSerializer)
+PAYLOAD_KINDS = ('details', 'current')
+
+
+def cached_payload(user, kind, build):
+    """Returns a user's serialized payload about themselves, calling build() only on a miss."""
+    key = CACHE_KEY.format(kind, user.pk)
+    payload = cache.get(key)
+    if payload is None:
+        payload = dict(build())
+        cache.set(key, payload, timeout=settings.SELF_PAYLOAD_CACHE_TTL)
+    return payload
+
+
+def invalidate(user_id):
+    keys = [CACHE_KEY.format(kind, user_id) for kind in PAYLOAD_KINDS]
+    cache.delete_many(keys)
+    # A request reading the old rows before commit may have cached them again
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,21 @@
+from allauth.socialaccount.models import SocialAccount
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from social.models import SocialProfile
+from .cache import invalidate
+
+User = get_user_model()
+
+@receiver(post_save, sender=User)
+def invalidate_user_payload(sender, instance, **kwargs):
+    invalidate(instance.pk)
+
+@receiver(post_save, sender=SocialProfile)
+def invalidate_profile_payload(sender, instance, **kwargs):
+    invalidate(instance.user_id)
+
+@receiver([post_save, post_delete], sender=SocialAccount)
+def invalidate_account_payload(sender, instance, **kwargs):
+    invalidate(instance.user_id)
@@ -1,3 +1,49 @@
+from allauth.socialaccount.models import SocialAccount, SocialApp
+from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from social.models import SocialProfile
+
+User = get_user_model()
+
+class SelfPayloadCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password123', email='user1@example.com')
+        self.client.force_authenticate(user=self.user)
+
+    def test_details_are_served_from_cache_until_a_save(self):
+        self.assertEqual(self.client.get('/api/auth/user/').data['social_accounts'], [])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/auth/user/').data['username'], 'user1')
+        self.assertFalse([q for q in queries if 'socialaccount' in q['sql']])
+
+        SocialApp.objects.create(provider='discord', name='Discord', client_id='id').sites.add(Site.objects.get_current())
+        SocialAccount.objects.create(user=self.user, provider='discord', uid='123')
+        self.assertEqual(self.client.get('/api/auth/user/').data['social_accounts'], ['discord'])
+
+        self.client.patch('/api/auth/user/', {'is_online_hidden': True})
+        self.assertTrue(self.client.get('/api/auth/user/').data['is_online_hidden'])
+
+    def test_current_user_sees_profile_changes_and_live_presence(self):
+        first = self.client.get('/api/social/me/').data
+        self.assertTrue(first['is_online'])
+
+        self.client.post('/api/social/profile/settings/', {'bio': '<b>Hi</b>'})
+        # Real requests load the user afresh; the forced one keeps its old profile
+        self.client.force_authenticate(user=User.objects.get(pk=self.user.pk))
+        response = self.client.get('/api/social/me/').data
+        self.assertEqual(response['bio'], 'Hi')
+        self.assertGreaterEqual(response['last_activity'], first['last_activity'])
+
+        profile = SocialProfile.objects.get(user=self.user)
+        profile.is_online_hidden = True
+        profile.save()
+        self.client.force_authenticate(user=User.objects.get(pk=self.user.pk))
+        self.assertFalse(self.client.get('/api/social/me/').data['is_online'])
@@ -1,3 +1,11 @@
-from django.shortcuts import render
+from dj_rest_auth.views import UserDetailsView
+from rest_framework.response import Response
 
-# Create your views here.
+from .cache import cached_payload
+
+
+class CachedUserDetailsView(UserDetailsView):
+    """dj-rest-auth's /api/auth/user/, served from the per-user payload cache on GET."""
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(cached_payload(request.user, 'details', lambda: self.get_serializer(request.user).data))
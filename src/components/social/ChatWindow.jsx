@@ -4,6 +4,7 @@ import { motion, AnimatePresence } from 'framer-motion';
 import { useAuth } from '../../context/AuthContext';
 import { useToast } from '../../context/ToastContext';
 import { socialApi } from '../../services/socialApi';
+import { useSocialEvents } from '../../hooks/useSocialEvents';
 import ForwardModal from './ForwardModal';
 import ProfileModal from './ProfileModal';
 
@@ -11,6 +12,7 @@ const ChatWindow = ({ friend, onClose, totalUnreadCount = 0 }) => {
     const { user } = useAuth();
     const { addToast } = useToast();
     const [messages, setMessages] = useState([]);
+    const [hasOlder, setHasOlder] = useState(false);
     const [newMessage, setNewMessage] = useState('');
     const [showMenu, setShowMenu] = useState(false);
     const [files, setFiles] = useState([]);
@@ -35,14 +37,34 @@ const ChatWindow = ({ friend, onClose, totalUnreadCount = 0 }) => {
     const chatContainerRef = useRef(null);
     const textareaRef = useRef(null);
     const searchInputRef = useRef(null);
+    const watermarkRef = useRef('');
+    const readUpToRef = useRef(0);
+    const lastReadRef = useRef(0);
+
+    const streamConnected = useSocialEvents((event) => {
+        const chatEvents = ['message', 'message_deleted', 'messages_read'];
+        const involved = [event.sender_id, event.receiver_id, event.reader_id];
+        if (chatEvents.includes(event.type) && involved.includes(friend.id)) {
+            loadMessages();
+        }
+    });
 
     useEffect(() => {
+        watermarkRef.current = '';
+        readUpToRef.current = 0;
+        lastReadRef.current = 0;
+        setMessages([]);
+        setHasOlder(false);
         loadMessages();
         checkBlockStatus();
-        const interval = setInterval(loadMessages, 3000);
-        return () => clearInterval(interval);
     }, [friend.id]);
 
+    useEffect(() => {
+        // Fallback polling; pushed events trigger syncs while the stream is up
+        const interval = setInterval(loadMessages, streamConnected ? 30000 : 3000);
+        return () => clearInterval(interval);
+    }, [friend.id, streamConnected]);
+
     useEffect(() => {
         if (isUserAtBottom) {
             scrollToBottom();
@@ -65,19 +87,70 @@ const ChatWindow = ({ friend, onClose, totalUnreadCount = 0 }) => {
 
     const loadMessages = async () => {
         try {
-            const response = await socialApi.getMessages(friend.id);
+            const response = await socialApi.syncMessages(friend.id, watermarkRef.current);
+            const {
+                messages: changed, deleted_ids: deletedIds, cleared, watermark,
+                read_up_to: readUpTo, last_read_id: lastReadId, has_more: hasMore,
+            } = response.data;
+            watermarkRef.current = watermark;
+            // Only a full sync says whether older history lies behind its page
+            if (hasMore !== undefined) setHasOlder(hasMore);
+            acknowledge(changed, lastReadId);
+            const receiptsMoved = readUpTo !== readUpToRef.current;
+            readUpToRef.current = readUpTo;
+            if (changed.length === 0 && deletedIds.length === 0 && !cleared && !receiptsMoved) return;
+
             setMessages(prev => {
-                if (response.data.length !== prev.length ||
-                    (response.data.length > 0 && prev.length > 0 && response.data[response.data.length - 1].id !== prev[prev.length - 1].id)) {
-                    return response.data;
+                const deleted = new Set(deletedIds);
+                const byId = new Map();
+                if (!cleared) {
+                    prev.forEach(m => {
+                        if (!deleted.has(m.id)) byId.set(m.id, m);
+                    });
                 }
-                return prev;
+                changed.forEach(m => byId.set(m.id, m));
+                // Read receipts for our messages come as the friend's read watermark
+                return Array.from(byId.values()).map(m =>
+                    m.sender.id === friend.id ? m : { ...m, is_read: m.id <= readUpTo }
+                ).sort((a, b) =>
+                    new Date(a.timestamp) - new Date(b.timestamp) || a.id - b.id
+                );
             });
         } catch (error) {
             console.error("Error loading messages:", error);
         }
     };
 
+    // Loading messages does not mark them read; acknowledge the newest one from the friend
+    const acknowledge = (changed, lastReadId) => {
+        lastReadRef.current = Math.max(lastReadRef.current, lastReadId);
+        const newest = changed.reduce(
+            (max, m) => (m.sender.id === friend.id && m.id > max ? m.id : max), lastReadRef.current
+        );
+        if (newest > lastReadRef.current) {
+            lastReadRef.current = newest;
+            socialApi.markMessagesRead(friend.id, newest).catch(error =>
+                console.error("Error marking messages read:", error)
+            );
+        }
+    };
+
+    // Archived history is not part of the sync; page back through it on demand
+    const loadOlder = async () => {
+        if (messages.length === 0) return;
+        try {
+            const response = await socialApi.getMessagePage(friend.id, { limit: 50, before_id: messages[0].id });
+            const { results, has_more: hasMore } = response.data;
+            setHasOlder(hasMore);
+            setMessages(prev => {
+                const known = new Set(prev.map(m => m.id));
+                return [...results.filter(m => !known.has(m.id)), ...prev];
+            });
+        } catch (error) {
+            console.error("Error loading older messages:", error);
+        }
+    };
+
     const checkBlockStatus = async () => {
         try {
             const response = await socialApi.getBlockedUsers();
@@ -240,7 +313,7 @@ const ChatWindow = ({ friend, onClose, totalUnreadCount = 0 }) => {
                 const filePromises = messageToForward.attachments.map(async (att) => {
                     const response = await fetch(att.file);
                     const blob = await response.blob();
-                    const filename = att.file.split('/').pop() || 'attachment';
+                    const filename = att.name || att.file.split('/').pop() || 'attachment';
                     return new File([blob], filename, { type: blob.type });
                 });
                 filesToForward = await Promise.all(filePromises);
@@ -534,6 +607,16 @@ const ChatWindow = ({ friend, onClose, totalUnreadCount = 0 }) => {
                 onScroll={handleScroll}
                 className="flex-1 overflow-y-auto p-2 sm:p-4 space-y-1 custom-scrollbar bg-white dark:bg-neutral-900 scroll-smooth"
             >
+                {hasOlder && messages.length > 0 && (
+                    <div className="flex justify-center py-2">
+                        <button
+                            onClick={loadOlder}
+                            className="text-xs text-neutral-500 hover:text-neutral-700 dark:hover:text-neutral-300"
+                        >
+                            Показать более ранние сообщения
+                        </button>
+                    </div>
+                )}
                 {messages.map((msg, index) => {
                     const isMe = msg.sender.username === user.username;
                     const isNextSame = messages[index + 1]?.sender.username === msg.sender.username;
@@ -632,7 +715,8 @@ const ChatWindow = ({ friend, onClose, totalUnreadCount = 0 }) => {
                                                         <div key={att.id} className="rounded-md overflow-hidden">
                                                             {isImage ? (
                                                                 <img
-                                                                    src={att.file}
+                                                                    src={att.thumbnail || att.file}
+                                                                    loading="lazy"
                                                                     alt="attachment"
                                                                     className="max-w-full h-auto max-h-80 object-cover cursor-pointer rounded-md"
                                                                     onClick={() => window.open(att.file, '_blank')}
@@ -645,7 +729,7 @@ const ChatWindow = ({ friend, onClose, totalUnreadCount = 0 }) => {
                                                                     className="flex items-center gap-2 p-2 bg-white/10 rounded-md hover:bg-white/20 transition-colors"
                                                                 >
                                                                     <FileText size={18} className="text-purple-500" />
-                                                                    <span className="text-xs truncate max-w-[150px]">{att.file.split('/').pop()}</span>
+                                                                    <span className="text-xs truncate max-w-[150px]">{att.name || att.file.split('/').pop()}</span>
                                                                 </a>
                                                             )}
                                                         </div>
@@ -9,6 +9,7 @@ import {
 import { useAuth } from '../../context/AuthContext';
 import { useToast } from '../../context/ToastContext';
 import { socialApi } from '../../services/socialApi';
+import { useSocialEvents } from '../../hooks/useSocialEvents';
 import ProfileModal from './ProfileModal';
 import PrivacyModal from './PrivacyModal';
 
@@ -38,12 +39,26 @@ const FriendsList = ({ onSelectFriend, onFriendsUpdate }) => {
     const [longPressTimer, setLongPressTimer] = useState(null);
     const contextMenuRef = useRef(null);
 
+    const streamConnected = useSocialEvents((event) => {
+        if (event.type === 'presence') {
+            applyFriends(friends.map(friend => (
+                friend.id === event.user_id ? { ...friend, is_online: event.is_online } : friend
+            )));
+        } else if (event.type === 'friend_request') {
+            loadFriendships();
+        }
+    });
+
     useEffect(() => {
         loadData();
-        const interval = setInterval(loadData, 5000);
-        return () => clearInterval(interval);
     }, []);
 
+    useEffect(() => {
+        // Fallback polling; pushed events keep friends and requests current while the stream is up
+        const interval = setInterval(loadData, streamConnected ? 30000 : 5000);
+        return () => clearInterval(interval);
+    }, [streamConnected]);
+
     useEffect(() => {
         const timer = setTimeout(() => {
             if (searchQuery.length >= 3 && activeTab === 'search') {
@@ -62,11 +77,8 @@ const FriendsList = ({ onSelectFriend, onFriendsUpdate }) => {
                 socialApi.getProfileSettings(),
                 socialApi.getCurrentUser()
             ]);
-            setFriends(friendsData.data);
+            applyFriends(friendsData.data);
             setCurrentUserData(currentUser.data);
-            if (onFriendsUpdate) {
-                onFriendsUpdate(friendsData.data);
-            }
 
             if (settingsData.data) {
                 setSettings(prev => ({
@@ -75,12 +87,7 @@ const FriendsList = ({ onSelectFriend, onFriendsUpdate }) => {
                     allowFriendRequests: settingsData.data.allow_friend_requests
                 }));
             }
-
-            const received = requestsData.data.filter(req => req.to_user.id === user.id && req.status === 'pending');
-            const sent = requestsData.data.filter(req => req.from_user.id === user.id && req.status === 'pending');
-
-            setRequests(received);
-            setSentRequests(sent);
+            applyRequests(requestsData.data);
         } catch (error) {
             console.error("Error loading social data:", error);
             addToast("Не удалось загрузить данные", "error");
@@ -89,6 +96,32 @@ const FriendsList = ({ onSelectFriend, onFriendsUpdate }) => {
         }
     };
 
+    // Friend request events only touch the friends and requests lists
+    const loadFriendships = async () => {
+        try {
+            const [friendsData, requestsData] = await Promise.all([
+                socialApi.getFriends(),
+                socialApi.getFriendRequests()
+            ]);
+            applyFriends(friendsData.data);
+            applyRequests(requestsData.data);
+        } catch (error) {
+            console.error("Error loading friends:", error);
+        }
+    };
+
+    const applyFriends = (list) => {
+        setFriends(list);
+        if (onFriendsUpdate) {
+            onFriendsUpdate(list);
+        }
+    };
+
+    const applyRequests = (list) => {
+        setRequests(list.filter(req => req.to_user.id === user.id && req.status === 'pending'));
+        setSentRequests(list.filter(req => req.from_user.id === user.id && req.status === 'pending'));
+    };
+
     const handleSearch = async () => {
         if (searchQuery.length < 3) return;
         try {
@@ -0,0 +1,73 @@
+import { useEffect, useRef, useState } from 'react';
+
+const EVENTS_URL = 'http://localhost:8000/api/social/events/';
+const EVENT_TYPES = ['message', 'message_deleted', 'messages_read', 'friend_request', 'presence'];
+
+// One stream per page, shared by every subscribed component; it opens with the
+// first subscriber and closes with the last.
+const listeners = new Set();
+const connectionListeners = new Set();
+let source = null;
+let streamConnected = false;
+
+function setStreamConnected(value) {
+    streamConnected = value;
+    connectionListeners.forEach(listener => listener(value));
+}
+
+function dispatch(e) {
+    let event;
+    try {
+        event = JSON.parse(e.data);
+    } catch (error) {
+        console.error("Error parsing social event:", error);
+        return;
+    }
+    listeners.forEach(listener => {
+        try {
+            listener(event);
+        } catch (error) {
+            console.error("Error handling social event:", error);
+        }
+    });
+}
+
+function subscribe(listener, onConnectionChange) {
+    listeners.add(listener);
+    connectionListeners.add(onConnectionChange);
+    if (!source) {
+        source = new EventSource(EVENTS_URL, { withCredentials: true });
+        source.onopen = () => setStreamConnected(true);
+        source.onerror = () => setStreamConnected(false);
+        EVENT_TYPES.forEach(type => source.addEventListener(type, dispatch));
+    }
+    onConnectionChange(streamConnected);
+
+    return () => {
+        listeners.delete(listener);
+        connectionListeners.delete(onConnectionChange);
+        if (listeners.size === 0) {
+            source.close();
+            source = null;
+            streamConnected = false;
+        }
+    };
+}
+
+// Subscribes to the server push channel. Returns whether the stream is connected,
+// so callers can slow their fallback polling down while it is.
+export function useSocialEvents(onEvent) {
+    const handlerRef = useRef(onEvent);
+    const [connected, setConnected] = useState(false);
+
+    useEffect(() => {
+        handlerRef.current = onEvent;
+    }, [onEvent]);
+
+    useEffect(() => {
+        if (typeof EventSource === 'undefined') return;
+        return subscribe((event) => handlerRef.current?.(event), setConnected);
+    }, []);
+
+    return connected;
+}
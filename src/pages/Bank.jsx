@@ -8,6 +8,7 @@ const Bank = () => {
     const { user, socialLogin } = useAuth();
     const [balance, setBalance] = useState(0);
     const [transactions, setTransactions] = useState([]);
+    const [hasMoreHistory, setHasMoreHistory] = useState(false);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
     const [transferData, setTransferData] = useState({ to_username: '', amount: '' });
@@ -22,10 +23,11 @@ const Bank = () => {
             setLoading(true);
             const [balanceRes, historyRes] = await Promise.all([
                 axios.get('http://localhost:8000/api/bank/balance/'),
-                axios.get('http://localhost:8000/api/bank/transactions/')
+                axios.get('http://localhost:8000/api/bank/transactions/', { params: { limit: 50 } })
             ]);
             setBalance(balanceRes.data.balance);
-            setTransactions(historyRes.data);
+            setTransactions(historyRes.data.results);
+            setHasMoreHistory(historyRes.data.has_more);
             setError(null);
         } catch (err) {
             console.error("Bank fetch error:", err);
@@ -35,6 +37,19 @@ const Bank = () => {
         }
     };
 
+    const loadMoreHistory = async () => {
+        if (transactions.length === 0) return;
+        try {
+            const response = await axios.get('http://localhost:8000/api/bank/transactions/', {
+                params: { limit: 50, before_id: transactions[transactions.length - 1].id }
+            });
+            setTransactions(prev => [...prev, ...response.data.results]);
+            setHasMoreHistory(response.data.has_more);
+        } catch (err) {
+            console.error("Bank history fetch error:", err);
+        }
+    };
+
     useEffect(() => {
         if (user && hasDiscord) {
             fetchBankData();
@@ -263,6 +278,7 @@ const Bank = () => {
                                                     <th className="px-6 py-5 text-left text-xs font-bold text-neutral-600 dark:text-neutral-400 uppercase tracking-wider">Тип</th>
                                                     <th className="px-6 py-5 text-left text-xs font-bold text-neutral-600 dark:text-neutral-400 uppercase tracking-wider">Описание</th>
                                                     <th className="px-6 py-5 text-right text-xs font-bold text-neutral-600 dark:text-neutral-400 uppercase tracking-wider">Сумма</th>
+                                                    <th className="px-6 py-5 text-right text-xs font-bold text-neutral-600 dark:text-neutral-400 uppercase tracking-wider">Баланс</th>
                                                     <th className="px-6 py-5 text-right text-xs font-bold text-neutral-600 dark:text-neutral-400 uppercase tracking-wider">Дата</th>
                                                 </tr>
                                             </thead>
@@ -288,6 +304,9 @@ const Bank = () => {
                                                                 }`}>
                                                                 {tx.amount > 0 ? '+' : ''}{tx.amount} HZN
                                                             </td>
+                                                            <td className="px-6 py-5 whitespace-nowrap text-sm text-neutral-500 dark:text-neutral-400 text-right font-medium">
+                                                                {tx.balance_after} HZN
+                                                            </td>
                                                             <td className="px-6 py-5 whitespace-nowrap text-sm text-neutral-500 dark:text-neutral-400 text-right font-medium">
                                                                 {new Date(tx.created_at).toLocaleDateString('ru-RU')}
                                                             </td>
@@ -295,7 +314,7 @@ const Bank = () => {
                                                     ))
                                                 ) : (
                                                     <tr>
-                                                        <td colSpan="4" className="px-6 py-16 text-center">
+                                                        <td colSpan="5" className="px-6 py-16 text-center">
                                                             <div className="flex flex-col items-center gap-3">
                                                                 <div className="p-4 bg-neutral-100 dark:bg-neutral-800 rounded-full">
                                                                     <History className="w-8 h-8 text-neutral-400" />
@@ -309,6 +328,16 @@ const Bank = () => {
                                             </tbody>
                                         </table>
                                     </div>
+                                    {hasMoreHistory && (
+                                        <div className="p-4 flex justify-center border-t border-neutral-200 dark:border-neutral-700/50">
+                                            <button
+                                                onClick={loadMoreHistory}
+                                                className="px-4 py-2 text-sm font-medium text-neutral-600 dark:text-neutral-300 hover:bg-neutral-100 dark:hover:bg-neutral-800 rounded-xl transition-colors"
+                                            >
+                                                Показать ещё
+                                            </button>
+                                        </div>
+                                    )}
                                 </div>
                             )}
                         </div>
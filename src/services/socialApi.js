@@ -54,6 +54,18 @@ export const socialApi = {
 
     getMessages: (userId) => api.get(`/messages/?user_id=${userId}`),
 
+    // Cursor pagination: { limit, before_id } or { limit, after_id }
+    getMessagePage: (userId, params = {}) =>
+        api.get('/messages/', { params: { user_id: userId, ...params } }),
+
+    // Delta sync: only changes after `since` (empty = newest page and has_more) plus a new watermark
+    syncMessages: (userId, since = '') =>
+        api.get('/messages/', { params: { user_id: userId, since } }),
+
+    // Marks everything from userId up to messageId as read
+    markMessagesRead: (userId, messageId) =>
+        api.post('/messages/read/', { user_id: userId, message_id: messageId }),
+
     sendMessage: (receiverId, content, files = [], replyToId = null, forwardedFromId = null) => {
         const formData = new FormData();
         formData.append('receiver_id', receiverId);